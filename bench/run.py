@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+
+'''
+Throughput benchmarks of the pysemcor pipeline stages on synthetic corpora
+Latest version can be found at https://github.com/letuananh/pysemcor
+
+References:
+    Python documentation:
+        https://docs.python.org/
+    PEP 0008 - Style Guide for Python Code
+        https://www.python.org/dev/peps/pep-0008/
+    PEP 257 - Python Docstring Conventions:
+        https://www.python.org/dev/peps/pep-0257/
+
+@author: Le Tuan Anh <tuananh.ke@gmail.com>
+'''
+
+# Copyright (c) 2017, Le Tuan Anh <tuananh.ke@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+__author__ = "Le Tuan Anh"
+__email__ = "<tuananh.ke@gmail.com>"
+__copyright__ = "Copyright 2017, pysemcor"
+__license__ = "MIT"
+__maintainer__ = "Le Tuan Anh"
+__version__ = "0.1"
+__status__ = "Prototype"
+__credits__ = []
+
+########################################################################
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import subprocess
+import multiprocessing
+from contextlib import redirect_stdout
+
+from bench.synth import generate
+
+# -------------------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------------------
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS_DIR = os.path.join(BENCH_DIR, 'corpus')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+STAGES = ('fix', 'iterparse', 'iterparse_raw', 'fix_token_text', 'detokenize', 'to_ttl', 'xml_to_ttl', 'xml_to_ttl_fused')
+
+
+# -------------------------------------------------------------------------------
+# Stages
+# -------------------------------------------------------------------------------
+# each stage returns (sentences, tokens, seconds, extra info) for the files of a corpus
+
+def _sentences(sc):
+    for f in sc.files:
+        yield from sc.iterparse(f)
+
+
+def stage_fix(raw_root, fixed_root):
+    from pysemcor.semcorxml import SemcorXML, fix_malformed_xml_file
+    sc = SemcorXML(raw_root)
+    shutil.rmtree(fixed_root, ignore_errors=True)
+    started = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        for f in sc.files:
+            outpath = os.path.join(fixed_root, f)
+            os.makedirs(os.path.dirname(outpath), exist_ok=True)
+            fix_malformed_xml_file(sc.files.abspath(f), outpath)
+    seconds = time.perf_counter() - started
+    return None, None, seconds, {'bytes': sum(os.path.getsize(p) for p in sc.files.abspaths())}
+
+
+def _stage_iterparse(sc):
+    sents = tokens = 0
+    started = time.perf_counter()
+    for sent in _sentences(sc):
+        sents += 1
+        tokens += len(sent['tokens'])
+    return sents, tokens, time.perf_counter() - started, {}
+
+
+def stage_iterparse(raw_root, fixed_root):
+    from pysemcor.semcorxml import SemcorXML
+    return _stage_iterparse(SemcorXML(fixed_root))
+
+
+def stage_iterparse_raw(raw_root, fixed_root):
+    from pysemcor.semcorxml import SemcorXML
+    return _stage_iterparse(SemcorXML(raw_root, raw=True))
+
+
+def stage_fix_token_text(raw_root, fixed_root):
+    from pysemcor.semcorxml import SemcorXML, fix_token_text
+    fix_token_text.cache_clear()
+    sents = tokens = 0
+    seconds = 0.0
+    for sent in _sentences(SemcorXML(fixed_root)):
+        texts = [t.text for t in sent['tokens']]
+        started = time.perf_counter()
+        for text in texts:
+            fix_token_text(text)
+        seconds += time.perf_counter() - started
+        sents += 1
+        tokens += len(texts)
+    info = fix_token_text.cache_info()
+    return sents, tokens, seconds, {'cache_hit_rate': info.hits / max(1, info.hits + info.misses)}
+
+
+def stage_detokenize(raw_root, fixed_root):
+    from pysemcor.semcorxml import SemcorXML, detokenize
+    sents = tokens = 0
+    seconds = 0.0
+    for sent in _sentences(SemcorXML(fixed_root)):
+        started = time.perf_counter()
+        detokenize(sent['tokens'])
+        seconds += time.perf_counter() - started
+        sents += 1
+        tokens += len(sent['tokens'])
+    return sents, tokens, seconds, {}
+
+
+def stage_to_ttl(raw_root, fixed_root):
+    ''' Sensekeys are not resolved (no WordNet), so this measures the conversion itself '''
+    from pysemcor.semcorxml import SemcorXML, to_ttl
+    from pysemcor.sensekeys import SenseKeyResolver
+    resolver = SenseKeyResolver()
+    sents = tokens = 0
+    seconds = 0.0
+    for sent in _sentences(SemcorXML(fixed_root)):
+        started = time.perf_counter()
+        to_ttl(sent, resolver=resolver)
+        seconds += time.perf_counter() - started
+        sents += 1
+        tokens += len(sent['tokens'])
+    return sents, tokens, seconds, {}
+
+
+def _stage_xml_to_ttl(sc):
+    ''' Parsing and conversion together, sensekeys are not resolved '''
+    from pysemcor.sensekeys import SenseKeyResolver
+    resolver = SenseKeyResolver()
+    sents = tokens = 0
+    started = time.perf_counter()
+    for f in sc.files:
+        for s in sc.iterparse_ttl(f, resolver=resolver):
+            sents += 1
+            tokens += len(s)
+    return sents, tokens, time.perf_counter() - started, {}
+
+
+def stage_xml_to_ttl(raw_root, fixed_root):
+    from pysemcor.semcorxml import SemcorXML
+    return _stage_xml_to_ttl(SemcorXML(fixed_root))
+
+
+def stage_xml_to_ttl_fused(raw_root, fixed_root):
+    from pysemcor.semcorxml import SemcorXML
+    return _stage_xml_to_ttl(SemcorXML(fixed_root, fused=True))
+
+
+def run_stage(stage, raw_root, fixed_root):
+    ''' Run a stage (in a fresh process, see measure()) and return its metrics '''
+    import resource
+    sents, tokens, seconds, info = globals()['stage_' + stage](raw_root, fixed_root)
+    result = {'stage': stage, 'seconds': round(seconds, 4)}
+    if sents is not None:
+        result.update({'sentences': sents, 'tokens': tokens,
+                       'sentences_per_sec': round(sents / seconds, 1) if seconds else None,
+                       'tokens_per_sec': round(tokens / seconds, 1) if seconds else None})
+    result.update(info)
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result['peak_rss_mb'] = round(maxrss / (1 << 20 if sys.platform == 'darwin' else 1 << 10), 1)
+    return result
+
+
+def measure(stage, raw_root, fixed_root):
+    ''' Run a stage in a new interpreter, so that its peak RSS is not inflated by previous stages '''
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        return pool.apply(run_stage, (stage, raw_root, fixed_root))
+
+
+# -------------------------------------------------------------------------------
+# Corpora and results
+# -------------------------------------------------------------------------------
+
+def prepare_corpus(scale, seed=42, root=CORPUS_DIR):
+    ''' Generate the synthetic corpus of a scale once, return (raw root, fixed root, counts) '''
+    raw_root = os.path.join(root, '{}x'.format(scale))
+    info_path = raw_root + '.json'
+    info = None
+    if os.path.isfile(info_path):
+        with open(info_path) as infile:
+            info = json.load(infile)
+    if info is None or info.get('seed') != seed:
+        shutil.rmtree(raw_root, ignore_errors=True)
+        print("Generating a {}x corpus in {} ...".format(scale, raw_root))
+        info = dict(generate(raw_root, scale=scale, seed=seed), scale=scale, seed=seed)
+        with open(info_path, 'w') as outfile:
+            json.dump(info, outfile)
+    return raw_root, raw_root + '_fixed', info
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': commit, 'python': platform.python_version(),
+            'platform': platform.platform(), 'cpus': os.cpu_count()}
+
+
+def compare(old, new):
+    ''' Print the speed-up of each (scale, stage) of new over old (two result dicts) '''
+    before = {(r['scale'], r['stage']): r for r in old['results']}
+    print("{:>6}  {:16} {:>10} {:>10} {:>8}".format('scale', 'stage', 'old (s)', 'new (s)', 'speed-up'))
+    for r in new['results']:
+        o = before.get((r['scale'], r['stage']))
+        if o is not None and r['seconds']:
+            print("{:>6}  {:16} {:>10.2f} {:>10.2f} {:>7.2f}x".format(r['scale'], r['stage'], o['seconds'], r['seconds'], o['seconds'] / r['seconds']))
+
+
+def report(results):
+    print("{:>6}  {:16} {:>9} {:>12} {:>12} {:>9}".format('scale', 'stage', 'seconds', 'sents/s', 'tokens/s', 'RSS (MB)'))
+    for r in results:
+        print("{:>6}  {:16} {:>9.2f} {:>12} {:>12} {:>9}".format(r['scale'], r['stage'], r['seconds'], r.get('sentences_per_sec', '-'),
+                                                               r.get('tokens_per_sec', '-'), r['peak_rss_mb']))
+
+
+# -------------------------------------------------------------------------------
+# Main method
+# -------------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pysemcor stages on synthetic corpora")
+    parser.add_argument('-s', '--scale', type=float, nargs='+', help='Corpus sizes relative to Semcor, e.g. 1 10 100', default=[1])
+    parser.add_argument('--stages', nargs='+', choices=STAGES, help='Stages to run (default: all)', default=STAGES)
+    parser.add_argument('--seed', type=int, help='Random seed of the generator', default=42)
+    parser.add_argument('-o', '--out', help='Results file (default: bench/results/<time>.json)', default=None)
+    parser.add_argument('-c', '--compare', help='Compare with an earlier results file', default=None)
+    args = parser.parse_args()
+    results = []
+    corpora = {}
+    for scale in args.scale:
+        scale = int(scale) if scale == int(scale) else scale
+        raw_root, fixed_root, info = prepare_corpus(scale, seed=args.seed)
+        corpora[str(scale)] = info
+        if 'fix' not in args.stages and not os.path.isdir(fixed_root):
+            measure('fix', raw_root, fixed_root)
+        for stage in STAGES:
+            if stage in args.stages:
+                result = dict(measure(stage, raw_root, fixed_root), scale=scale)
+                results.append(result)
+                print(json.dumps(result))
+    output = {'environment': environment(), 'corpora': corpora, 'results': results}
+    out = args.out if args.out else os.path.join(RESULTS_DIR, time.strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as outfile:
+        json.dump(output, outfile, indent=1)
+    report(results)
+    print("Results saved to {}".format(out))
+    if args.compare:
+        with open(args.compare) as infile:
+            compare(json.load(infile), output)
+
+
+if __name__ == "__main__":
+    main()
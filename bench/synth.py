@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+
+'''
+Generator of synthetic Semcor (3rada format) corpora of any size
+Latest version can be found at https://github.com/letuananh/pysemcor
+
+References:
+    Python documentation:
+        https://docs.python.org/
+    PEP 0008 - Style Guide for Python Code
+        https://www.python.org/dev/peps/pep-0008/
+    PEP 257 - Python Docstring Conventions:
+        https://www.python.org/dev/peps/pep-0257/
+
+@author: Le Tuan Anh <tuananh.ke@gmail.com>
+'''
+
+# Copyright (c) 2017, Le Tuan Anh <tuananh.ke@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+__author__ = "Le Tuan Anh"
+__email__ = "<tuananh.ke@gmail.com>"
+__copyright__ = "Copyright 2017, pysemcor"
+__license__ = "MIT"
+__maintainer__ = "Le Tuan Anh"
+__version__ = "0.1"
+__status__ = "Prototype"
+__credits__ = []
+
+########################################################################
+
+import os
+import re
+import sys
+import random
+import argparse
+
+# -------------------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------------------
+
+# shape of the real corpus (scale 1): files per folder, paragraphs/sentences per file, tokens per sentence
+FOLDERS = (('brown1', 103), ('brown2', 83), ('brownv', 166))
+PARAS_PER_FILE = 34
+SENTS_PER_PARA = 3.1
+# sentence lengths follow a gamma distribution with a mean of ~21 tokens
+LENGTH_SHAPE = 2.5
+LENGTH_SCALE = 8.4
+PUNC_RATE = 0.13
+TAGGED_RATE = 0.35
+OT_RATE = 0.06
+NE_RATE = 0.015
+
+# attribute values of synth_token(), see to_xml()
+_UNQUOTED = re.compile(r'=([^\s>]+)')
+
+# (text, pos, lemma, lexsn) of sense tagged words
+TAGGED = (('said', 'VB', 'say', '2:32:00::'), ('Friday', 'NN', 'friday', '1:28:00::'),
+          ('investigation', 'NN', 'investigation', '1:09:00::'), ('recent', 'JJ', 'recent', '5:00:00:past:00'),
+          ('primary_election', 'NN', 'primary_election', '1:04:00::'), ('produced', 'VB', 'produce', '2:39:01::'),
+          ('evidence', 'NN', 'evidence', '1:09:00::'), ('irregularities', 'NN', 'irregularity', '1:04:00::'),
+          ('took_place', 'VB', 'take_place', '2:30:00::'), ('jury', 'NN', 'jury', '1:14:00::'),
+          ('further', 'RB', 'far', '4:02:00::'), ('term', 'NN', 'term', '1:28:00::'), ('end', 'NN', 'end', '1:28:00::'),
+          ('had', 'VB', 'have', '2:40:00::'), ('charge', 'NN', 'charge', '1:04:01::'), ('election', 'NN', 'election', '1:04:01::'),
+          ('deserves', 'VB', 'deserve', '2:42:00::'), ('praise', 'NN', 'praise', '1:10:00::'), ('thanks', 'NN', 'thanks', '1:10:00::'),
+          ('city', 'NN', 'city', '1:15:00::'), ('was', 'VB', 'be', '2:42:03::'), ('conducted', 'VB', 'conduct', '2:41:00::'),
+          ('manner', 'NN', 'manner', '1:07:02::'), ('new', 'JJ', 'new', '3:00:00::'), ('went', 'VB', 'go', '2:38:00::'),
+          ('people', 'NN', 'people', '1:14:00::'), ('time', 'NN', 'time', '1:11:00::'), ('year', 'NN', 'year', '1:28:01::'),
+          ('knew', 'VB', 'know', '2:31:01::'), ('quickly', 'RB', 'quickly', '4:02:00::'), ('house', 'NN', 'house', '1:06:00::'),
+          ('good', 'JJ', 'good', '3:00:01::'), ('made', 'VB', 'make', '2:36:01::'), ('number', 'NN', 'number', '1:07:00::'))
+# (text, pos) of words which are not sense tagged
+UNTAGGED = (('The', 'DT'), ('the', 'DT'), ('a', 'DT'), ('an', 'DT'), ('of', 'IN'), ('in', 'IN'), ('that', 'IN'),
+            ('to', 'TO'), ('and', 'CC'), ('it', 'PRP'), ('he', 'PRP'), ('they', 'PRP'), ("'s", 'POS'), ("n't", 'RB'),
+            ('which', 'WDT'), ('for', 'IN'), ('on', 'IN'), ('by', 'IN'), ('with', 'IN'), ('as', 'IN'))
+PUNCS = (',', '.', '.', ',', ';', ':', '?', '``', "''", '(', ')', '--', '&')
+OT_WORDS = (('has', 'VBZ', 'notag'), ('Have', 'VBP', 'notag'), ('one', 'CD', 'notag'), ('do', 'VBP', 'notag'),
+            ('kick_the_bucket', 'VB', 'idiom'), ('ad_hoc', 'JJ', 'foreignword'), ('in_spite_of', 'IN', 'complexprep'))
+# named entities: (text, rdf/pn, lemma, lexsn)
+ENTITIES = (('Fulton_County_Grand_Jury', 'group', 'group', '1:03:00::'), ('Mayor_William_B._Hartsfield', 'person', 'person', '1:03:00::'),
+            ('Atlanta', 'location', 'location', '1:03:00::'))
+
+
+# -------------------------------------------------------------------------------
+# Generator
+# -------------------------------------------------------------------------------
+
+def synth_token(rng, verbs_only=False):
+    ''' One token element of a 3rada file (attributes are not quoted, like in the original files) '''
+    x = rng.random()
+    if x < PUNC_RATE:
+        return '<punc>{}</punc>'.format(rng.choice(PUNCS))
+    x = rng.random()
+    if x < NE_RATE:
+        text, ne, lemma, lexsn = rng.choice(ENTITIES)
+        return '<wf cmd=done rdf={ne} pos=NNP lemma={l} wnsn=1 lexsn={s} pn={ne}>{t}</wf>'.format(ne=ne, l=lemma, s=lexsn, t=text)
+    elif x < NE_RATE + OT_RATE:
+        text, pos, ot = rng.choice(OT_WORDS)
+        return '<wf cmd=done pos={} ot={}>{}</wf>'.format(pos, ot, text)
+    elif x < NE_RATE + OT_RATE + TAGGED_RATE:
+        text, pos, lemma, lexsn = rng.choice(TAGGED)
+        if not verbs_only or pos == 'VB':
+            return '<wf cmd=done pos={} lemma={} wnsn={} lexsn={}>{}</wf>'.format(pos, lemma, rng.randint(1, 4), lexsn, text)
+        return '<wf cmd=tag pos={}>{}</wf>'.format(pos, text)
+    text, pos = rng.choice(UNTAGGED)
+    return '<wf cmd=ignore pos={}>{}</wf>'.format(pos, text)
+
+
+def write_file(path, name, rng, paras, verbs_only=False):
+    ''' Write a synthetic 3rada file, return (paragraphs, sentences, tokens) '''
+    snum = 0
+    tokens = 0
+    with open(path, 'w', encoding='utf-8') as outfile:
+        outfile.write('<contextfile concordance=brown>\n<context filename={} paras=yes>\n'.format(name))
+        for pnum in range(1, paras + 1):
+            outfile.write('<p pnum={}>\n'.format(pnum))
+            for _ in range(max(1, round(rng.expovariate(1 / SENTS_PER_PARA)))):
+                snum += 1
+                length = max(1, int(rng.gammavariate(LENGTH_SHAPE, LENGTH_SCALE)))
+                tokens += length
+                outfile.write('<s snum={}>\n'.format(snum))
+                outfile.write('\n'.join(synth_token(rng, verbs_only) for _ in range(length)))
+                outfile.write('\n</s>\n')
+            outfile.write('</p>\n')
+        outfile.write('</context>\n</contextfile>\n')
+    return paras, snum, tokens
+
+
+def to_xml(token):
+    ''' A token of synth_token() as well-formed XML (see pysemcor.sgml.repair()) '''
+    return _UNQUOTED.sub(r'="\1"', token).replace('>&<', '>&amp;<')
+
+
+def write_large_file(path, size, rng, sents_per_para=0, xml=True):
+    ''' Write one file of at least size bytes, e.g. to check that parsers run in constant memory
+        sents_per_para: sentences per paragraph (0 = all sentences in a single paragraph)
+        xml: write well-formed XML (like data/3rada_fixed) instead of the 3rada format
+        Return the number of sentences
+    '''
+    fmt = to_xml if xml else str
+    quote = '"' if xml else ''
+    snum = 0
+    pnum = 0
+    with open(path, 'w', encoding='utf-8') as outfile:
+        outfile.write('<contextfile concordance={0}brown{0}>\n<context filename={0}large{0} paras={0}yes{0}>\n'.format(quote))
+        while outfile.tell() < size:
+            pnum += 1
+            outfile.write('<p pnum={0}{1}{0}>\n'.format(quote, pnum))
+            for _ in range(sents_per_para or sys.maxsize):
+                snum += 1
+                length = max(1, int(rng.gammavariate(LENGTH_SHAPE, LENGTH_SCALE)))
+                outfile.write('<s snum={0}{1}{0}>\n'.format(quote, snum))
+                outfile.write('\n'.join(fmt(synth_token(rng)) for _ in range(length)))
+                outfile.write('\n</s>\n')
+                if outfile.tell() >= size:
+                    break
+            outfile.write('</p>\n')
+        outfile.write('</context>\n</contextfile>\n')
+    return snum
+
+
+def generate(root, scale=1.0, seed=42):
+    ''' Write a synthetic corpus with the layout of data/3rada (brown1, brown2, brownv) under root
+        scale=1 gives about the size of Semcor (352 files, ~37k sentences, ~780k tokens).
+        The same scale and seed always give the same files.
+        Return the counts of what was written
+    '''
+    rng = random.Random(seed)
+    counts = {'files': 0, 'paragraphs': 0, 'sentences': 0, 'tokens': 0, 'bytes': 0}
+    for folder, files in FOLDERS:
+        dirpath = os.path.join(root, folder, 'tagfiles')
+        os.makedirs(dirpath, exist_ok=True)
+        for idx in range(max(1, round(files * scale))):
+            name = 'syn-{}-{:05d}'.format(folder[-1], idx + 1)
+            path = os.path.join(dirpath, name)
+            paras, sents, tokens = write_file(path, name, rng, max(1, round(rng.gauss(PARAS_PER_FILE, 8))), verbs_only=(folder == 'brownv'))
+            counts['files'] += 1
+            counts['paragraphs'] += paras
+            counts['sentences'] += sents
+            counts['tokens'] += tokens
+            counts['bytes'] += os.path.getsize(path)
+    return counts
+
+
+# -------------------------------------------------------------------------------
+# Main method
+# -------------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Semcor corpus in 3rada format")
+    parser.add_argument('root', help='Output folder')
+    parser.add_argument('-s', '--scale', type=float, help='Corpus size relative to Semcor (e.g. 1, 10, 100)', default=1.0)
+    parser.add_argument('--seed', type=int, help='Random seed', default=42)
+    args = parser.parse_args()
+    print(generate(args.root, scale=args.scale, seed=args.seed))
+
+
+if __name__ == "__main__":
+    main()
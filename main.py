@@ -48,14 +48,18 @@ __credits__ = []
 ########################################################################
 
 import os
+import json
 import logging
 import argparse
 
-from chirptext import Counter, TextReport, header
-from chirptext import ttl
-from yawlib import SynsetID
-from pysemcor.semcorxml import fix_3rada, xml2json
+from pysemcor.semcorxml import fix_3rada, STREAM, SOUP
 from pysemcor.semcorxml import FileSet, SemcorXML
+from pysemcor.sensekeys import SenseKeyResolver
+from pysemcor.jsonio import COMPRESSIONS, ENCODERS, STDLIB, set_encoder
+from pysemcor.shard import parse_shard, shard_path, sensekeys_name, save_sensekeys, merge_outputs
+from pysemcor.split import SplitWriter, parse_partition, UNITS, SENTENCE
+from pysemcor.columnar import FORMATS
+from pysemcor import instrument
 
 # -------------------------------------------------------------------------------
 # Configuration
@@ -67,63 +71,292 @@ SEMCOR_ORIG = os.path.abspath('./data/3rada')
 SEMCOR_FIXED = os.path.abspath('./data/3rada_fixed')
 SEMCOR_JSON = os.path.abspath('./data/3rada_json')
 SEMCOR_TTL = os.path.abspath('./data/3rada_ttl')
+SEMCOR_CACHE = os.path.abspath('./data/3rada_fixed.cache')
+SEMCOR_RAW_CACHE = os.path.abspath('./data/3rada.cache')
+SEMCOR_DB = os.path.abspath('./data/semcor.ttl.db')
+SEMCOR_TOKENS = os.path.abspath('./data/semcor.tokens')
 
 
 # -------------------------------------------------------------------------------
 # Application logic
 # -------------------------------------------------------------------------------
 
+def report_failures(failures):
+    from chirptext import header
+    if failures:
+        header("{} file(s) could not be processed".format(len(failures)))
+        for path, error in failures:
+            print("{}: {}".format(path, error))
+
+
 def fix(args):
-    fix_3rada(SEMCOR_ORIG, SEMCOR_FIXED)
+    report_failures(fix_3rada(SEMCOR_ORIG, SEMCOR_FIXED, jobs=args.jobs, engine=args.engine, verify=args.verify, shard=args.shard))
+
+
+def get_semcor(args):
+    ''' Semcor source as selected by --raw, --cache and --shard '''
+    cache = getattr(args, 'cache', False)
+    root = SEMCOR_ORIG if args.raw else SEMCOR_FIXED
+    filters = {'include': getattr(args, 'include', None), 'exclude': getattr(args, 'exclude', None), 'listing': root + '.files.json',
+               'fused': getattr(args, 'fused', False)}
+    if args.raw:
+        sc = SemcorXML(root, raw=True, cache=SEMCOR_RAW_CACHE if cache else None, **filters)
+    else:
+        sc = SemcorXML(root, cache=SEMCOR_CACHE if cache else None, **filters)
+    if getattr(args, 'shard', None):
+        sc.files = sc.files.shard(*args.shard)
+    return sc
+
+
+def split_writer(args, default_out, ensure_ascii=True):
+    ''' SplitWriter of --split, --split-by and --split-out '''
+    out = args.split_out or shard_path(default_out + '_split', args.shard)
+    return SplitWriter(out, args.split, by=args.split_by, compression=args.compress, ensure_ascii=ensure_ascii)
+
+
+def report_split(writer):
+    for name, count in writer.counts.items():
+        print("{}: {} sentence(s) => {}".format(name, count, writer.path(name)))
+    if writer.dropped:
+        print("{} sentence(s) were not in any partition".format(writer.dropped))
 
 
 def to_json(args):
-    sc = SemcorXML(SEMCOR_FIXED)
+    set_encoder(args.encoder)
+    sc = get_semcor(args)
+    if args.split:
+        with split_writer(args, SEMCOR_JSON) as writer:
+            failures = sc.split_to_json(writer, jobs=args.jobs)
+        report_failures(failures)
+        report_split(writer)
+        return
     sc_json = FileSet(SEMCOR_JSON)
-    for f in sc.files:
-        xml2json(f, sc, sc_json)
+    report_failures(sc.convert_to_json(sc_json, jobs=args.jobs, resume=args.resume, compression=args.compress))
 
 
 def to_ttl(args):
     ''' Convert fixed XML to TTL '''
-    sc = SemcorXML(SEMCOR_FIXED)
+    set_encoder(args.encoder)
+    sc = get_semcor(args)
+    if args.split:
+        resolver = SenseKeyResolver()
+        with split_writer(args, SEMCOR_TTL, ensure_ascii=False) as writer:
+            failures = sc.split_to_ttl(writer, limit=args.limit, with_nonsense=False, jobs=args.jobs, resolver=resolver)
+        report_failures(failures)
+        report_split(writer)
+        print("Sensekeys: {}".format(resolver.stats))
+        return
     scttl = FileSet(SEMCOR_TTL)
-    sc.convert_to_ttl(scttl, limit=args.limit, with_nonsense=False)
+    resolver = SenseKeyResolver()
+    # keep the sensekeys this conversion used, so that shards can be merged (see merge())
+    resolver.journal = {}
+    report_failures(sc.convert_to_ttl(scttl, limit=args.limit, with_nonsense=False, jobs=args.jobs, resolver=resolver,
+                                      resume=args.resume, compression=args.compress))
+    save_sensekeys(os.path.join(SEMCOR_TTL, sensekeys_name(args.shard)), resolver.journal)
+    print("Sensekeys: {}".format(resolver.stats))
+
+
+def to_db(args):
+    ''' Convert Semcor to TTL and load it into a TTL SQLite database in one streaming pass '''
+    from pysemcor.ttldb import BulkLoader
+    sc = get_semcor(args)
+    resolver = SenseKeyResolver()
+    if args.db is None:
+        args.db = shard_path(SEMCOR_DB, args.shard)
+    loader = BulkLoader(args.db)
+
+    def _imported(path, corpus, written):
+        if written:
+            print("Imported {} into {}".format(path, corpus))
+    report_failures(loader.load_semcor(sc, limit=args.limit, with_nonsense=False, jobs=args.jobs, resolver=resolver,
+                                       on_doc=_imported))
+    print("Sensekeys: {}".format(resolver.stats))
+    print("Loaded {} rows in {:.2f}s ({:.0f} rows/s), {} document(s) were already in {}".format(
+        loader.rows, loader.elapsed, loader.rows_per_sec, len(loader.skipped), args.db))
+
+
+def export(args):
+    ''' Export one row per token to a Parquet/Arrow file, or to TSV when pyarrow is not installed '''
+    from pysemcor.columnar import TokenTableWriter, default_format, export_tokens
+    sc = get_semcor(args)
+    resolver = SenseKeyResolver()
+    out = args.out or shard_path(SEMCOR_TOKENS + '.' + (args.format or default_format()), args.shard)
+    with TokenTableWriter(out, args.format) as writer:
+        failures = export_tokens(sc, writer, limit=args.limit, with_nonsense=False, jobs=args.jobs, resolver=resolver)
+    report_failures(failures)
+    print("Sensekeys: {}".format(resolver.stats))
+    print("Exported {} tokens in {} batch(es) to {} ({})".format(writer.rows, writer.batches, out, writer.format))
+
+
+def query(args):
+    ''' Find tokens by sensekey, synsetID, lemma and POS '''
+    from pysemcor.query import QueryIndex, FIELDS, query_index
+    from pysemcor.semcorxml import get_wordnet, detokenize
+    sc = get_semcor(args)
+    conditions = {field: getattr(args, field) for field in FIELDS if getattr(args, field)}
+    if not conditions:
+        print("At least one of --{} is required".format(', --'.join(FIELDS)))
+        return
+    # a shard has its own index, e.g. data/3rada_fixed.query.2of4.db
+    index = QueryIndex(shard_path(sc.root + '.query.db', args.shard))
+    # a synset query needs an index with synsetIDs
+    if args.rebuild or not index.is_fresh(sc, synsets='synset' in conditions and not args.no_synsets):
+        print("Building query index {} ...".format(index.path))
+        if args.no_synsets:
+            index = query_index(sc, path=index.path, rebuild=True)
+        else:
+            with get_wordnet().ctx() as wnctx:
+                index = query_index(sc, path=index.path, resolver=SenseKeyResolver(wnctx, preload=True), rebuild=True)
+    if 'synset' in conditions and not index.has_synsets():
+        print("{} was built with --no-synsets, rebuild it with WordNet to query synsetIDs".format(index.path))
+        return
+    if args.count:
+        print(index.count(**conditions))
+        return
+    hits = index.find(limit=args.limit, **conditions)
+    if args.show:
+        sents = dict(zip((sid for sid, idx in hits), sc.get_sentences(sid for sid, idx in hits)))
+        for sid, idx in hits:
+            tokens = sents[sid]['tokens']
+            print("{}\t{}\t{}\t{}".format(sid, idx, tokens[idx].text, detokenize(tokens)))
+    else:
+        for sid, idx in hits:
+            print("{}\t{}".format(sid, idx))
 
 
 def list_unksense(args):
+    from chirptext import header
+    from pysemcor.stats import StatsEngine, ConceptStats, JsonLinesSource
     header("List unknown sensekeys in Semcor")
-    semxml = SemcorXML(SEMCOR_TTL)
-    unk = Counter()
-    sids = Counter()
-    c = Counter()
-    out = TextReport() if not args.out else TextReport(args.out)
-    for f in semxml.files[:args.limit] if args.limit else ttl.files:
-        doc = ttl.Document.from_json_file(ttl.files.abspath(f))
-        for s in doc:
-            for concept in s.concepts:
-                try:
-                    sid = SynsetID.from_string(concept.tag)
-                    sids.count((sid, concept.clemma))
-                    c.count("Known instances")
-                except:
-                    sid = None
-                    unk.count((concept.tag, concept.clemma))
-                    c.count("Unknown instances")
+    concepts = ConceptStats()
+    source = JsonLinesSource(SEMCOR_TTL, include=args.include, exclude=args.exclude)
+    if args.shard:
+        source.files = source.files.shard(*args.shard)
+    engine = StatsEngine(concepts)
+    report_failures(engine.run(source, limit=args.limit, jobs=args.jobs))
+    if args.save:
+        engine.save(args.save)
+    print_unksense(concepts, args.out)
+
+
+def print_unksense(concepts, path=None):
+    ''' Report the known and unknown concepts of a ConceptStats (to path, or to stdout) '''
+    from chirptext import TextReport
+    from pysemcor.stats import ranked
+    out = TextReport() if not path else TextReport(path)
     out.header("Known concepts")
     out.writeline("\t".join(("synsetID", "lemma", "count")))
-    for k, v in sids.sorted_by_count():
+    for k, v in ranked(concepts.known):
         sid, lemma = k
         out.writeline("\t".join((str(sid), lemma, str(v))))
     out.header("Unknown concepts")
     out.writeline("\t".join(("sensekey", "lemma", "count")))
-    for k, v in unk.sorted_by_count():
+    for k, v in ranked(concepts.unknown):
         sk, lemma = k
         out.writeline("\t".join((sk, lemma, str(v))))
     out.header("Total")
-    out.writeline("Known: {}".format(len(sids)))
-    out.writeline("Unknown: {}".format(len(unk)))
-    c.summarise(out)
+    out.writeline("Known: {}".format(len(concepts.known)))
+    out.writeline("Unknown: {}".format(len(concepts.unknown)))
+    for k, v in ranked(concepts.instances):
+        out.writeline("%s: %d" % (k, v))
+
+
+def stats_engine():
+    from pysemcor.stats import StatsEngine, CorpusSize, PosSenses, RdfValues
+    return StatsEngine(CorpusSize(), PosSenses(), RdfValues())
+
+
+def print_stats(engine):
+    from chirptext import header
+    from pysemcor.stats import ranked
+    size, pos_senses, rdf_values = engine.aggregators
+    header("Corpus")
+    print("files: {}".format(engine.files))
+    for k, v in size.counts.items():
+        print("{}: {}".format(k, v))
+    header("Senses by POS")
+    print("\t".join(("pos", "tokens", "senses")))
+    for pos, tokens, senses in pos_senses.by_pos():
+        print("\t".join((str(pos), str(tokens), str(senses))))
+    header("RDF values")
+    print("rdf values: {} ({} with a sensekey)".format(len(rdf_values.rdf), len(rdf_values.rdf_with_key)))
+    for k, v in ranked(rdf_values.ot):
+        print("ot={}: {}".format(k, v))
+
+
+def stats(args):
+    ''' Corpus statistics, all computed in a single pass '''
+    engine = stats_engine()
+    report_failures(engine.run(get_semcor(args), limit=args.limit, jobs=args.jobs))
+    if args.save:
+        engine.save(args.save)
+    print_stats(engine)
+
+
+def merge(args):
+    ''' Combine the outputs of shards (see --shard) into the output of a single run '''
+    if args.kind in ('json', 'ttl'):
+        out = args.out or (SEMCOR_JSON if args.kind == 'json' else SEMCOR_TTL)
+        print("Merged {} outputs into {}".format(merge_outputs(out, args.inputs), out))
+    elif args.kind == 'db':
+        from pysemcor.ttldb import BulkLoader
+        out = args.out or SEMCOR_DB
+        loader = BulkLoader(out)
+        loader.merge(args.inputs, order=[(f, f[:6]) for f in get_semcor(args).files])
+        print("Merged {} rows in {:.2f}s ({:.0f} rows/s), {} document(s) were already in {}".format(
+            loader.rows, loader.elapsed, loader.rows_per_sec, len(loader.skipped), out))
+    else:
+        from pysemcor.stats import StatsEngine, ConceptStats
+        engine = stats_engine() if args.kind == 'stats' else StatsEngine(ConceptStats())
+        for path in args.inputs:
+            engine.load(path)
+        if args.out:
+            engine.save(args.out)
+        if args.kind == 'stats':
+            print_stats(engine)
+        else:
+            print_unksense(engine.aggregators[0])
+
+
+def add_file_options(task):
+    task.add_argument('--include', action='append', help='Only process files matching a glob (or re:REGEX), can be repeated')
+    task.add_argument('--exclude', action='append', help='Skip files matching a glob (or re:REGEX), can be repeated')
+
+
+def add_split_options(task):
+    task.add_argument('--split', nargs='+', type=parse_partition, metavar='NAME[=SIZE]',
+                      help='Write partitions instead, e.g. train=80%% dev=10%% test, or test=500 train (SIZE sentences or documents)')
+    task.add_argument('--split-by', choices=UNITS, help='Assign sentences or whole documents to partitions', default=SENTENCE)
+    task.add_argument('--split-out', help='Folder of the partitions (data/3rada_json_split or data/3rada_ttl_split)', default=None)
+
+
+def add_stats_options(task):
+    task.add_argument('--stats', help='Write per-stage counts and timings to a JSON file', default=None)
+    task.add_argument('--profile', choices=instrument.STAGES, help='Profile a stage', default=None)
+    task.add_argument('--profiler', choices=[instrument.CPROFILE, instrument.TRACEMALLOC], help='Profiler used by --profile',
+                      default=instrument.CPROFILE)
+
+
+def run_task(args):
+    ''' Run the selected task, with instrumentation when --stats or --profile is given '''
+    if not getattr(args, 'stats', None) and not getattr(args, 'profile', None):
+        args.func(args)
+        return
+    if args.profile and args.jobs != 1:
+        logger.warning("--profile only covers the work done in the main process, use -j 1 to profile workers")
+    rec = instrument.enable(profile=args.profile, profiler=args.profiler)
+    try:
+        args.func(args)
+    finally:
+        instrument.disable()
+        if args.stats:
+            rec.dump(args.stats)
+            print("Stats written to {}".format(args.stats))
+        else:
+            report = rec.report()
+            report.pop('files')
+            print(json.dumps(report, indent=1))
+        rec.close()
 
 
 def config_logging(args):
@@ -138,10 +371,8 @@ def config_logging(args):
 # Main method
 # -------------------------------------------------------------------------------
 
-def main():
-    '''Main entry of pysemcor
-    '''
-
+def build_parser():
+    ''' Command line parser of all tasks '''
     # It's easier to create a user-friendly console application by using argparse
     # See reference at the top of this script
     parser = argparse.ArgumentParser(description="pySemcor toolkit", add_help=False)
@@ -155,25 +386,118 @@ def main():
     tasks = parser.add_subparsers(help="Task to be done")
 
     fix_task = tasks.add_parser('fix', parents=[parser], help='Fix 3rada dataset')
+    fix_task.add_argument('-j', '--jobs', type=int, help='Number of worker processes (0 = one per CPU)', default=1)
+    fix_task.add_argument('-e', '--engine', choices=[STREAM, SOUP], help='Repair engine', default=STREAM)
+    fix_task.add_argument('--verify', action='store_true', help='Check stream engine output against BeautifulSoup output')
+    fix_task.add_argument('--shard', type=parse_shard, help='Only repair shard i of N (e.g. 2/4)', default=None)
     fix_task.set_defaults(func=fix)
 
     json_task = tasks.add_parser('json', parents=[parser], help='Convert XML to JSON')
+    json_task.add_argument('-j', '--jobs', type=int, help='Number of worker processes (0 = one per CPU)', default=1)
+    json_task.add_argument('--raw', action='store_true', help='Read original 3rada files instead of the fixed XML')
+    json_task.add_argument('--cache', action='store_true', help='Read the corpus from a binary cache (built on first use)')
+    json_task.add_argument('--resume', action='store_true', help='Keep complete outputs which are not in the build manifest yet')
+    json_task.add_argument('-z', '--compress', choices=COMPRESSIONS, help='Compress outputs (zst requires zstandard)', default=None)
+    json_task.add_argument('--encoder', choices=ENCODERS, help='JSON encoder (orjson is faster but writes compact JSON)', default=STDLIB)
+    add_file_options(json_task)
+    json_task.add_argument('--shard', type=parse_shard, help='Only process shard i of N (e.g. 2/4), see the merge task', default=None)
+    add_split_options(json_task)
+    add_stats_options(json_task)
     json_task.set_defaults(func=to_json)
 
     ttl_task = tasks.add_parser('ttl', parents=[parser], help='Convert fixed 3rada dataset to TTL')
     ttl_task.add_argument('-n', '--limit', type=int, help='Only parse top K files', default=None)
+    ttl_task.add_argument('-j', '--jobs', type=int, help='Number of worker processes (0 = one per CPU)', default=1)
+    ttl_task.add_argument('--raw', action='store_true', help='Read original 3rada files instead of the fixed XML')
+    ttl_task.add_argument('--cache', action='store_true', help='Read the corpus from a binary cache (built on first use)')
+    ttl_task.add_argument('--resume', action='store_true', help='Keep complete outputs which are not in the build manifest yet')
+    ttl_task.add_argument('-z', '--compress', choices=COMPRESSIONS, help='Compress outputs (zst requires zstandard)', default=None)
+    ttl_task.add_argument('--encoder', choices=ENCODERS, help='JSON encoder (orjson is faster but writes compact JSON)', default=STDLIB)
+    add_file_options(ttl_task)
+    ttl_task.add_argument('--fused', action='store_true', help='Build TTL sentences straight from the XML elements (faster)')
+    ttl_task.add_argument('--shard', type=parse_shard, help='Only process shard i of N (e.g. 2/4), see the merge task', default=None)
+    add_split_options(ttl_task)
+    add_stats_options(ttl_task)
     ttl_task.set_defaults(func=to_ttl)
 
+    db_task = tasks.add_parser('db', parents=[parser], help='Convert Semcor to TTL and load it into a TTL SQLite database')
+    db_task.add_argument('-d', '--db', help='Path to database (data/semcor.ttl.db, data/semcor.ttl.2of4.db for shard 2/4)', default=None)
+    db_task.add_argument('-n', '--limit', type=int, help='Only parse top K files', default=None)
+    db_task.add_argument('-j', '--jobs', type=int, help='Number of worker processes (0 = one per CPU)', default=1)
+    db_task.add_argument('--raw', action='store_true', help='Read original 3rada files instead of the fixed XML')
+    db_task.add_argument('--cache', action='store_true', help='Read the corpus from a binary cache (built on first use)')
+    add_file_options(db_task)
+    db_task.add_argument('--fused', action='store_true', help='Build TTL sentences straight from the XML elements (faster)')
+    db_task.add_argument('--shard', type=parse_shard, help='Only process shard i of N (e.g. 2/4), see the merge task', default=None)
+    add_stats_options(db_task)
+    db_task.set_defaults(func=to_db)
+
+    export_task = tasks.add_parser('export', parents=[parser], help='Export tokens to a columnar table (Parquet, Arrow or TSV)')
+    export_task.add_argument('-o', '--out', help='Output file, the format is taken from its extension (data/semcor.tokens.parquet '
+                             'or data/semcor.tokens.tsv without pyarrow, .tsv.gz/.tsv.xz/.tsv.zst are compressed)', default=None)
+    export_task.add_argument('-f', '--format', choices=FORMATS, help='Output format (Parquet and Arrow require pyarrow)', default=None)
+    export_task.add_argument('-n', '--limit', type=int, help='Only parse top K files', default=None)
+    export_task.add_argument('-j', '--jobs', type=int, help='Number of worker processes (0 = one per CPU)', default=1)
+    export_task.add_argument('--raw', action='store_true', help='Read original 3rada files instead of the fixed XML')
+    export_task.add_argument('--cache', action='store_true', help='Read the corpus from a binary cache (built on first use)')
+    add_file_options(export_task)
+    export_task.add_argument('--shard', type=parse_shard, help='Only process shard i of N (e.g. 2/4)', default=None)
+    add_stats_options(export_task)
+    export_task.set_defaults(func=export)
+
+    query_task = tasks.add_parser('query', parents=[parser], help='Find tokens by sensekey, synsetID, lemma and POS')
+    query_task.add_argument('--sk', help='Sensekey, e.g. bank%%1:14:00::')
+    query_task.add_argument('--synset', help='SynsetID, e.g. 08420278-n')
+    query_task.add_argument('--lemma', help='Lemma')
+    query_task.add_argument('--pos', help='POS tag, e.g. VB')
+    query_task.add_argument('-n', '--limit', type=int, help='Only show the first K tokens', default=None)
+    query_task.add_argument('-c', '--count', action='store_true', help='Only count the tokens')
+    query_task.add_argument('-s', '--show', action='store_true', help='Show token texts and sentences')
+    query_task.add_argument('--rebuild', action='store_true', help='Rebuild the query index')
+    query_task.add_argument('--no-synsets', action='store_true', help='Build the index without WordNet (no synsetIDs)')
+    query_task.add_argument('--raw', action='store_true', help='Read original 3rada files instead of the fixed XML')
+    query_task.add_argument('--cache', action='store_true', help='Read the corpus from a binary cache (built on first use)')
+    query_task.add_argument('--shard', type=parse_shard, help='Only search shard i of N (e.g. 2/4), with an index per shard', default=None)
+    query_task.set_defaults(func=query)
+
     list_unksense_task = tasks.add_parser('unk', parents=[parser], help='List unknown senses')
     list_unksense_task.add_argument('-n', '--limit', type=int, help='Only parse top K files', default=None)
     list_unksense_task.add_argument('-o', '--out', help='Output file', default=None)
+    list_unksense_task.add_argument('-j', '--jobs', type=int, help='Number of worker processes (0 = one per CPU)', default=1)
+    add_file_options(list_unksense_task)
+    list_unksense_task.add_argument('--shard', type=parse_shard, help='Only process shard i of N (e.g. 2/4), see the merge task', default=None)
+    list_unksense_task.add_argument('--save', help='Also write the counts to a JSON file (to merge shards)', default=None)
     list_unksense_task.set_defaults(func=list_unksense)
 
+    stats_task = tasks.add_parser('stats', parents=[parser], help='Corpus statistics')
+    stats_task.add_argument('-n', '--limit', type=int, help='Only parse top K files', default=None)
+    stats_task.add_argument('-j', '--jobs', type=int, help='Number of worker processes (0 = one per CPU)', default=1)
+    stats_task.add_argument('--raw', action='store_true', help='Read original 3rada files instead of the fixed XML')
+    stats_task.add_argument('--cache', action='store_true', help='Read the corpus from a binary cache (built on first use)')
+    add_file_options(stats_task)
+    stats_task.add_argument('--shard', type=parse_shard, help='Only process shard i of N (e.g. 2/4), see the merge task', default=None)
+    stats_task.add_argument('--save', help='Also write the counts to a JSON file (to merge shards)', default=None)
+    stats_task.set_defaults(func=stats)
+
+    merge_task = tasks.add_parser('merge', parents=[parser], help='Merge the outputs of shards (see --shard)')
+    merge_task.add_argument('-k', '--kind', choices=['json', 'ttl', 'db', 'stats', 'unk'], help='Task which wrote the shards', required=True)
+    merge_task.add_argument('-i', '--inputs', nargs='+', help='Output folders (json, ttl), databases (db) or --save files (stats, unk)',
+                            required=True)
+    merge_task.add_argument('-o', '--out', help='Merged output (the output of the task by default)', default=None)
+    merge_task.add_argument('--raw', action='store_true', help='db: documents were read from the original 3rada files')
+    merge_task.set_defaults(func=merge)
+    return parser
+
+
+def main():
+    '''Main entry of pysemcor
+    '''
+    parser = build_parser()
     # Main script
     args = parser.parse_args()
     config_logging(args)
     if args.func is not None:
-        args.func(args)
+        run_task(args)
     else:
         parser.print_help()
     pass
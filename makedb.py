@@ -8,42 +8,38 @@ Latest version can be found at https://github.com/letuananh/pysemcor
 :license: MIT, see LICENSE for more details.
 '''
 
+import os
 import logging
-from texttaglib import TTLSQLite
-from texttaglib import ttl
+import argparse
 from pysemcor import SemcorXML
+from pysemcor.ttldb import BulkLoader
 
 
-db = TTLSQLite('data/semcor.ttl.db')
-brown1 = db.ensure_corpus(name='brown1')
-brown2 = db.ensure_corpus(name='brown2')
-brownv = db.ensure_corpus(name='brownv')
-corpuses = {'brown1': brown1,
-            'brown2': brown2,
-            'brownv': brownv}
-try:
-    semxml = SemcorXML(root='data/3rada_ttl')
-except:
+parser = argparse.ArgumentParser(description="Import Semcor TTL files into a TTL SQLite database")
+parser.add_argument('-d', '--db', help='Path to database', default='data/semcor.ttl.db')
+parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of parsing processes (0 = one per CPU)')
+args = parser.parse_args()
+
+logger = logging.getLogger(__name__)
+if not os.path.isdir('data/3rada_ttl'):
     print("Did you convert Semcor to TTL by using `python main.py ttl`?")
     exit()
-logger = logging.getLogger(__name__)
-
+semxml = SemcorXML(root='data/3rada_ttl')
 all_files = semxml.files
 # all_files = ['brown1/tagfiles/br-b13.json']
-for idx, fn in enumerate(all_files):
-    corpus = corpuses[fn[:6]]
-    doc_ttl = ttl.Document.from_json_file(semxml.files.abspath(fn))
-    doc_obj = db.doc.select_single('name=?', (doc_ttl.name,))
-    if doc_obj is not None:
-        logger.warning("Doc {} exists. Cannot import".format(doc_ttl.name))
-    else:
-        print("Importing {} into {} ({}/{})".format(doc_ttl.name, corpus.name, idx + 1, len(semxml.files)))
-        # create the doc
-        doc_obj = db.ensure_doc(name=doc_ttl.name, corpus=corpus)
-        for sent in doc_ttl:
-            # clear ID
-            sent.ID = None
-            sent.docID = doc_obj.ID
-            db.save_sent(sent)
+files = [(semxml.files.abspath(fn), fn[:6]) for fn in all_files]
+progress = {'done': 0}
+
+
+def imported(path, corpus, written):
+    progress['done'] += 1
+    if written:
+        print("Imported {} into {} ({}/{})".format(os.path.basename(path), corpus, progress['done'], len(files)))
+
 
+loader = BulkLoader(args.db)
+failures = loader.load(files, jobs=args.jobs, on_doc=imported)
+for path, error in failures:
+    print("Failed to import {}: {}".format(path, error))
+print("Loaded {} rows in {:.2f}s ({:.0f} rows/s)".format(loader.rows, loader.elapsed, loader.rows_per_sec))
 print("Done!")
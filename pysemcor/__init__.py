@@ -2,5 +2,7 @@
 
 from .semcorxml import SemcorXML
 from .semcorxml import TokenInfo, FileSet
+from .sensekeys import SenseKeyResolver
+from .corpus import SemcorCorpus
 
-__all__ = ["SemcorXML", "TokenInfo", "FileSet"]
+__all__ = ["SemcorXML", "TokenInfo", "FileSet", "SenseKeyResolver", "SemcorCorpus"]
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+
+'''
+Memory-mapped binary cache of a parsed Semcor corpus
+Latest version can be found at https://github.com/letuananh/pysemcor
+
+References:
+    Python documentation:
+        https://docs.python.org/
+    PEP 0008 - Style Guide for Python Code
+        https://www.python.org/dev/peps/pep-0008/
+    PEP 257 - Python Docstring Conventions:
+        https://www.python.org/dev/peps/pep-0257/
+
+@author: Le Tuan Anh <tuananh.ke@gmail.com>
+'''
+
+# Copyright (c) 2017, Le Tuan Anh <tuananh.ke@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+__author__ = "Le Tuan Anh"
+__email__ = "<tuananh.ke@gmail.com>"
+__copyright__ = "Copyright 2017, pysemcor"
+__license__ = "MIT"
+__maintainer__ = "Le Tuan Anh"
+__version__ = "0.1"
+__status__ = "Prototype"
+__credits__ = []
+
+########################################################################
+
+import os
+import sys
+import json
+import mmap
+import struct
+import sqlite3
+import logging
+from sys import intern
+from array import array
+
+from .semcorxml import OUTPUT_VERSION as PARSER_VERSION
+from .semcorxml import fix_sensekey, rules_digest, get_wordnet
+from .sensekeys import SenseKeyResolver
+from .corpus import SemcorCorpus, Vocab, ALL_COLUMNS
+from .manifest import file_hash, atomic_write
+
+# -------------------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------------------
+
+MAGIC = b'PYSEMCOR'
+FORMAT_VERSION = 1
+# arrays are aligned so that they can be cast in place
+ALIGN = 8
+_HEADER_SIZE = struct.Struct('<Q')
+
+
+def getLogger():
+    return logging.getLogger(__name__)
+
+
+# -------------------------------------------------------------------------------
+# Data structures
+# -------------------------------------------------------------------------------
+
+class SemcorCache(object):
+
+    ''' A binary corpus cache opened through mmap
+        File layout: MAGIC, header length (uint64), JSON header, then the arrays of the corpus (8-byte aligned).
+        The columns of corpus are memoryviews of the mapped file, so opening a cache does not copy them.
+    '''
+
+    def __init__(self, path, header, data):
+        self.path = path
+        self.header = header
+        self.sk_map = header['sk_map']
+        self.unknown = set(header['unknown'])
+        self.corpus = _make_corpus(header, data)
+
+    def iterparse(self, doc):
+        return self.corpus.iterparse(doc)
+
+    def __repr__(self):
+        return "SemcorCache({}, {})".format(repr(self.path), self.corpus)
+
+
+def _make_corpus(header, buf):
+    corpus = SemcorCorpus(header['columns'])
+    # vocab strings are interned like the values of parsed tokens
+    corpus.vocabs = {name: Vocab(map(intern, values)) for name, values in header['vocabs'].items()}
+    arrays = {key: buf[offset:offset + count * _itemsize(typecode)].cast(typecode)
+              for key, (typecode, offset, count) in header['arrays'].items()}
+    corpus.columns = {name: arrays['column:' + name] for name in corpus.column_names}
+    corpus.sent_offsets = arrays['sent_offsets']
+    corpus.para_offsets = arrays['para_offsets']
+    corpus.doc_offsets = arrays['doc_offsets']
+    corpus.extras = {idx: tuple(tuple(pair) for pair in pairs) for idx, pairs in header['extras']}
+    corpus.sent_info = [tuple(info) for info in header['sent_info']]
+    corpus.sids = ["{}-{}-{}".format(*info) for info in corpus.sent_info]
+    corpus.paras = header['paras']
+    corpus.docs = header['docs']
+    return corpus
+
+
+def _itemsize(typecode):
+    return array(typecode).itemsize
+
+
+# -------------------------------------------------------------------------------
+# Source checks
+# -------------------------------------------------------------------------------
+
+def source_info(scxml, path, with_hash=True):
+    ''' [path, size, mtime_ns, sha1] of a source file '''
+    abspath = scxml.files.abspath(path)
+    st = os.stat(abspath)
+    return [path, st.st_size, st.st_mtime_ns, file_hash(abspath) if with_hash else None]
+
+
+def is_fresh(header, scxml, resolved=False):
+    ''' Check that a cache header matches the sources of scxml, this version of pysemcor and the normaliser rules
+        resolved: also require the synsetIDs of sensekeys, i.e. a cache built without WordNet is out of date
+    '''
+    if header.get('format') != FORMAT_VERSION or header.get('version') != PARSER_VERSION:
+        return False
+    if resolved and not header.get('resolved'):
+        return False
+    if header.get('byteorder') != sys.byteorder or header.get('raw') != scxml.raw:
+        return False
+    if header.get('rules') != rules_digest():
+        return False
+    sources = header['sources']
+    if sorted(s[0] for s in sources) != sorted(scxml.files):
+        return False
+    for path, size, mtime_ns, sha1 in sources:
+        try:
+            current = source_info(scxml, path, with_hash=False)
+        except OSError:
+            return False
+        if current[1] != size:
+            return False
+        # a touched file (e.g. after a checkout) is still fine if its content did not change
+        if current[2] != mtime_ns and file_hash(scxml.files.abspath(path)) != sha1:
+            return False
+    return True
+
+
+# -------------------------------------------------------------------------------
+# Reading & writing
+# -------------------------------------------------------------------------------
+
+def build_cache(scxml, path, resolver=None):
+    ''' Parse all source files of scxml and write them to a cache at path
+        With a resolver, the synsetIDs of all sensekeys are resolved and stored as well
+    '''
+    getLogger().info("Building corpus cache {}".format(path))
+    corpus = SemcorCorpus(ALL_COLUMNS)
+    sources = []
+    for f in scxml.files:
+        sources.append(source_info(scxml, f))
+        corpus.add_document(f, scxml.iterparse_source(f))
+    sk_map = {}
+    unknown = []
+    if resolver is not None:
+        sensekeys = [fix_sensekey(sk) for sk in corpus.vocabs['sk'].values[1:]]
+        resolver.prefetch(sensekeys)
+        for sk in sensekeys:
+            sid = resolver.resolve(sk)
+            if sid is not None:
+                sk_map[sk] = sid
+            elif resolver.is_unknown(sk):
+                unknown.append(sk)
+    header = {'format': FORMAT_VERSION, 'version': PARSER_VERSION, 'byteorder': sys.byteorder,
+              'root': scxml.root, 'raw': scxml.raw, 'rules': rules_digest(),
+              'sources': sources, 'sk_map': sk_map, 'unknown': unknown, 'resolved': resolver is not None}
+    write_corpus(corpus, path, header)
+    return corpus
+
+
+def write_corpus(corpus, path, header):
+    ''' Write a corpus and header (a dict) to path, the file is replaced atomically '''
+    arrays = {'column:' + name: corpus.columns[name] for name in corpus.column_names}
+    arrays['sent_offsets'] = corpus.sent_offsets
+    arrays['para_offsets'] = corpus.para_offsets
+    arrays['doc_offsets'] = corpus.doc_offsets
+    header = dict(header, columns=corpus.column_names,
+                  vocabs={name: corpus.vocabs[name].values[1:] for name in corpus.column_names},
+                  extras=sorted(corpus.extras.items()), sent_info=corpus.sent_info,
+                  paras=corpus.paras, docs=corpus.docs, arrays={})
+    # array offsets are relative to the (aligned) end of the header
+    layout = {}
+    offset = 0
+    for key, a in arrays.items():
+        layout[key] = [a.typecode, offset, len(a)]
+        offset = _align(offset + a.itemsize * len(a))
+    header['arrays'] = layout
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    data_start = _align(len(MAGIC) + _HEADER_SIZE.size + len(header_bytes))
+    with atomic_write(path, 'wb') as outfile:
+        outfile.write(MAGIC)
+        outfile.write(_HEADER_SIZE.pack(len(header_bytes)))
+        outfile.write(header_bytes)
+        for key, a in arrays.items():
+            outfile.write(b'\0' * (data_start + layout[key][1] - outfile.tell()))
+            outfile.write(a.tobytes())
+
+
+def _align(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def read_header(mm):
+    ''' Return the header of a cache and the position of its first array '''
+    if mm[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a pysemcor cache")
+    start = len(MAGIC) + _HEADER_SIZE.size
+    length, = _HEADER_SIZE.unpack(mm[len(MAGIC):start])
+    return json.loads(mm[start:start + length].decode('utf-8')), _align(start + length)
+
+
+def open_cache(path, scxml=None, resolved=False):
+    ''' Open a cache file, return None if it does not exist, is invalid or (when scxml is given) is out of date (see is_fresh()) '''
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'rb') as infile:
+        try:
+            mm = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+            header, data_start = read_header(mm)
+        except (ValueError, OSError) as e:
+            getLogger().warning("Cannot read corpus cache {}: {}".format(path, e))
+            return None
+    if scxml is not None and not is_fresh(header, scxml, resolved=resolved):
+        getLogger().info("Corpus cache {} is out of date".format(path))
+        return None
+    return SemcorCache(path, header, memoryview(mm)[data_start:])
+
+
+def full_corpus(scxml):
+    ''' The corpus at the root of scxml without its file filters and shard
+        A cache always holds all files, so that runs with different filters share it instead of overwriting it.
+    '''
+    from .semcorxml import SemcorXML
+    return SemcorXML(scxml.root, raw=scxml.raw, listing=scxml.files.listing)
+
+
+def wordnet_available():
+    ''' Check (once per process) that WordNet can be opened, so that build_resolved_cache() resolves sensekeys '''
+    global _wordnet_available
+    if _wordnet_available is None:
+        try:
+            with get_wordnet().ctx() as wnctx:
+                wnctx.select_scalar('SELECT 1 FROM senses LIMIT 1')
+            _wordnet_available = True
+        except (sqlite3.Error, OSError):
+            _wordnet_available = False
+    return _wordnet_available
+
+
+def build_resolved_cache(scxml, path):
+    ''' Build the cache of scxml with the synsetIDs of its sensekeys (see build_cache())
+        When WordNet cannot be opened, the cache is built without them.
+    '''
+    try:
+        with get_wordnet().ctx() as wnctx:
+            resolver = SenseKeyResolver(wnctx, preload=True)
+            return build_cache(scxml, path, resolver)
+    except (sqlite3.Error, OSError) as e:
+        getLogger().warning("Sensekeys are not resolved in corpus cache {} (WordNet is not available: {})".format(path, e))
+    return build_cache(scxml, path)
+
+
+# opened caches (path => SemcorCache), so that each process maps a cache only once
+_caches = {}
+# whether WordNet can be opened in this process (see wordnet_available())
+_wordnet_available = None
+
+
+def load_cache(scxml):
+    ''' Return the cache of scxml (see SemcorXML.cache), it is (re)built when missing or out of date
+        The cache holds the whole corpus at the root of scxml (see full_corpus()), it is checked once per SemcorXML.
+        A cache built without WordNet is rebuilt once WordNet is available.
+    '''
+    if scxml._cache is not None:
+        return scxml._cache
+    path = os.path.abspath(os.path.expanduser(scxml.cache))
+    source = full_corpus(scxml)
+    resolved = wordnet_available()
+    cache = _caches.get(path)
+    if cache is None or not is_fresh(cache.header, source, resolved=resolved):
+        cache = open_cache(path, source, resolved=resolved)
+        if cache is None:
+            build_resolved_cache(source, path)
+            cache = open_cache(path)
+        _caches[path] = cache
+    scxml._cache = cache
+    return cache
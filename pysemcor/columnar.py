@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+
+'''
+Token-level columnar export of Semcor (Parquet, Arrow or TSV)
+Latest version can be found at https://github.com/letuananh/pysemcor
+
+References:
+    Python documentation:
+        https://docs.python.org/
+    PEP 0008 - Style Guide for Python Code
+        https://www.python.org/dev/peps/pep-0008/
+    PEP 257 - Python Docstring Conventions:
+        https://www.python.org/dev/peps/pep-0257/
+
+@author: Le Tuan Anh <tuananh.ke@gmail.com>
+'''
+
+# Copyright (c) 2017, Le Tuan Anh <tuananh.ke@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+__author__ = "Le Tuan Anh"
+__email__ = "<tuananh.ke@gmail.com>"
+__copyright__ = "Copyright 2017, pysemcor"
+__license__ = "MIT"
+__maintainer__ = "Le Tuan Anh"
+__version__ = "0.1"
+__status__ = "Prototype"
+__credits__ = []
+
+########################################################################
+
+import os
+import re
+import logging
+from operator import attrgetter
+from importlib.util import find_spec
+
+from .semcorxml import run_tasks, get_wordnet, detokenize_texts, fix_sensekey, is_nonsense, _init_ttl_worker, _resolving_worker
+from .sensekeys import SenseKeyResolver
+from .manifest import atomic_write
+from .jsonio import open_file, compress_stream, compression_of, strip_compression
+
+# -------------------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------------------
+
+PARQUET = 'parquet'
+ARROW = 'arrow'
+TSV = 'tsv'
+FORMATS = (PARQUET, ARROW, TSV)
+# one row per token, cfrom/cto are the offsets of the token in the sentence text (as in TTL)
+COLUMNS = ('sid', 'widx', 'text', 'lemma', 'pos', 'sk', 'synset', 'rdf', 'ot', 'cfrom', 'cto')
+INT_COLUMNS = ('widx', 'cfrom', 'cto')
+# tokens are written in batches (row groups of Parquet files, record batches of Arrow files) of this size
+ROW_GROUP_SIZE = 1 << 16
+# TSV: None is written as an empty field, these characters are escaped
+_TSV_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+_TSV_ESCAPED = re.compile(r'\\[\\tnr]')
+# the fields of a row that come from a TokenInfo (its slots, so that no get() call is needed)
+_token_fields = attrgetter('text', '_lemma', '_pos', '_sk', '_rdf', '_ot')
+_TSV_UNESCAPES = {'\\\\': '\\', '\\t': '\t', '\\n': '\n', '\\r': '\r'}
+
+
+def getLogger():
+    return logging.getLogger(__name__)
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ValueError("Parquet and Arrow outputs require the pyarrow package (pip install pyarrow)")
+    return pyarrow
+
+
+def default_format():
+    ''' Parquet when pyarrow is installed, TSV otherwise '''
+    return PARQUET if find_spec('pyarrow') is not None else TSV
+
+
+def format_of(path):
+    ''' Format of an output file from its extension (compressed files are TSV), or None '''
+    ext = os.path.splitext(strip_compression(path))[1][1:]
+    if ext in ('arrow', 'feather'):
+        return ARROW
+    return ext if ext in FORMATS else None
+
+
+# -------------------------------------------------------------------------------
+# Rows
+# -------------------------------------------------------------------------------
+
+def token_spans(text, texts):
+    ''' (cfrom, cto) of each token text in a sentence text, found the way ttl.Sentence.import_tokens() does '''
+    text = text.lower()
+    spans = []
+    cfrom = 0
+    for token in texts:
+        to_find = token.lower()
+        start = text.find(to_find, cfrom)
+        if to_find in ('``', "''", '`', "'"):
+            # quotes may have been normalised by detokenize()
+            quote = '"' if len(to_find) == 2 else "'"
+            start_q = text.find(quote, cfrom)
+            if start_q > -1 and (start == -1 or start > start_q):
+                to_find = quote
+                start = start_q
+        if start == -1:
+            raise LookupError('Cannot find token `{}` in sent `{}` from {}'.format(token, text, cfrom))
+        cto = start + len(to_find)
+        spans.append((start, cto))
+        cfrom = cto - 1
+    return spans
+
+
+def sentence_token_rows(sent, rows, with_nonsense=True, resolver=None):
+    ''' Append one row per token of a sentence dict (see SemcorXML.iterparse()) to rows
+        Sensekeys are fixed, dropped and resolved as in to_ttl(), synset is None when there is no resolver
+    '''
+    tokens = sent['tokens']
+    sid = sent['sid']
+    fields = [_token_fields(t) for t in tokens]
+    sensekeys = []
+    for text, lemma, _, sk, rdf, _ in fields:
+        sk = fix_sensekey(sk)
+        sensekeys.append(sk if sk and (with_nonsense or not is_nonsense(text if lemma is None else lemma, sk, rdf)) else None)
+    if resolver is not None:
+        resolver.prefetch(sensekeys)
+    spans = token_spans(detokenize_texts([f[0] for f in fields]), [f[0] for f in fields])
+    for widx, ((text, lemma, pos, _, rdf, ot), sk, (cfrom, cto)) in enumerate(zip(fields, sensekeys, spans)):
+        synset = resolver.resolve(sk) if sk and resolver is not None else None
+        rows.append((sid, widx, text, lemma, pos, sk, synset, rdf, ot, cfrom, cto))
+
+
+def file_token_rows(inpath, scxml, with_nonsense=True, resolver=None, where=None):
+    ''' Token rows of all sentences of a file (see sentence_token_rows()) '''
+    rows = []
+    for sent in scxml.iterparse(inpath, where):
+        sentence_token_rows(sent, rows, with_nonsense, resolver)
+    return rows
+
+
+def _file_token_rows_worker(inpath, scxml, with_nonsense, where=None):
+    ''' Return the rows of a file and what the worker's resolver learnt (see semcorxml._resolving_worker()) '''
+    rows, resolved = _resolving_worker(file_token_rows, inpath, scxml, with_nonsense, where=where)
+    return (rows,) + resolved
+
+
+# -------------------------------------------------------------------------------
+# Writers
+# -------------------------------------------------------------------------------
+
+class TokenTableWriter(object):
+
+    ''' Write token rows (see COLUMNS) to a Parquet, Arrow IPC or TSV file in batches of row_group_size rows
+        The format is taken from the extension of path (.parquet, .arrow/.feather, .tsv[.gz|.xz|.zst]) unless it is given.
+        The file is written atomically (see manifest.atomic_write()), only one batch is kept in memory.
+    '''
+
+    def __init__(self, path, fmt=None, row_group_size=ROW_GROUP_SIZE):
+        self.path = path
+        self.format = fmt or format_of(path) or default_format()
+        if self.format not in FORMATS:
+            raise ValueError("Unknown format: {} (expected one of {})".format(self.format, ', '.join(FORMATS)))
+        if self.format != TSV:
+            _pyarrow()
+        elif compression_of(path) is None and format_of(path) is None:
+            getLogger().warning("{} is written as TSV".format(path))
+        self.row_group_size = row_group_size
+        self.rows = 0
+        self.batches = 0
+        self._batch = []
+        self._context = None
+        self._outfile = None
+        self._stream = None
+        self._schema = None
+        self._writer = None
+
+    def open(self):
+        self._context = atomic_write(self.path, 'wb')
+        self._outfile = self._context.__enter__()
+        if self.format == TSV:
+            self._stream = compress_stream(self._outfile, compression_of(self.path))
+            self._stream.write(('\t'.join(COLUMNS) + '\n').encode('utf-8'))
+        else:
+            pa = _pyarrow()
+            self._schema = self.schema()
+            if self.format == PARQUET:
+                import pyarrow.parquet as pq
+                self._writer = pq.ParquetWriter(self._outfile, self._schema)
+            else:
+                self._writer = pa.ipc.new_file(self._outfile, self._schema)
+        return self
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._context.__exit__(exc_type, exc_value, traceback)
+
+    @staticmethod
+    def schema():
+        pa = _pyarrow()
+        return pa.schema([(name, pa.int32() if name in INT_COLUMNS else pa.string()) for name in COLUMNS])
+
+    def write_rows(self, rows):
+        batch = self._batch
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.row_group_size:
+                self.flush()
+                batch = self._batch
+
+    def flush(self):
+        ''' Write the current batch '''
+        if not self._batch:
+            return
+        if self.format == TSV:
+            lines = []
+            tabs = len(COLUMNS) - 1
+            for row in self._batch:
+                line = '\t'.join(['' if v is None else v if v.__class__ is str else str(v) for v in row])
+                if line.count('\t') != tabs or '\n' in line or '\r' in line or '\\' in line:
+                    # rare, values are only escaped when needed
+                    line = '\t'.join(['' if v is None else v.translate(_TSV_ESCAPES) if v.__class__ is str else str(v) for v in row])
+                lines.append(line)
+            lines.append('')
+            self._stream.write('\n'.join(lines).encode('utf-8'))
+        else:
+            pa = _pyarrow()
+            # one column at a time, a row group of Parquet or a record batch of Arrow
+            columns = [pa.array(values, type=field.type) for values, field in zip(zip(*self._batch), self._schema)]
+            self._writer.write_table(pa.Table.from_arrays(columns, schema=self._schema))
+        self.rows += len(self._batch)
+        self.batches += 1
+        self._batch = []
+
+    def close(self):
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+        elif self._stream is not self._outfile:
+            self._stream.close()
+        self._context.__exit__(None, None, None)
+
+    def __repr__(self):
+        return "TokenTableWriter({}, format={}, rows={})".format(repr(self.path), self.format, self.rows)
+
+
+def read_tsv(path):
+    ''' Yield the rows of a TSV token table (a dict per token, empty fields are None and int columns are ints) '''
+    with open_file(path, 'rt', newline='\n') as infile:
+        columns = infile.readline().rstrip('\n').split('\t')
+        for line in infile:
+            row = {}
+            for name, value in zip(columns, line.rstrip('\n').split('\t')):
+                if not value:
+                    value = None
+                elif '\\' in value:
+                    value = _TSV_ESCAPED.sub(lambda m: _TSV_UNESCAPES[m.group(0)], value)
+                if value is not None and name in INT_COLUMNS:
+                    value = int(value)
+                row[name] = value
+            yield row
+
+
+# -------------------------------------------------------------------------------
+# Export
+# -------------------------------------------------------------------------------
+
+def export_tokens(scxml, writer, limit=None, with_nonsense=True, jobs=1, resolver=None, preload=True, where=None):
+    ''' Stream the tokens of all files of scxml (a SemcorXML) into writer (a TokenTableWriter), in file order
+        Only one file per worker and one batch of rows are kept in memory.
+        Sensekeys are resolved as in SemcorXML.convert_to_ttl(), where: a SentenceFilter
+        Return a list of (path, error) for the files that could not be exported
+    '''
+    if resolver is None:
+        resolver = SenseKeyResolver()
+    files = scxml.files[:limit] if limit else list(scxml.files)
+    scxml.seed_resolver(resolver)
+    if jobs == 1:
+        with get_wordnet().ctx() as wnctx:
+            resolver.wnctx = wnctx
+            if preload and not resolver.preloaded:
+                resolver.preload()
+            try:
+                return run_tasks(file_token_rows, [(f, scxml, with_nonsense, resolver, where) for f in files],
+                                 on_result=lambda task, rows: writer.write_rows(rows))
+            finally:
+                resolver.wnctx = None
+
+    def _done(task, result):
+        rows, resolved = result[0], result[1:]
+        resolver.merge(*resolved)
+        writer.write_rows(rows)
+    return run_tasks(_file_token_rows_worker, [(f, scxml, with_nonsense, where) for f in files], jobs=jobs,
+                     initializer=_init_ttl_worker, initargs=(resolver.sk_map, resolver.unknown, preload), on_result=_done)
@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+
+'''
+Columnar in-memory Semcor corpus
+Latest version can be found at https://github.com/letuananh/pysemcor
+
+References:
+    Python documentation:
+        https://docs.python.org/
+    PEP 0008 - Style Guide for Python Code
+        https://www.python.org/dev/peps/pep-0008/
+    PEP 257 - Python Docstring Conventions:
+        https://www.python.org/dev/peps/pep-0257/
+
+@author: Le Tuan Anh <tuananh.ke@gmail.com>
+'''
+
+# Copyright (c) 2017, Le Tuan Anh <tuananh.ke@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+__author__ = "Le Tuan Anh"
+__email__ = "<tuananh.ke@gmail.com>"
+__copyright__ = "Copyright 2017, pysemcor"
+__license__ = "MIT"
+__maintainer__ = "Le Tuan Anh"
+__version__ = "0.1"
+__status__ = "Prototype"
+__credits__ = []
+
+########################################################################
+
+import logging
+from array import array
+from bisect import bisect_right
+from itertools import compress
+
+from .semcorxml import TokenInfo, make_sentence
+
+# -------------------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------------------
+
+# token attributes that are stored as columns of vocab IDs
+COLUMNS = ('tag', 'text', 'lemma', 'pos', 'sk', 'rdf', 'ot')
+# all token attributes, enough to rebuild the sentences of SemcorXML.iterparse()
+ALL_COLUMNS = ('text',) + TokenInfo.FIELDS
+# typecodes of vocab ID columns and of offset arrays
+ID_TYPE = 'i'
+OFFSET_TYPE = 'q'
+# paragraphs never continue from a previous document
+_NO_PARA = object()
+
+
+def getLogger():
+    return logging.getLogger(__name__)
+
+
+# -------------------------------------------------------------------------------
+# Data structures
+# -------------------------------------------------------------------------------
+
+class Vocab(object):
+
+    ''' Two-way mapping between strings and integer IDs, ID 0 is reserved for missing values (None) '''
+
+    def __init__(self, values=()):
+        self.values = [None]
+        self.ids = {None: 0}
+        for value in values:
+            self.add(value)
+
+    def add(self, value):
+        ''' Return the ID of value, a new ID is assigned if value has not been seen before '''
+        idx = self.ids.get(value)
+        if idx is None:
+            idx = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return idx
+
+    def get(self, value, default=None):
+        ''' Return the ID of value or default if value is not in this vocab '''
+        return self.ids.get(value, default)
+
+    def decode(self, ids):
+        values = self.values
+        return [values[i] for i in ids]
+
+    def __getitem__(self, idx):
+        return self.values[idx]
+
+    def __contains__(self, value):
+        return value in self.ids
+
+    def __len__(self):
+        return len(self.values)
+
+    def __repr__(self):
+        return "Vocab(size={})".format(len(self))
+
+
+class SentenceView(object):
+
+    ''' A sentence of a SemcorCorpus, its columns are memoryview slices of the corpus columns (no copy) '''
+
+    __slots__ = ('corpus', 'idx', 'start', 'end')
+
+    def __init__(self, corpus, idx):
+        self.corpus = corpus
+        self.idx = idx
+        self.start = corpus.sent_offsets[idx]
+        self.end = corpus.sent_offsets[idx + 1]
+
+    @property
+    def sid(self):
+        return self.corpus.sids[self.idx]
+
+    @property
+    def doc(self):
+        return self.corpus.docs[self.corpus.doc_of(self.idx)]
+
+    @property
+    def para(self):
+        return self.corpus.paras[self.corpus.para_of(self.idx)]
+
+    def column(self, name):
+        ''' Vocab IDs of a column for the tokens of this sentence '''
+        return memoryview(self.corpus.columns[name])[self.start:self.end]
+
+    def values(self, name):
+        ''' Decoded values of a column for the tokens of this sentence '''
+        return self.corpus.vocabs[name].decode(self.column(name))
+
+    @property
+    def tokens(self):
+        return [self.corpus.token(i) for i in range(self.start, self.end)]
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __repr__(self):
+        return "SentenceView(sid={}, tokens={})".format(repr(self.sid), len(self))
+
+
+class SemcorCorpus(object):
+
+    ''' Semcor tokens stored column-wise in memory
+        Each token attribute in columns (COLUMNS by default) is an array of IDs into a Vocab (0 = missing value).
+        Rare attributes which TokenInfo keeps in its overflow dict are stored in extras (token index => pairs).
+        Sentences, paragraphs and documents are given by offset arrays:
+            sent_offsets[i]:i+1 are the tokens of sentence i,
+            para_offsets[j]:j+1 are the sentences of paragraph j and
+            doc_offsets[k]:k+1 are the sentences of document k.
+        Views returned by sentence() share memory with the columns, so no sentence can be added while they are in use.
+    '''
+
+    def __init__(self, columns=COLUMNS):
+        self.column_names = tuple(columns)
+        self.vocabs = {name: Vocab() for name in self.column_names}
+        self.columns = {name: array(ID_TYPE) for name in self.column_names}
+        self.extras = {}
+        self.sids = []
+        # (filename, para, snum) of each sentence
+        self.sent_info = []
+        self.paras = []
+        self.docs = []
+        self.sent_offsets = array(OFFSET_TYPE, [0])
+        self.para_offsets = array(OFFSET_TYPE, [0])
+        self.doc_offsets = array(OFFSET_TYPE, [0])
+
+    @staticmethod
+    def from_semcor(scxml, limit=None, columns=COLUMNS):
+        ''' Build a corpus from the files of a SemcorXML object '''
+        corpus = SemcorCorpus(columns)
+        for f in scxml.files if not limit else scxml.files[:limit]:
+            corpus.add_document(f, scxml.iterparse(f))
+        getLogger().debug("Loaded {}".format(corpus))
+        return corpus
+
+    def add_document(self, name, sents):
+        ''' Add a document from sentence dicts (see SemcorXML.iterparse()) '''
+        self.docs.append(name)
+        self.doc_offsets.append(self.doc_offsets[-1])
+        para = _NO_PARA
+        for sent in sents:
+            if sent['para'] != para:
+                para = sent['para']
+                self.paras.append(para)
+                self.para_offsets.append(self.para_offsets[-1])
+            self._add_sentence(sent)
+            self.para_offsets[-1] = self.doc_offsets[-1] = len(self.sids)
+
+    def _add_sentence(self, sent):
+        tokens = sent['tokens']
+        start = self.sent_offsets[-1]
+        for name in self.column_names:
+            add = self.vocabs[name].add
+            if name == 'text':
+                self.columns[name].extend(add(t.text) for t in tokens)
+            else:
+                self.columns[name].extend(add(t.get(name)) for t in tokens)
+        for idx, t in enumerate(tokens):
+            if t.extra:
+                self.extras[start + idx] = tuple(t.extra.items())
+        self.sids.append(sent['sid'])
+        self.sent_info.append((sent['filename'], sent['para'], sent['snum']))
+        self.sent_offsets.append(start + len(tokens))
+
+    # ---------------------------------------------------------------------------
+    # Access
+    # ---------------------------------------------------------------------------
+
+    def __len__(self):
+        ''' Number of tokens '''
+        return self.sent_offsets[-1]
+
+    @property
+    def sentence_count(self):
+        return len(self.sids)
+
+    def sentence(self, idx):
+        if idx < 0:
+            idx += len(self.sids)
+        if not 0 <= idx < len(self.sids):
+            raise IndexError("Sentence index out of range: {}".format(idx))
+        return SentenceView(self, idx)
+
+    def sentences(self, start=0, end=None):
+        for idx in range(start, len(self.sids) if end is None else end):
+            yield SentenceView(self, idx)
+
+    def document(self, idx):
+        ''' Sentences of a document '''
+        return self.sentences(self.doc_offsets[idx], self.doc_offsets[idx + 1])
+
+    def paragraph(self, idx):
+        ''' Sentences of a paragraph '''
+        return self.sentences(self.para_offsets[idx], self.para_offsets[idx + 1])
+
+    def sentence_of(self, token_idx):
+        ''' Index of the sentence that contains a token '''
+        return bisect_right(self.sent_offsets, token_idx) - 1
+
+    def para_of(self, sent_idx):
+        return bisect_right(self.para_offsets, sent_idx) - 1
+
+    def doc_of(self, sent_idx):
+        return bisect_right(self.doc_offsets, sent_idx) - 1
+
+    def token(self, idx):
+        ''' Decode a token to a dict of its (non-empty) attributes '''
+        token = {}
+        for name in self.column_names:
+            value = self.vocabs[name][self.columns[name][idx]]
+            if value is not None:
+                token[name] = value
+        return token
+
+    def iterparse(self, doc):
+        ''' Yield the sentences of a document (a path in the source FileSet) as SemcorXML.iterparse() does
+            The corpus must have been built with ALL_COLUMNS.
+        '''
+        if 'text' not in self.columns or not set(TokenInfo.FIELDS).issubset(self.columns):
+            raise ValueError("Sentences can only be rebuilt from a corpus with all token attributes (ALL_COLUMNS)")
+        columns = [(self.vocabs[name].values, self.columns[name]) for name in ('text',) + TokenInfo.FIELDS]
+        extras = self.extras
+        from_fields = TokenInfo.from_fields
+        idx = self.docs.index(doc)
+        sent_offsets = self.sent_offsets
+        for sent_idx in range(self.doc_offsets[idx], self.doc_offsets[idx + 1]):
+            start, end = sent_offsets[sent_idx], sent_offsets[sent_idx + 1]
+            # decode column by column, then build the tokens row by row
+            rows = zip(*[map(values.__getitem__, column[start:end]) for values, column in columns])
+            tokens = [from_fields(row[0], row[1:], extras.get(i)) for i, row in enumerate(rows, start)]
+            yield make_sentence(*self.sent_info[sent_idx], tokens)
+
+    def values(self, name, indices):
+        ''' Decode a column at the given token indices '''
+        column = self.columns[name]
+        return self.vocabs[name].decode(column[i] for i in indices)
+
+    # ---------------------------------------------------------------------------
+    # Filtering
+    # ---------------------------------------------------------------------------
+
+    def where(self, **conditions):
+        ''' Return the indices (an array) of tokens which match all conditions, e.g. where(pos='VB', sk=True)
+            A condition is a value, a collection of values (any of them), True (has a value) or None (no value).
+        '''
+        indices = None
+        for name, cond in conditions.items():
+            column = self.columns[name]
+            vocab = self.vocabs[name]
+            if cond is True:
+                pred = None
+            elif cond is None or cond is False:
+                pred = (0).__eq__
+            elif isinstance(cond, str):
+                pred = vocab.get(cond, -1).__eq__
+            else:
+                pred = {vocab.get(v, -1) for v in cond}.__contains__
+            if indices is None:
+                # scan the whole column
+                selectors = column if pred is None else map(pred, column)
+                indices = array(OFFSET_TYPE, compress(range(len(column)), selectors))
+            else:
+                selectors = (column[i] for i in indices) if pred is None else (pred(column[i]) for i in indices)
+                indices = array(OFFSET_TYPE, compress(indices, selectors))
+            if not indices:
+                break
+        return indices if indices is not None else array(OFFSET_TYPE, range(len(self)))
+
+    def count(self, name, indices=None):
+        ''' Count the values of a column (optionally only at the given token indices), most common first '''
+        column = self.columns[name]
+        counts = {}
+        for i in column if indices is None else (column[i] for i in indices):
+            counts[i] = counts.get(i, 0) + 1
+        vocab = self.vocabs[name]
+        return [(vocab[i], c) for i, c in sorted(counts.items(), key=lambda x: -x[1])]
+
+    @property
+    def nbytes(self):
+        ''' Size of the column and offset arrays in bytes '''
+        arrays = list(self.columns.values()) + [self.sent_offsets, self.para_offsets, self.doc_offsets]
+        return sum(a.itemsize * len(a) for a in arrays)
+
+    def __repr__(self):
+        return "SemcorCorpus(docs={}, sentences={}, tokens={})".format(len(self.docs), len(self.sids), len(self))
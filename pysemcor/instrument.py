@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+
+'''
+Optional per-stage instrumentation of the conversion pipeline
+Latest version can be found at https://github.com/letuananh/pysemcor
+
+References:
+    Python documentation:
+        https://docs.python.org/
+    PEP 0008 - Style Guide for Python Code
+        https://www.python.org/dev/peps/pep-0008/
+    PEP 257 - Python Docstring Conventions:
+        https://www.python.org/dev/peps/pep-0257/
+
+@author: Le Tuan Anh <tuananh.ke@gmail.com>
+'''
+
+# Copyright (c) 2017, Le Tuan Anh <tuananh.ke@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+__author__ = "Le Tuan Anh"
+__email__ = "<tuananh.ke@gmail.com>"
+__copyright__ = "Copyright 2017, pysemcor"
+__license__ = "MIT"
+__maintainer__ = "Le Tuan Anh"
+__version__ = "0.1"
+__status__ = "Prototype"
+__credits__ = []
+
+########################################################################
+
+import json
+import time
+import logging
+from contextlib import contextmanager
+
+# -------------------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------------------
+
+# stages
+ITERPARSE = 'iterparse'
+TO_TTL = 'to_ttl'
+SENSEKEYS = 'sensekeys'
+WRITE = 'write'
+STAGES = (ITERPARSE, TO_TTL, SENSEKEYS, WRITE)
+# profilers
+CPROFILE = 'cprofile'
+TRACEMALLOC = 'tracemalloc'
+PROFILE_TOP = 30
+
+# the active Recorder, None when instrumentation is disabled
+# hooks only test this global, so a disabled pipeline runs the same code as before
+recorder = None
+
+
+def getLogger():
+    return logging.getLogger(__name__)
+
+
+# -------------------------------------------------------------------------------
+# Data structures
+# -------------------------------------------------------------------------------
+
+def _new_counts():
+    return {'calls': 0, 'seconds': 0.0, 'sentences': 0, 'tokens': 0}
+
+
+def _add_counts(target, source):
+    for k, v in source.items():
+        target[k] = target.get(k, 0) + v
+
+
+def _token_count(sent):
+    ''' Tokens of a sentence dict or of a TTL sentence '''
+    if isinstance(sent, dict):
+        return len(sent.get('tokens', ()))
+    try:
+        return len(sent)
+    except TypeError:
+        return 0
+
+
+class Recorder(object):
+
+    ''' Counts, cumulative time and tokens of each stage, in total and per file
+        profile: a stage to run under a profiler (CPROFILE or TRACEMALLOC, see profiler)
+    '''
+
+    def __init__(self, profile=None, profiler=CPROFILE):
+        self.stages = {}
+        self.files = {}
+        self.profile = profile
+        self.profiler = profiler
+        self._prof = None
+        self._peak = 0
+        self._caches = self.cache_info()
+        self._worker_caches = {}
+        self._end_caches = None
+        self.stopped = None
+        self.started = time.perf_counter()
+        if profile:
+            self._start_profiler()
+
+    # ---- profiling ----
+    def _start_profiler(self):
+        if self.profiler == TRACEMALLOC:
+            import tracemalloc
+            tracemalloc.start(10)
+            self._prof = tracemalloc
+        else:
+            import cProfile
+            self._prof = cProfile.Profile()
+
+    def _profiling(self, stage):
+        return self._prof is not None and stage == self.profile
+
+    def _enter(self):
+        if self.profiler == TRACEMALLOC:
+            self._prof.reset_peak()
+            self._base = self._prof.get_traced_memory()[0]
+        else:
+            self._prof.enable()
+
+    def _exit(self):
+        if self.profiler == TRACEMALLOC:
+            self._peak = max(self._peak, self._prof.get_traced_memory()[1] - self._base)
+        else:
+            self._prof.disable()
+
+    # ---- recording ----
+    def add(self, stage, seconds, path=None, calls=1, sentences=0, tokens=0, **counters):
+        ''' Record a call of a stage, counters are summed as they are '''
+        delta = {'calls': calls, 'seconds': seconds, 'sentences': sentences, 'tokens': tokens}
+        delta.update(counters)
+        _add_counts(self.stages.setdefault(stage, _new_counts()), delta)
+        if path is not None:
+            _add_counts(self.files.setdefault(path, {}).setdefault(stage, _new_counts()), delta)
+
+    def iterate(self, stage, iterable, path=None):
+        ''' Yield from iterable, the time spent producing each sentence is recorded as stage '''
+        it = iter(iterable)
+        perf_counter = time.perf_counter
+        profiling = self._profiling(stage)
+        while True:
+            if profiling:
+                self._enter()
+            started = perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            finally:
+                seconds = perf_counter() - started
+                if profiling:
+                    self._exit()
+            self.add(stage, seconds, path, sentences=1, tokens=_token_count(item))
+            yield item
+
+    def timed(self, stage, func, path=None, count_sentence=True):
+        ''' Wrap func so that each call is recorded as stage (the first argument is the sentence when count_sentence) '''
+        perf_counter = time.perf_counter
+        profiling = self._profiling(stage)
+
+        def _timed(*args, **kwargs):
+            if profiling:
+                self._enter()
+            started = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                seconds = perf_counter() - started
+                if profiling:
+                    self._exit()
+                if count_sentence:
+                    self.add(stage, seconds, path, sentences=1, tokens=_token_count(args[0]))
+                else:
+                    self.add(stage, seconds, path)
+        return _timed
+
+    @contextmanager
+    def measure(self, stage, path=None, **counters):
+        ''' Record the block as one call of stage '''
+        profiling = self._profiling(stage)
+        if profiling:
+            self._enter()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            if profiling:
+                self._exit()
+            self.add(stage, seconds, path, **counters)
+
+    # ---- results ----
+    @staticmethod
+    def cache_info():
+        from .semcorxml import fix_token_text
+        info = fix_token_text.cache_info()
+        return {'fix_token_text': {'hits': info.hits, 'misses': info.misses}}
+
+    def snapshot(self):
+        ''' Picklable state, to be merged into the recorder of another process (see merge()) '''
+        caches = {}
+        for name, now in (self._end_caches or self.cache_info()).items():
+            before = self._caches.get(name, {})
+            caches[name] = {k: v - before.get(k, 0) for k, v in now.items()}
+            _add_counts(caches[name], self._worker_caches.get(name, {}))
+        return {'stages': self.stages, 'files': self.files, 'caches': caches}
+
+    def merge(self, snapshot):
+        for stage, counts in snapshot['stages'].items():
+            _add_counts(self.stages.setdefault(stage, _new_counts()), counts)
+        for path, stages in snapshot['files'].items():
+            for stage, counts in stages.items():
+                _add_counts(self.files.setdefault(path, {}).setdefault(stage, _new_counts()), counts)
+        for name, counts in snapshot['caches'].items():
+            _add_counts(self._worker_caches.setdefault(name, {}), counts)
+
+    @staticmethod
+    def _rates(counts):
+        counts = dict(counts)
+        if counts.get('seconds'):
+            counts['tokens_per_sec'] = round(counts['tokens'] / counts['seconds'], 1)
+            counts['sentences_per_sec'] = round(counts['sentences'] / counts['seconds'], 1)
+        if 'lookups' in counts:
+            counts['hit_rate'] = round(1 - counts.get('misses', 0) / counts['lookups'], 4) if counts['lookups'] else None
+        return counts
+
+    def report(self):
+        caches = self.snapshot()['caches']
+        for counts in caches.values():
+            total = counts['hits'] + counts['misses']
+            counts['hit_rate'] = round(counts['hits'] / total, 4) if total else None
+        result = {'elapsed': round((self.stopped or time.perf_counter()) - self.started, 4),
+                  'stages': {stage: self._rates(counts) for stage, counts in self.stages.items()},
+                  'caches': caches,
+                  'files': {path: {stage: self._rates(counts) for stage, counts in stages.items()}
+                            for path, stages in self.files.items()}}
+        if self._prof is not None:
+            result['profile'] = self.profile_report()
+        return result
+
+    def profile_report(self):
+        report = {'stage': self.profile, 'profiler': self.profiler}
+        if self.profiler == TRACEMALLOC:
+            report['peak_bytes'] = self._peak
+            snapshot = self._prof.take_snapshot()
+            report['top'] = [{'line': str(stat.traceback[0]), 'bytes': stat.size, 'count': stat.count}
+                             for stat in snapshot.statistics('lineno')[:PROFILE_TOP]]
+        else:
+            import pstats
+            # nothing is profiled when the stage only ran in worker processes
+            stats = pstats.Stats(self._prof).stats if self._prof.getstats() else {}
+            rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:PROFILE_TOP]
+            report['top'] = [{'function': "{}:{}({})".format(*func), 'calls': nc, 'tottime': round(tt, 4), 'cumtime': round(ct, 4)}
+                             for func, (cc, nc, tt, ct, callers) in rows]
+        return report
+
+    def dump(self, path):
+        with open(path, 'w', encoding='utf-8') as outfile:
+            json.dump(self.report(), outfile, indent=1)
+
+    def stop(self):
+        ''' Stop the clock and the cache counters (see disable()) '''
+        self.stopped = time.perf_counter()
+        self._end_caches = self.cache_info()
+
+    def close(self):
+        if self._prof is not None and self.profiler == TRACEMALLOC:
+            self._prof.stop()
+
+
+# -------------------------------------------------------------------------------
+# Switches
+# -------------------------------------------------------------------------------
+
+def enable(profile=None, profiler=CPROFILE):
+    ''' Start recording, return the new active Recorder '''
+    global recorder
+    recorder = Recorder(profile=profile, profiler=profiler)
+    return recorder
+
+
+def disable():
+    ''' Stop recording, return the Recorder that was active '''
+    global recorder
+    rec, recorder = recorder, None
+    if rec is not None:
+        rec.stop()
+    return rec
+
+
+def _recorded_task(func, *args):
+    ''' Call func(*args) in a worker process with a fresh Recorder, return the result and the recorder snapshot '''
+    rec = enable()
+    try:
+        result = func(*args)
+    finally:
+        disable()
+    return result, rec.snapshot()
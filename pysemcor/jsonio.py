@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+
+'''
+Reading and writing (compressed) JSON-lines files
+Latest version can be found at https://github.com/letuananh/pysemcor
+
+References:
+    Python documentation:
+        https://docs.python.org/
+    PEP 0008 - Style Guide for Python Code
+        https://www.python.org/dev/peps/pep-0008/
+    PEP 257 - Python Docstring Conventions:
+        https://www.python.org/dev/peps/pep-0257/
+
+@author: Le Tuan Anh <tuananh.ke@gmail.com>
+'''
+
+# Copyright (c) 2017, Le Tuan Anh <tuananh.ke@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+__author__ = "Le Tuan Anh"
+__email__ = "<tuananh.ke@gmail.com>"
+__copyright__ = "Copyright 2017, pysemcor"
+__license__ = "MIT"
+__maintainer__ = "Le Tuan Anh"
+__version__ = "0.1"
+__status__ = "Prototype"
+__credits__ = []
+
+########################################################################
+
+import os
+import io
+import json
+import gzip
+import lzma
+import logging
+from contextlib import contextmanager
+
+from .manifest import atomic_write
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# -------------------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------------------
+
+GZIP = 'gz'
+XZ = 'xz'
+ZSTD = 'zst'
+COMPRESSIONS = (GZIP, XZ, ZSTD)
+# lines are encoded into a buffer which is written (and compressed) in chunks of this size
+WRITE_BUFFER_SIZE = 1 << 20
+GZIP_LEVEL = 6
+XZ_PRESET = 3
+ZSTD_LEVEL = 10
+# JSON encoders: the standard library keeps the historical byte format, orjson is faster but compact
+STDLIB = 'json'
+ORJSON = 'orjson'
+ENCODERS = (STDLIB, ORJSON)
+# the encoder is read from the environment so that worker processes use the same one
+ENCODER_ENV = 'PYSEMCOR_JSON_ENCODER'
+_encoder = os.environ.get(ENCODER_ENV, STDLIB)
+
+
+def getLogger():
+    return logging.getLogger(__name__)
+
+
+# -------------------------------------------------------------------------------
+# Encoding
+# -------------------------------------------------------------------------------
+
+def encoder():
+    ''' Name of the JSON encoder used by dumps() '''
+    return _encoder
+
+
+def set_encoder(name):
+    ''' Select the JSON encoder used by dumps() in this process and in the worker processes it starts '''
+    global _encoder
+    if name not in ENCODERS:
+        raise ValueError("Unknown JSON encoder {} (expected one of {})".format(name, ', '.join(ENCODERS)))
+    if name == ORJSON and orjson is None:
+        raise ValueError("orjson is not installed")
+    _encoder = os.environ[ENCODER_ENV] = name
+
+
+def dumps(obj, ensure_ascii=True):
+    ''' Encode obj as one line of JSON (bytes, without the newline)
+        The default encoder produces the same bytes as json.dumps(), orjson (see set_encoder) writes compact UTF-8 and ignores ensure_ascii
+    '''
+    if _encoder == ORJSON:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=ensure_ascii).encode('utf-8')
+
+
+def loads(line):
+    return orjson.loads(line) if orjson is not None else json.loads(line)
+
+
+# -------------------------------------------------------------------------------
+# Files
+# -------------------------------------------------------------------------------
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("zstd compression requires the zstandard package (pip install zstandard)")
+    return zstandard
+
+
+def compression_of(path):
+    ''' Compression of a file (GZIP, XZ, ZSTD) from its extension, or None '''
+    ext = os.path.splitext(path)[1][1:]
+    return ext if ext in COMPRESSIONS else None
+
+
+def compressed_name(path, compression=None):
+    if compression is None:
+        return path
+    if compression not in COMPRESSIONS:
+        raise ValueError("Unknown compression: {} (expected one of {})".format(compression, ', '.join(COMPRESSIONS)))
+    return path + '.' + compression
+
+
+def strip_compression(path):
+    ''' Path without its compression extension, e.g. br-a01.json.gz => br-a01.json '''
+    return os.path.splitext(path)[0] if compression_of(path) else path
+
+
+def open_file(path, mode='rb', **kwargs):
+    ''' Open a file which may be compressed (detected from the extension), for reading or writing
+        Text modes decode/encode UTF-8 by default
+    '''
+    if 't' in mode:
+        kwargs.setdefault('encoding', 'utf-8')
+    compression = compression_of(path)
+    if compression == GZIP:
+        return gzip.open(path, mode, **kwargs)
+    elif compression == XZ:
+        return lzma.open(path, mode, **kwargs)
+    elif compression == ZSTD:
+        return _zstandard().open(path, mode, **kwargs)
+    return open(path, mode, **kwargs)
+
+
+def compress_stream(outfile, compression=None):
+    ''' Wrap a binary output stream with a compressor, the compressed bytes do not depend on the file name or time '''
+    if compression is None:
+        return outfile
+    elif compression == GZIP:
+        return gzip.GzipFile(filename='', mode='wb', fileobj=outfile, compresslevel=GZIP_LEVEL, mtime=0)
+    elif compression == XZ:
+        return lzma.LZMAFile(outfile, 'wb', preset=XZ_PRESET)
+    elif compression == ZSTD:
+        return _zstandard().ZstdCompressor(level=ZSTD_LEVEL).stream_writer(outfile, closefd=False)
+    raise ValueError("Unknown compression: {}".format(compression))
+
+
+def read_jsonl(path):
+    ''' Yield the records of a JSON-lines file (which may be compressed), blank lines are skipped '''
+    with open_file(path, 'rb') as infile:
+        for line in infile:
+            if line.strip():
+                yield loads(line)
+
+
+class JsonLinesWriter(object):
+
+    ''' Write records as JSON lines to a binary stream, in large chunks '''
+
+    def __init__(self, outfile, ensure_ascii=True, buffer_size=WRITE_BUFFER_SIZE):
+        self.outfile = outfile
+        self.ensure_ascii = ensure_ascii
+        self.buffer_size = buffer_size
+        self.buffer = io.BytesIO()
+        self.lines = 0
+
+    def write(self, record):
+        self.write_encoded(dumps(record, self.ensure_ascii))
+
+    def write_encoded(self, line):
+        ''' Write a record which was encoded with dumps() already '''
+        buf = self.buffer
+        buf.write(line)
+        buf.write(b'\n')
+        self.lines += 1
+        if buf.tell() >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer.tell():
+            self.outfile.write(self.buffer.getvalue())
+            self.buffer.seek(0)
+            self.buffer.truncate()
+
+
+@contextmanager
+def jsonl_writer(path, ensure_ascii=True):
+    ''' Write a JSON-lines file atomically (see manifest.atomic_write()), compressed according to its extension
+        Yield a JsonLinesWriter
+    '''
+    compression = compression_of(path)
+    with atomic_write(path, 'wb') as outfile:
+        stream = compress_stream(outfile, compression)
+        writer = JsonLinesWriter(stream, ensure_ascii=ensure_ascii)
+        yield writer
+        writer.flush()
+        if stream is not outfile:
+            stream.close()
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+'''
+Build manifest and atomic file writing for incremental conversions
+Latest version can be found at https://github.com/letuananh/pysemcor
+
+References:
+    Python documentation:
+        https://docs.python.org/
+    PEP 0008 - Style Guide for Python Code
+        https://www.python.org/dev/peps/pep-0008/
+    PEP 257 - Python Docstring Conventions:
+        https://www.python.org/dev/peps/pep-0257/
+
+@author: Le Tuan Anh <tuananh.ke@gmail.com>
+'''
+
+# Copyright (c) 2017, Le Tuan Anh <tuananh.ke@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+__author__ = "Le Tuan Anh"
+__email__ = "<tuananh.ke@gmail.com>"
+__copyright__ = "Copyright 2017, pysemcor"
+__license__ = "MIT"
+__maintainer__ = "Le Tuan Anh"
+__version__ = "0.1"
+__status__ = "Prototype"
+__credits__ = []
+
+########################################################################
+
+import os
+import json
+import hashlib
+import logging
+from contextlib import contextmanager
+
+# -------------------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------------------
+
+# the manifest is kept in the root folder of the outputs
+MANIFEST_NAME = '.manifest.json'
+# suffix of the temporary files of atomic_write(), FileSet does not list them
+TMP_SUFFIX = '.tmp'
+
+
+def getLogger():
+    return logging.getLogger(__name__)
+
+
+# -------------------------------------------------------------------------------
+# Files
+# -------------------------------------------------------------------------------
+
+def file_hash(path):
+    ''' SHA-1 of the content of a file '''
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as infile:
+        for chunk in iter(lambda: infile.read(1 << 20), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+@contextmanager
+def atomic_write(path, mode='w', **kwargs):
+    ''' Open a temporary file next to path, it replaces path only when the block completes
+        So path is never left truncated, it holds either the previous or the new content.
+    '''
+    dirpath = os.path.dirname(os.path.abspath(path))
+    os.makedirs(dirpath, exist_ok=True)
+    tmp_path = "{}.{}{}".format(path, os.getpid(), TMP_SUFFIX)
+    try:
+        with open(tmp_path, mode, **kwargs) as outfile:
+            yield outfile
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def is_complete_jsonl(path):
+    ''' Check that a JSON-lines file (which may be compressed) was written completely
+        (it ends with a newline and every line is valid)
+    '''
+    from .jsonio import open_file
+    try:
+        with open_file(path, 'rb') as infile:
+            line = b''
+            for line in infile:
+                json.loads(line)
+            return line.endswith(b'\n')
+    except (OSError, EOFError, ValueError):
+        return False
+
+
+def read_manifest(path):
+    ''' Return the entries of a manifest file ({} when it does not exist or cannot be read) '''
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with open(path, encoding='utf-8') as infile:
+            return json.load(infile)
+    except ValueError as e:
+        getLogger().warning("Ignored unreadable manifest {}: {}".format(path, e))
+        return {}
+
+
+# -------------------------------------------------------------------------------
+# Data structures
+# -------------------------------------------------------------------------------
+
+class BuildManifest(object):
+
+    ''' Records how each output under root was built: {output path: record}
+        A record holds the hash of the input file, the conversion options and the versions of the code
+        (see SemcorXML.build_record()), an output is up to date when its record has not changed.
+        The manifest is saved after each update, so a crash loses at most the files being converted.
+    '''
+
+    def __init__(self, root, name=MANIFEST_NAME):
+        ''' name: file name of the manifest, shards use their own (see pysemcor.shard.manifest_name())
+            and start from the entries of the main manifest
+        '''
+        self.root = root
+        self.path = os.path.join(root, name)
+        self.entries = {}
+        if name != MANIFEST_NAME:
+            self.entries.update(read_manifest(os.path.join(root, MANIFEST_NAME)))
+        self.entries.update(read_manifest(self.path))
+
+    def is_current(self, output, record):
+        return record is not None and self.entries.get(output) == record and os.path.isfile(os.path.join(self.root, output))
+
+    def update(self, output, record, save=True):
+        self.entries[output] = record
+        if save:
+            self.save()
+
+    def save(self):
+        with atomic_write(self.path, encoding='utf-8') as outfile:
+            json.dump(self.entries, outfile, indent=1, sort_keys=True)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return "BuildManifest({}, entries={})".format(repr(self.path), len(self))
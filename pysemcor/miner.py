@@ -48,7 +48,9 @@ __credits__ = []
 
 import logging
 
-from chirptext import header, Counter
+from chirptext import header
+
+from .stats import StatsEngine, RdfValues, ranked
 
 # -------------------------------------------------------------------------------
 # Configuration
@@ -61,29 +63,16 @@ logger = logging.getLogger(__name__)
 # Application logic
 # -------------------------------------------------------------------------------
 
-def mine_rdf_values(sc, limit=None):
-    ot_values = set()
-    rdf_counter = Counter()
-    rdf_with_key_counter = Counter()
-    for f in sc.files if not limit else sc.files[:limit]:
-        for sj in sc.iterparse(f):
-            for t in sj['tokens']:
-                if 'rdf' in t:
-                    l = t['lemma'] if 'lemma' in t else t.text
-                    r = t['rdf']
-                    sk = t['sk'] if 'sk' in t else ''
-                    item = (l, r, sk)
-                    rdf_counter.count(item)
-                    if sk:
-                        rdf_with_key_counter.count(item)
-                if 'ot' in t:
-                    ot_values.add(t['ot'])
+def mine_rdf_values(sc, limit=None, jobs=1):
+    rdf_values = RdfValues()
+    StatsEngine(rdf_values).run(sc, limit=limit, jobs=jobs)
     header("RDF values")
-    for k, v in rdf_counter.most_common():
+    for k, v in ranked(rdf_values.rdf):
         print("{}: {}".format(k, v))
     header("RDF values (with valid keys)")
-    for k, v in rdf_with_key_counter.most_common():
+    for k, v in ranked(rdf_values.rdf_with_key):
         print("{}: {}".format(k, v))
     header("OT values")
-    for o in ot_values:
+    for o, _ in ranked(rdf_values.ot):
         print(o)
+    return rdf_values
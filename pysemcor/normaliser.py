@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+'''
+Rule-based text normaliser (token texts and detokenised sentences)
+Latest version can be found at https://github.com/letuananh/pysemcor
+
+References:
+    Python documentation:
+        https://docs.python.org/
+    PEP 0008 - Style Guide for Python Code
+        https://www.python.org/dev/peps/pep-0008/
+    PEP 257 - Python Docstring Conventions:
+        https://www.python.org/dev/peps/pep-0257/
+
+@author: Le Tuan Anh <tuananh.ke@gmail.com>
+'''
+
+# Copyright (c) 2017, Le Tuan Anh <tuananh.ke@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+__author__ = "Le Tuan Anh"
+__email__ = "<tuananh.ke@gmail.com>"
+__copyright__ = "Copyright 2017, pysemcor"
+__license__ = "MIT"
+__maintainer__ = "Le Tuan Anh"
+__version__ = "0.1"
+__status__ = "Prototype"
+__credits__ = []
+
+########################################################################
+
+import os
+import re
+import json
+import logging
+
+# -------------------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------------------
+
+MY_DIR = os.path.dirname(os.path.realpath(__file__))
+RULES_FILE = os.path.join(MY_DIR, 'data', 'normaliser.json')
+
+
+def getLogger():
+    return logging.getLogger(__name__)
+
+
+# -------------------------------------------------------------------------------
+# Data structures
+# -------------------------------------------------------------------------------
+
+def overlaps(a, b):
+    ''' True if a and b can share characters in a text (one contains the other or they overlap at an edge) '''
+    if a in b or b in a:
+        return True
+    for k in range(1, min(len(a), len(b))):
+        if a.endswith(b[:k]) or b.endswith(a[:k]):
+            return True
+    return False
+
+
+def trigger_chars(patterns):
+    ''' Pick a small set of characters so that every pattern contains at least one of them '''
+    todo = [set(p) for p in patterns]
+    chosen = set()
+    while todo:
+        counts = {}
+        for chars in todo:
+            for c in chars:
+                counts[c] = counts.get(c, 0) + 1
+        best = max(sorted(counts), key=counts.get)
+        chosen.add(best)
+        todo = [chars for chars in todo if best not in chars]
+    return chosen
+
+
+class Normaliser(object):
+
+    ''' Apply a list of (old, new) replacements in order, like chained str.replace() calls
+        Consecutive rules which cannot see each other's input or output are merged into a stage,
+        a stage is applied in a single pass with one alternation regex.
+        So the result is always the same as applying the rules one by one.
+        Texts which contain no trigger character (at least one character of every pattern) are returned as they are.
+    '''
+
+    def __init__(self, rules):
+        self.rules = [(old, new) for old, new in rules]
+        self.stages = []
+        stage = []
+        for old, new in self.rules:
+            if not old:
+                raise ValueError("Empty pattern in normaliser rules")
+            # a rule must not match the patterns or the replacements of the current stage
+            if any(overlaps(old, o) or not n or overlaps(old, n) for o, n in stage):
+                self.stages.append(self._compile(stage))
+                stage = []
+            stage.append((old, new))
+        if stage:
+            self.stages.append(self._compile(stage))
+        self.triggers = trigger_chars(old for old, new in self.rules)
+        self._gate = re.compile('[{}]'.format(re.escape(''.join(sorted(self.triggers))))).search if self.triggers else None
+
+    @staticmethod
+    def _compile(stage):
+        if len(stage) == 1:
+            return stage[0]
+        table = dict(stage)
+        pattern = re.compile('|'.join(re.escape(old) for old, new in stage))
+        return pattern, lambda m: table[m.group()]
+
+    def __call__(self, text):
+        if self._gate is None or not self._gate(text):
+            return text
+        for old, new in self.stages:
+            if old.__class__ is str:
+                text = text.replace(old, new)
+            else:
+                text = old.sub(new, text)
+        return text
+
+    def __repr__(self):
+        return "Normaliser(rules={}, stages={})".format(len(self.rules), len(self.stages))
+
+
+def load_rules(path=RULES_FILE):
+    ''' Read normaliser rules from a JSON file: {"token": [[old, new], ...], "sentence": [[old, new], ...]} '''
+    with open(path, encoding='utf-8') as infile:
+        return json.load(infile)
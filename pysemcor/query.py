@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+
+'''
+Inverted index of Semcor tokens by sensekey, synsetID, lemma and POS
+Latest version can be found at https://github.com/letuananh/pysemcor
+
+References:
+    Python documentation:
+        https://docs.python.org/
+    PEP 0008 - Style Guide for Python Code
+        https://www.python.org/dev/peps/pep-0008/
+    PEP 257 - Python Docstring Conventions:
+        https://www.python.org/dev/peps/pep-0257/
+
+@author: Le Tuan Anh <tuananh.ke@gmail.com>
+'''
+
+# Copyright (c) 2017, Le Tuan Anh <tuananh.ke@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+__author__ = "Le Tuan Anh"
+__email__ = "<tuananh.ke@gmail.com>"
+__copyright__ = "Copyright 2017, pysemcor"
+__license__ = "MIT"
+__maintainer__ = "Le Tuan Anh"
+__version__ = "0.1"
+__status__ = "Prototype"
+__credits__ = []
+
+########################################################################
+
+import os
+import sqlite3
+import logging
+from array import array
+
+from .semcorxml import fix_sensekey
+
+# -------------------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------------------
+
+# indexed token fields
+FIELDS = ('sk', 'synset', 'lemma', 'pos')
+INDEX_VERSION = '1'
+# tokens are packed as sentence number << TOKEN_BITS | token index while the index is built
+TOKEN_BITS = 16
+
+SETUP_SCRIPT = '''
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE source (file TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER);
+CREATE TABLE sentence (id INTEGER PRIMARY KEY, sid TEXT);
+CREATE TABLE term (id INTEGER PRIMARY KEY, field TEXT, value TEXT, freq INTEGER);
+CREATE UNIQUE INDEX term_value ON term (field, value);
+CREATE TABLE posting (term INTEGER, sent INTEGER, token INTEGER, PRIMARY KEY (term, sent, token)) WITHOUT ROWID;
+'''
+
+
+def getLogger():
+    return logging.getLogger(__name__)
+
+
+# -------------------------------------------------------------------------------
+# Data structures
+# -------------------------------------------------------------------------------
+
+class QueryIndex(object):
+
+    ''' An on-disk (SQLite) inverted index: (field, value) => posting list of (sid, token index)
+        Posting lists are stored sorted, so that lookups and intersections (e.g. lemma AND pos) are index scans.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path)
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def exists(self):
+        return os.path.isfile(self.path)
+
+    def is_fresh(self, scxml, synsets=False):
+        ''' Check that the index was built from the current files of scxml
+            synsets: also require the synsetIDs of sensekeys to be indexed
+        '''
+        if not self.exists():
+            return False
+        try:
+            meta = dict(self.conn.execute('SELECT key, value FROM meta'))
+            sources = {row[0]: row[1:] for row in self.conn.execute('SELECT file, size, mtime_ns FROM source')}
+        except sqlite3.DatabaseError:
+            return False
+        if meta.get('version') != INDEX_VERSION or sorted(sources) != sorted(scxml.files):
+            return False
+        if synsets and meta.get('synsets') != 'yes':
+            return False
+        for f, (size, mtime_ns) in sources.items():
+            try:
+                st = os.stat(scxml.files.abspath(f))
+            except OSError:
+                return False
+            if (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+                return False
+        return True
+
+    def build(self, scxml, resolver=None):
+        ''' Index all tokens of scxml in one pass (the previous index is replaced)
+            resolver: a SenseKeyResolver to index the synsetIDs of sensekeys as well
+        '''
+        terms = {}
+        postings = []
+        sids = []
+        sources = []
+        for f in scxml.files:
+            st = os.stat(scxml.files.abspath(f))
+            sources.append((f, st.st_size, st.st_mtime_ns))
+            for sent in scxml.iterparse(f):
+                sent_id = len(sids)
+                sids.append(sent['sid'])
+                sensekeys = [fix_sensekey(t.get('sk')) for t in sent['tokens']]
+                if resolver is not None:
+                    resolver.prefetch(sensekeys)
+                for idx, (t, sk) in enumerate(zip(sent['tokens'], sensekeys)):
+                    pos = sent_id << TOKEN_BITS | idx
+                    values = (sk, resolver.resolve(sk) if sk and resolver is not None else None, t.get('lemma'), t.get('pos'))
+                    for term in zip(FIELDS, values):
+                        if term[1]:
+                            term_id = terms.get(term)
+                            if term_id is None:
+                                term_id = terms[term] = len(postings)
+                                postings.append(array('q'))
+                            postings[term_id].append(pos)
+        tmp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.execute('PRAGMA journal_mode = OFF')
+            conn.execute('PRAGMA synchronous = OFF')
+            with conn:
+                conn.executescript(SETUP_SCRIPT)
+                conn.executemany('INSERT INTO meta VALUES (?, ?)', [('version', INDEX_VERSION), ('root', scxml.root),
+                                                                    ('synsets', 'yes' if resolver is not None else 'no')])
+                conn.executemany('INSERT INTO source VALUES (?, ?, ?)', sources)
+                conn.executemany('INSERT INTO sentence VALUES (?, ?)', enumerate(sids))
+                conn.executemany('INSERT INTO term VALUES (?, ?, ?, ?)',
+                                 ((term_id, field, value, len(postings[term_id])) for (field, value), term_id in terms.items()))
+                mask = (1 << TOKEN_BITS) - 1
+                conn.executemany('INSERT INTO posting VALUES (?, ?, ?)',
+                                 ((term_id, pos >> TOKEN_BITS, pos & mask) for term_id, plist in enumerate(postings) for pos in plist))
+        finally:
+            conn.close()
+        self.close()
+        os.replace(tmp_path, self.path)
+        getLogger().info("Indexed {} terms in {} sentences".format(len(terms), len(sids)))
+
+    def has_synsets(self):
+        ''' Check that the synsetIDs of sensekeys were indexed '''
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'synsets'").fetchone()
+        return row is not None and row[0] == 'yes'
+
+    def _term_ids(self, conditions):
+        ''' Map conditions (field=value) to term IDs, return None if a value does not occur '''
+        term_ids = []
+        for field, value in conditions.items():
+            if field not in FIELDS:
+                raise ValueError("Unknown field: {} (must be one of {})".format(field, ', '.join(FIELDS)))
+            if field == 'synset' and not self.has_synsets():
+                raise ValueError("{} was built without synsetIDs, rebuild it with a sensekey resolver".format(self.path))
+            row = self.conn.execute('SELECT id, freq FROM term WHERE field = ? AND value = ?', (field, value)).fetchone()
+            if row is None:
+                return None
+            term_ids.append(row)
+        # the rarest term first
+        return [term_id for term_id, freq in sorted(term_ids, key=lambda x: x[1])]
+
+    def _query(self, term_ids, columns):
+        ''' Scan the posting list of the first (rarest) term and probe the others by primary key
+            CROSS JOIN keeps this join order in SQLite.
+        '''
+        joins = ''.join(' CROSS JOIN posting AS p{0} ON p{0}.term = ? AND p{0}.sent = hits.sent AND p{0}.token = hits.token'.format(idx)
+                        for idx in range(1, len(term_ids)))
+        return 'SELECT {} FROM posting AS hits{} CROSS JOIN sentence ON sentence.id = hits.sent WHERE hits.term = ?'.format(columns, joins)
+
+    def find(self, limit=None, **conditions):
+        ''' Return the (sid, token index) of all tokens which match every condition, e.g. find(lemma='run', pos='VB') '''
+        if not conditions:
+            raise ValueError("At least one condition is required")
+        term_ids = self._term_ids(conditions)
+        if term_ids is None:
+            return []
+        query = self._query(term_ids, 'sentence.sid, hits.token') + ' ORDER BY hits.sent, hits.token'
+        if limit:
+            query += ' LIMIT {:d}'.format(limit)
+        return self.conn.execute(query, term_ids[1:] + term_ids[:1]).fetchall()
+
+    def count(self, **conditions):
+        ''' Number of tokens which match every condition '''
+        term_ids = self._term_ids(conditions) if conditions else None
+        if term_ids is None:
+            return 0
+        if len(term_ids) == 1:
+            return self.conn.execute('SELECT freq FROM term WHERE id = ?', term_ids).fetchone()[0]
+        return self.conn.execute(self._query(term_ids, 'COUNT(*)'), term_ids[1:] + term_ids[:1]).fetchone()[0]
+
+    def values(self, field, prefix=''):
+        ''' Indexed values of a field (and their frequencies), most frequent first '''
+        return self.conn.execute("SELECT value, freq FROM term WHERE field = ? AND value LIKE ? ESCAPE '\\' ORDER BY freq DESC, value",
+                                 (field, prefix.replace('%', r'\%').replace('_', r'\_') + '%')).fetchall()
+
+    def __repr__(self):
+        return "QueryIndex({})".format(repr(self.path))
+
+
+def query_index(scxml, path=None, resolver=None, rebuild=False):
+    ''' Open the query index of scxml (at its root + '.query.db' by default), build it if it is missing or out of date '''
+    index = QueryIndex(path if path else scxml.root + '.query.db')
+    if rebuild or not index.is_fresh(scxml, synsets=resolver is not None):
+        getLogger().info("Building query index {}".format(index.path))
+        index.build(scxml, resolver=resolver)
+    return index
@@ -47,76 +47,237 @@ __credits__ = []
 ########################################################################
 
 import os
+import re
+import stat
+import time
 import logging
 import json
-
-from lxml import etree
-from bs4 import BeautifulSoup
-
-from chirptext import FileHelper
-from chirptext.leutile import StringTool
-from chirptext import ttl
-from yawlib import SynsetID
-from yawlib.helpers import get_wn
+import hashlib
+from sys import intern
+from operator import attrgetter
+from functools import lru_cache
+from fnmatch import fnmatchcase
+
+from . import sgml
+from . import instrument
+from .sensekeys import SenseKeyResolver
+from .normaliser import Normaliser, load_rules, RULES_FILE
+from .manifest import BuildManifest, atomic_write, file_hash, is_complete_jsonl, TMP_SUFFIX
+from .shard import partition, manifest_name
+from .jsonio import jsonl_writer, compressed_name, dumps, encoder, STDLIB
+
+# Heavy backends (lxml, BeautifulSoup, chirptext's TTL, yawlib and multiprocessing)
+# are imported on first use to keep `import pysemcor` and the CLI fast
 
 # -------------------------------------------------------------------------------
 # Configuration
 # -------------------------------------------------------------------------------
 
-wn = get_wn()
+# WordNet SQL database, opened by get_wordnet() on first use
+wn = None
+# engines for fixing malformed XML files
+STREAM = 'stream'
+SOUP = 'soup'
+# number of distinct token texts to remember in fix_token_text()
+TOKEN_CACHE_SIZE = 65536
+# number of tasks that are queued for each worker process by run_tasks()
+TASKS_PER_WORKER = 4
+# folders modified less than 2s before a scan are not kept in FileSet listings (in ns)
+LISTING_MIN_AGE = 2 * 10 ** 9
+# elements which are tokens of a sentence
+TOKEN_TAGS = ('wf', 'punc')
+# version of the parsed sentences and of the JSON/TTL outputs, recorded in build manifests and caches
+# bump it whenever a code change alters the output of a file, so that existing outputs are rebuilt
+OUTPUT_VERSION = 2
 
 
 def getLogger():
     return logging.getLogger(__name__)
 
 
+def get_wordnet():
+    ''' Get the WordNet database (yawlib's default WordNet 3.0 SQLite), it is opened on first use '''
+    global wn
+    if wn is None:
+        from yawlib.helpers import get_wn
+        wn = get_wn()
+    return wn
+
+
+def strip(a_str):
+    return a_str.strip() if a_str else ''
+
+
 # -------------------------------------------------------------------------------
 # Data structures
 # -------------------------------------------------------------------------------
 
-class TokenInfo:
-
-    def __init__(self, text, **kwargs):
-        self.text = text
-        self.__data = dict(kwargs)
+class TokenInfo(object):
+
+    ''' A Semcor token (text + attributes)
+        The common Semcor attributes are stored in fixed slots, rare ones (e.g. dc, sep) in a small overflow dict.
+        All strings are interned, so the repeated values (done, NN, wf, 1, ...) are shared by all tokens.
+        Memory use (CPython 3.11, 64-bit): a token object takes 128 bytes (+184 bytes when it has an overflow dict).
+        With shared strings, a parsed corpus costs ~170 bytes per token in total (tokens, texts, values and
+        sentence lists) versus ~530 bytes with the previous dict-backed TokenInfo.
+        Attributes are listed in a canonical order: XML attributes sorted by name, then tag and sk.
+    '''
+
+    # XML attributes (sorted by name) and attributes created by the parser
+    ATTRIBUTES = ('cmd', 'lemma', 'lexsn', 'ot', 'pn', 'pos', 'rdf', 'wnsn')
+    EXTRA_FIELDS = ('tag', 'sk')
+    FIELDS = ATTRIBUTES + EXTRA_FIELDS
+    __slots__ = ('text', '_extra') + tuple('_' + f for f in FIELDS)
+
+    def __init__(self, text, *, cmd=None, lemma=None, lexsn=None, ot=None, pn=None, pos=None, rdf=None,
+                 wnsn=None, tag=None, sk=None, **extra):
+        self.text = intern(text) if text else text
+        self._cmd = intern(cmd) if cmd else cmd
+        self._lemma = intern(lemma) if lemma else lemma
+        self._lexsn = intern(lexsn) if lexsn else lexsn
+        self._ot = intern(ot) if ot else ot
+        self._pn = intern(pn) if pn else pn
+        self._pos = intern(pos) if pos else pos
+        self._rdf = intern(rdf) if rdf else rdf
+        self._wnsn = intern(wnsn) if wnsn else wnsn
+        self._tag = intern(tag) if tag else tag
+        self._sk = intern(sk) if sk else sk
+        self._extra = None
+        if extra:
+            for k, v in extra.items():
+                self[k] = v
+
+    @classmethod
+    def from_fields(cls, text, values, extra=None):
+        ''' Create a token from the values of FIELDS (in that order) without interning them again
+            extra: (key, value) pairs of other attributes
+        '''
+        token = cls.__new__(cls)
+        token.text = text
+        (token._cmd, token._lemma, token._lexsn, token._ot, token._pn, token._pos, token._rdf, token._wnsn,
+         token._tag, token._sk) = values
+        token._extra = None
+        if extra:
+            for k, v in extra:
+                token[k] = v
+        return token
 
     def __contains__(self, key):
-        return key in self.__data
+        slot = _TOKEN_SLOTS.get(key)
+        if slot is not None:
+            return slot.__get__(self) is not None
+        return self._extra is not None and key in self._extra
 
     def __getitem__(self, key):
-        return self.__data[key]
+        slot = _TOKEN_SLOTS.get(key)
+        if slot is not None:
+            value = slot.__get__(self)
+            if value is None:
+                raise KeyError(key)
+            return value
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
 
     def get(self, key, default=None):
-        return self[key] if key in self else default
+        slot = _TOKEN_SLOTS.get(key)
+        if slot is not None:
+            value = slot.__get__(self)
+            return default if value is None else value
+        return default if self._extra is None else self._extra.get(key, default)
 
     def __setitem__(self, key, value):
-        self.__data[key] = value
+        if value.__class__ is str:
+            value = intern(value)
+        slot = _TOKEN_SLOTS.get(key)
+        if slot is not None:
+            slot.__set__(self, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[intern(key)] = value
 
     @property
     def data(self):
-        return self.__data.items()
+        items = [(k, v) for k, v in zip(TokenInfo.ATTRIBUTES, _TOKEN_ATTRIBUTE_GETTER(self)) if v is not None]
+        if self._extra:
+            items.extend(self._extra.items())
+            items.sort(key=lambda item: item[0])
+        if self._tag is not None:
+            items.append(('tag', self._tag))
+        if self._sk is not None:
+            items.append(('sk', self._sk))
+        return items
+
+    @property
+    def extra(self):
+        ''' Attributes which are stored in the overflow dict (None if there is none) '''
+        return self._extra
 
     @property
     def lemma(self):
-        return self['lemma'] if 'lemma' in self else self.text
+        return self._lemma if self._lemma is not None else self.text
 
     def to_json(self):
-        data = dict(self.__data)
+        data = dict(self.data)
         data['text'] = self.text
         return data
 
+    def __getstate__(self):
+        return (self.text, self.data)
+
+    def __setstate__(self, state):
+        self.__init__(state[0], **dict(state[1]))
+
     def __repr__(self):
-        return "{}:{}".format(self.text, self.__data)
+        return "{}:{}".format(self.text, dict(self.data))
 
     def __str__(self):
-        return "{}:{}".format(self.text, self.__data)
+        return "{}:{}".format(self.text, dict(self.data))
+
+
+# slot descriptors of TokenInfo fields
+_TOKEN_SLOTS = {f: getattr(TokenInfo, '_' + f) for f in TokenInfo.FIELDS}
+_TOKEN_ATTRIBUTE_GETTER = attrgetter(*('_' + f for f in TokenInfo.ATTRIBUTES))
+
+
+def compile_patterns(patterns):
+    ''' Patterns of FileSet filters: globs, or regular expressions when they start with re: '''
+    if not patterns:
+        return ()
+    if isinstance(patterns, (str, re.Pattern)):
+        patterns = (patterns,)
+    return tuple(re.compile(p[3:]) if isinstance(p, str) and p.startswith('re:') else p for p in patterns)
+
+
+def match_pattern(pattern, path):
+    ''' A glob without / is matched against the file name, other globs against the relative path
+        and regular expressions are searched in the relative path
+    '''
+    path = path.replace(os.sep, '/')
+    if not isinstance(pattern, str):
+        return pattern.search(path) is not None
+    return fnmatchcase(path if '/' in pattern else path.rpartition('/')[2], pattern)
 
 
 class FileSet(object):
 
-    def __init__(self, root):
+    ''' Files under root, as paths relative to root
+        add_all() lists a folder with os.scandir() and keeps the size and mtime of its files.
+        include/exclude: patterns of the files that add_all() keeps or drops (see match_pattern())
+        listing: path of a JSON cache of the folder listings, a folder is only scanned again when its mtime changes
+    '''
+
+    def __init__(self, root, include=None, exclude=None, listing=None):
         self.root = root
         self.__files = []
+        self.__stats = {}
+        self.include = compile_patterns(include)
+        self.exclude = compile_patterns(exclude)
+        self.listing = listing
+        self.__listing = None
+        # (index, count) when this set is one shard of a larger set (see shard())
+        self.shard_id = None
 
     @property
     def root(self):
@@ -124,19 +285,75 @@ class FileSet(object):
 
     @root.setter
     def root(self, value):
-        self.__root = FileHelper.abspath(value)
+        self.__root = os.path.abspath(os.path.expanduser(value))
+
+    def accepts(self, path):
+        ''' Check path against the include and exclude patterns '''
+        if self.include and not any(match_pattern(p, path) for p in self.include):
+            return False
+        return not any(match_pattern(p, path) for p in self.exclude)
+
+    def _read_listing(self):
+        if self.__listing is None:
+            self.__listing = {}
+            if self.listing and os.path.isfile(self.listing):
+                try:
+                    with open(self.listing, encoding='utf-8') as infile:
+                        self.__listing = json.load(infile)
+                except ValueError as e:
+                    getLogger().warning("Ignored unreadable listing {}: {}".format(self.listing, e))
+        return self.__listing
+
+    def _save_listing(self):
+        try:
+            with atomic_write(self.listing, encoding='utf-8') as outfile:
+                json.dump(self.__listing, outfile)
+        except OSError as e:
+            getLogger().warning("Could not save listing {}: {}".format(self.listing, e))
+
+    def scan(self, path):
+        ''' Return [name, size, mtime_ns] of the files in folder path (sorted by name), or None if it does not exist
+            Temporary files of outputs which are being written (see manifest.atomic_write) are not listed.
+            The listing cache is used when the folder has not changed since it was scanned.
+        '''
+        folderpath = os.path.join(self.root, path)
+        try:
+            st = os.stat(folderpath)
+        except OSError:
+            return None
+        if not stat.S_ISDIR(st.st_mode):
+            return None
+        listing = self._read_listing() if self.listing else {}
+        cached = listing.get(path)
+        if cached is not None and cached['mtime'] == st.st_mtime_ns:
+            return cached['files']
+        files = []
+        with os.scandir(folderpath) as entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.endswith(TMP_SUFFIX):
+                    info = entry.stat()
+                    files.append([entry.name, info.st_size, info.st_mtime_ns])
+        files.sort()
+        # a folder which changed just now may change again within the same mtime tick, it is not cached yet
+        if self.listing and time.time_ns() - st.st_mtime_ns > LISTING_MIN_AGE:
+            listing[path] = {'mtime': st.st_mtime_ns, 'files': files}
+            self._save_listing()
+        return files
 
     def add_all(self, path):
-        folderpath = os.path.join(self.root, path)
-        if not os.path.isdir(folderpath):
+        files = self.scan(path)
+        if files is None:
             getLogger().warning("Folder {} does not exist".format(path))
         else:
-            files = FileHelper.get_child_files(folderpath)
-            for f in files:
-                self.add(os.path.join(path, f))
+            for name, size, mtime in files:
+                f = os.path.join(path, name)
+                if self.accepts(f):
+                    self.add(f, size, mtime)
 
-    def add(self, path):
+    def add(self, path, size=None, mtime=None):
         self.__files.append(path)
+        if size is not None:
+            self.__stats[path] = (size, mtime)
 
     def __getitem__(self, idx):
         return self.__files[idx]
@@ -150,11 +367,123 @@ class FileSet(object):
     def abspath(self, path):
         return path if os.path.isabs(path) else os.path.join(self.root, path)
 
+    def stat(self, path):
+        ''' (size, mtime_ns) of a file as found by add_all(), (0, 0) if the file does not exist '''
+        info = self.__stats.get(path)
+        if info is None:
+            try:
+                st = os.stat(self.abspath(path))
+            except OSError:
+                return (0, 0)
+            info = self.__stats[path] = (st.st_size, st.st_mtime_ns)
+        return info
+
+    def size(self, path):
+        return self.stat(path)[0]
+
+    def mtime(self, path):
+        return self.stat(path)[1]
+
+    @property
+    def total_size(self):
+        return sum(self.size(f) for f in self)
+
+    def largest_first(self, files=None):
+        ''' Return files (all files by default) sorted by size, largest first
+            so that a process pool does not finish with one big file left
+        '''
+        return sorted(self if files is None else files, key=lambda f: (-self.size(f), f))
+
+    def subset(self, files):
+        ''' A FileSet with the same root holding files (in this order) '''
+        subset = FileSet(self.root)
+        for f in files:
+            subset.add(f, *self.stat(f))
+        return subset
+
+    def shard(self, index, count):
+        ''' Return shard index (1-based) of count as a new FileSet
+            Files are balanced by size (see pysemcor.shard.partition()) and keep their order,
+            every machine which lists the same files gets the same shards.
+        '''
+        files = list(self)
+        part = set(partition(files, [self.size(f) for f in files], count)[index - 1])
+        shard = self.subset(f for f in files if f in part)
+        shard.shard_id = (index, count)
+        return shard
+
+
+class SentenceFilter(object):
+
+    ''' Declarative sentence filters of SemcorXML.iterparse() and iter_ttl(), all given conditions must hold
+        documents: patterns of the documents to read (see match_pattern()), matched against the path without extension,
+                   other files are not opened at all
+        tagged: keep sentences with at least one sense tag (a wf with a lemma and a lexsn)
+        pos, ot: keep sentences with at least one token whose pos (or ot, e.g. idiom) is one of these values
+        Token conditions are checked on the raw attributes, before token texts are fixed and TokenInfo objects are created.
+    '''
+
+    def __init__(self, documents=None, tagged=False, pos=None, ot=None):
+        self.documents = compile_patterns(documents)
+        self.tagged = tagged
+        self.pos = frozenset((pos,) if isinstance(pos, str) else pos) if pos else None
+        self.ot = frozenset((ot,) if isinstance(ot, str) else ot) if ot else None
+
+    @property
+    def filters_tokens(self):
+        return bool(self.tagged or self.pos or self.ot)
+
+    def accepts_file(self, path):
+        if not self.documents:
+            return True
+        doc = os.path.splitext(path)[0]
+        return any(match_pattern(p, doc) for p in self.documents)
+
+    def accepts(self, tokens):
+        ''' Check the tokens of a sentence, given as (tag, get) pairs where get(name) returns an attribute value or None
+            e.g. (element.tag, element.get) for lxml elements
+        '''
+        tagged = self.tagged
+        pos = self.pos
+        ot = self.ot
+        for tag, get in tokens:
+            if tag != 'wf' and tag != 'punc':
+                continue
+            if tagged and (get('sk') or (tag == 'wf' and strip(get('lemma')) and strip(get('lexsn')))):
+                tagged = False
+            if pos is not None and get('pos') in pos:
+                pos = None
+            if ot is not None and get('ot') in ot:
+                ot = None
+            if not tagged and pos is None and ot is None:
+                return True
+        return not tagged and pos is None and ot is None
+
+    def __repr__(self):
+        return "SentenceFilter(documents={}, tagged={}, pos={}, ot={})".format(
+            [getattr(p, 'pattern', p) for p in self.documents], self.tagged,
+            sorted(self.pos) if self.pos else None, sorted(self.ot) if self.ot else None)
+
 
 class SemcorXML(object):
 
-    def __init__(self, root):
-        self.files = FileSet(root)
+    def __init__(self, root, raw=False, cache=None, index=None, include=None, exclude=None, listing=None, fused=False):
+        ''' Semcor corpus at root
+            raw: read the original 3rada SGML files directly (no need to run fix_3rada first)
+            cache: path of a binary cache of the parsed corpus, it is built on first use and rebuilt
+                   when the source files change (see pysemcor.cache)
+            index: path of the sentence ID index used by get_sentence() (root + '.sid.db' by default)
+            include, exclude, listing: file filters and listing cache (see FileSet)
+            fused: convert fixed XML straight to TTL sentences (see iterparse_ttl())
+        '''
+        self.raw = raw
+        self.cache = cache
+        self.fused = fused
+        self.index = index
+        self._sid_index = None
+        # the opened cache, see pysemcor.cache.load_cache()
+        self._cache = None
+        self.files = FileSet(root, include=include, exclude=exclude, listing=listing)
         if not os.path.isdir(root):
             getLogger().warning("Root {} does not exist".format(root))
         self.files.add_all('brown1/tagfiles')
@@ -165,116 +494,507 @@ class SemcorXML(object):
     def root(self):
         return self.files.root
 
-    def iterparse(self, path):
-        tree = etree.iterparse(self.files.abspath(path), events=('start', 'end'))
+    def iterparse(self, path, where=None):
+        ''' Yield the sentences of a file as dicts (see make_sentence())
+            where: a SentenceFilter, a file it rejects is not opened
+        '''
+        if where is not None and not where.accepts_file(path):
+            return iter(())
+        if self.cache:
+            from .cache import load_cache
+            sentences = load_cache(self).iterparse(path)
+            if where is not None and where.filters_tokens:
+                sentences = (sent for sent in sentences if where.accepts((t.get('tag'), t.get) for t in sent['tokens']))
+        else:
+            sentences = self.iterparse_source(path, where)
+        rec = instrument.recorder
+        return sentences if rec is None else rec.iterate(instrument.ITERPARSE, sentences, path)
+
+    def iterparse_source(self, path, where=None):
+        ''' Parse a source file (ignore the cache) '''
+        return self.iterparse_raw(path, where) if self.raw else self.iterparse_xml(path, where=where)
+
+    def iterparse_ttl(self, path, with_nonsense=True, resolver=None, where=None):
+        ''' Yield the TTL sentences of a file (see to_ttl())
+            In fused mode sentences are built straight from the XML elements (see element_ttl()),
+            raw files and caches are always read as sentence dicts first.
+        '''
+        if where is not None and not where.accepts_file(path):
+            return
+        rec = instrument.recorder
+        if self.fused and not self.raw and not self.cache:
+            sentences = self.iterparse_xml(path, lambda element, sid: element_ttl(element, sid, with_nonsense, resolver), where)
+            yield from sentences if rec is None else rec.iterate(instrument.TO_TTL, sentences, path)
+        else:
+            convert = to_ttl if rec is None else rec.timed(instrument.TO_TTL, to_ttl, path)
+            for sj in self.iterparse(path, where):
+                yield convert(sj, with_nonsense=with_nonsense, resolver=resolver)
+
+    def iterparse_xml(self, path, build=None, where=None):
+        ''' Yield the sentences of a fixed XML file
+            build(element, sid) creates a sentence from an <s> element (a sentence dict by default)
+            Only the end events of <s> are produced, the filename and paragraph are read from the ancestors.
+            Each sentence is detached from the tree once it is built, together with everything before it,
+            so memory use does not depend on the size of the file.
+            where: a SentenceFilter, the tokens of rejected sentences are not built
+        '''
+        from lxml import etree
+        check = where.accepts if where is not None and where.filters_tokens else None
+        for _, element in etree.iterparse(self.files.abspath(path), events=('end',), tag='s'):
+            if check is not None and not check((token.tag, token.get) for token in element):
+                release(element)
+                continue
+            # the nearest enclosing <p> and <context>
+            ancestors = {}
+            for ancestor in element.iterancestors('p', 'context'):
+                ancestors.setdefault(ancestor.tag, ancestor)
+            filename = ancestors['context'].get('filename') if 'context' in ancestors else 'n/a'
+            para = ancestors['p'].get('pnum') if 'p' in ancestors else 'n/a'
+            snum = element.get('snum')
+            if build is None:
+                sent = make_sentence(filename, para, snum, element_tokens(element))
+            else:
+                sent = build(element, "{}-{}-{}".format(filename, para, snum))
+            release(element)
+            yield sent
+
+    def iterparse_raw(self, path, where=None):
+        ''' Parse an original 3rada SGML file and yield the same sentence dicts as iterparse() '''
+        with open(self.files.abspath(path), encoding='utf-8') as infile:
+            yield from self.parse_raw(infile, where)
+
+    def __getstate__(self):
+        # worker processes open their own index connection and cache
+        return dict(self.__dict__, _sid_index=None, _cache=None)
+
+    @property
+    def sid_index(self):
+        ''' The sentence ID index of this corpus (see pysemcor.sidindex), it is updated on first use '''
+        if self._sid_index is None:
+            from .sidindex import SentenceIndex
+            self._sid_index = SentenceIndex(self.index if self.index else self.root + '.sid.db', self.files)
+        return self._sid_index
+
+    def get_sentence(self, sid):
+        ''' Read one sentence (a dict, see iterparse()) by its ID without parsing the whole file
+            Raise KeyError if sid does not exist
+        '''
+        return self.get_sentences((sid,))[0]
+
+    def get_sentences(self, sids):
+        ''' Read sentences by their IDs, return a list in the same order (raise KeyError if a sid does not exist) '''
+        sids = list(sids)
+        entries = self.sid_index.lookup_many(sids)
+        sentences = {}
+        for sid in sids:
+            if sid in sentences:
+                continue
+            entry = entries.get(sid)
+            if entry is None:
+                raise KeyError(sid)
+            sent = self._read_sentence(entry)
+            if sent['sid'] != sid:
+                # the file was changed after it was indexed
+                self.sid_index.reindex(entry[0])
+                entry = self.sid_index.lookup(sid)
+                sent = self._read_sentence(entry) if entry is not None else None
+                if sent is None or sent['sid'] != sid:
+                    raise KeyError(sid)
+            sentences[sid] = sent
+        return [sentences[sid] for sid in sids]
+
+    def _read_sentence(self, entry):
+        f, filename, para, snum = entry[:4]
+        data = self.sid_index.read(entry)
+        if self.raw:
+            sents = list(self.parse_raw(data.decode('utf-8').splitlines(True)))
+            tokens = sents[0]['tokens'] if sents else []
+        else:
+            from lxml import etree
+            tokens = element_tokens(etree.fromstring(data))
+        return make_sentence(filename, para, snum, tokens)
+
+    @staticmethod
+    def parse_raw(infile, where=None):
+        ''' Parse 3rada SGML lines (a file or a list of lines) and yield sentence dicts
+            where: a SentenceFilter, TokenInfo objects are only created for the sentences it accepts
+        '''
+        check = where.accepts if where is not None and where.filters_tokens else None
         filename = 'n/a'
         para = 'n/a'
-        for event, element in tree:
-            if event == 'start':
-                if element.tag == 'context':
-                    filename = element.get('filename')
-                elif element.tag == 'p':
-                    para = element.get('pnum')
-            if event == 'end':
-                if element.tag == 's':
-                    # found a sentence
-                    snum = element.get('snum')
-                    tokens = []
-                    for token in element:
-                        token_data = dict(token.attrib)
-                        token_data['tag'] = token.tag
-                        text = fix_token_text(token.text)
-                        if token.tag == 'wf':
-                            # create sensekey
-                            lemma = StringTool.strip(token.get('lemma'))
-                            lexsn = StringTool.strip(token.get('lexsn'))
-                            sk = lemma + '%' + lexsn if lemma and lexsn else ''
-                            sk = StringTool.strip(sk.replace('\t', ' ').replace('|', ' '))
-                            if sk:
-                                token_data['sk'] = sk
-                            tokens.append(TokenInfo(text, **token_data))
-                        elif token.tag == 'punc':
-                            tokens.append(TokenInfo(text, **token_data))
-                    element.clear()
-                    s = {'para': para,
-                         'filename': filename,
-                         'snum': snum,
-                         'sid': "{}-{}-{}".format(filename, para, snum),
-                         'tokens': tokens}
-                    yield s
-                elif element.tag == 'p':
+        snum = None
+        # (tag, attributes, text) of the tokens of the current sentence
+        tokens = None
+        # tag, attributes and texts of the token being read
+        current = None
+        for line in sgml.read_lines(infile):
+            if tokens is not None and current is None:
+                # fast path: a line with a complete token
+                m = sgml.match_element(line)
+                if m is not None:
+                    tag = m.group(1).lower()
+                    if tag in TOKEN_TAGS:
+                        tokens.append((tag, dict(sgml.parse_sorted_attrs(m.group(2))), m.group(3)))
+                    continue
+            for kind, value, attrs in sgml.lex_line(line):
+                if kind == sgml.TEXT:
+                    if current is not None and current[2] is not None:
+                        current[2].append(value)
+                    continue
+                if current is not None:
+                    if kind == sgml.START:
+                        # text after a nested element is not a part of the token text
+                        current[2] = None
+                        continue
+                    # an end tag closes the current token, even when it is not </wf> or </punc>
+                    tag = current[0]
+                    if tag in TOKEN_TAGS:
+                        tokens.append((tag, dict(sorted(current[1])), ''.join(current[2]) if current[2] else None))
+                    current = None
+                    if value == tag:
+                        continue
+                if kind == sgml.START:
+                    if value == 'context':
+                        filename = dict(attrs).get('filename')
+                    elif value == 'p':
+                        para = dict(attrs).get('pnum')
+                    elif value == 's':
+                        snum = dict(attrs).get('snum')
+                        tokens = []
+                    elif tokens is not None:
+                        current = [value, attrs, []]
+                elif value == 's':
+                    if tokens is not None and (check is None or check((tag, attrs.get) for tag, attrs, _ in tokens)):
+                        yield make_sentence(filename, para, snum, [make_token(*token) for token in tokens])
+                    tokens = None
+                elif value == 'p':
                     para = 'n/a'
-                    element.clear()
-                elif element.tag == 'context':
+                elif value == 'context':
                     filename = 'n/a'
-                    element.clear()
-
-    def iter_ttl(self, limit=None, with_nonsense=True):
-        sk_map = {}
-        # Convert sentence by sentence to TTL
-        with wn.ctx() as wnctx:
-            for f in self.files[:limit] if limit else self.files:
-                for sj in self.iterparse(f):
-                    s = to_ttl(sj, with_nonsense=with_nonsense, sk_map=sk_map, wnctx=wnctx)
-                    yield s
 
-    def convert_to_ttl(self, ttlset, limit=None, with_nonsense=True):
-        sk_map = {}
-        with wn.ctx() as wnctx:
+    def prepare_cache(self):
+        ''' Open (or build) the cache before files are processed, so that worker processes do not build it again
+            Return the cache or None if this corpus does not use one
+        '''
+        if not self.cache:
+            return None
+        from .cache import load_cache
+        return load_cache(self)
+
+    def iter_ttl(self, limit=None, with_nonsense=True, resolver=None, preload=True, where=None):
+        ''' Convert sentence by sentence to TTL
+            resolver: a SenseKeyResolver to reuse, preload: load the whole sensekey table first
+            where: a SentenceFilter (see iterparse())
+        '''
+        if resolver is None:
+            resolver = SenseKeyResolver()
+        with get_wordnet().ctx() as wnctx:
+            resolver.wnctx = wnctx
+            if preload and not resolver.preloaded:
+                resolver.preload()
             for f in self.files[:limit] if limit else self.files:
-                xml2ttl(f, self, ttlset, with_nonsense=with_nonsense, sk_map=sk_map, wnctx=wnctx)
+                yield from self.iterparse_ttl(f, with_nonsense=with_nonsense, resolver=resolver, where=where)
+            resolver.wnctx = None
+
+    def build_record(self, path, options):
+        ''' Describe how the output of a file is built (see pysemcor.manifest.BuildManifest) '''
+        try:
+            input_hash = file_hash(self.files.abspath(path))
+        except OSError:
+            # the conversion will fail and report the error
+            return None
+        return {'input': input_hash, 'options': options, 'version': OUTPUT_VERSION, 'rules': rules_digest()}
+
+    def plan(self, outset, options, limit=None, resume=False):
+        ''' Find the files whose outputs in outset must be (re)built
+            An output is kept when the manifest shows it was built from the same input with the same options and code.
+            resume: also keep complete outputs that are missing from the manifest (e.g. after a crash) and record them
+            Return the manifest, the files to convert and the records of these files
+        '''
+        manifest = BuildManifest(outset.root, manifest_name(self.files.shard_id))
+        todo = []
+        records = {}
+        for f in self.files[:limit] if limit else self.files:
+            output = output_name(f, options.get('compression'))
+            record = self.build_record(f, options)
+            if manifest.is_current(output, record):
+                print("SKIPPED: {} (up to date)".format(outset.abspath(output)))
+            elif resume and record is not None and output not in manifest.entries and is_complete_jsonl(outset.abspath(output)):
+                print("SKIPPED: {} (resumed)".format(outset.abspath(output)))
+                manifest.update(output, record, save=False)
+            else:
+                todo.append(f)
+                records[f] = record
+        manifest.save()
+        return manifest, todo, records
+
+    def convert_to_json(self, jsonset, limit=None, jobs=1, resume=False, compression=None):
+        ''' Convert all XML files to JSON-lines format
+            Only files which changed since the last conversion are converted again (see plan())
+            compression: None, 'gz', 'xz' or 'zst' (see pysemcor.jsonio)
+            Return a list of (path, error) for the files that could not be converted
+        '''
+        options = {'task': 'json', 'raw': self.raw}
+        if encoder() != STDLIB:
+            options['encoder'] = encoder()
+        if compression:
+            options['compression'] = compression
+        manifest, files, records = self.plan(jsonset, options, limit=limit, resume=resume)
+        if jobs != 1:
+            files = self.files.largest_first(files)
+        self.prepare_cache()
+        return run_tasks(xml2json, [(f, self, jsonset, True, compression) for f in files], jobs=jobs,
+                         on_result=lambda task, result: manifest.update(output_name(task[0], compression), records[task[0]]))
+
+    def seed_resolver(self, resolver):
+        ''' Give resolver the sensekeys which were resolved when the cache was built (if a cache is used) '''
+        cache = self.prepare_cache()
+        if cache is not None:
+            resolver.merge({sk: cache.sk_map.get(sk) for sk in list(cache.sk_map) + list(cache.unknown)})
+
+    def convert_to_ttl(self, ttlset, limit=None, with_nonsense=True, jobs=1, sk_map=None, resolver=None, preload=True, resume=False,
+                       compression=None):
+        ''' Convert all XML files to TTL-JSON format
+            Only files which changed since the last conversion are converted again (see plan())
+            Sensekeys are resolved by resolver (a new SenseKeyResolver using sk_map by default),
+            with preload=True the whole sensekey table is loaded with a single query.
+            When jobs > 1 files are spread across a process pool, each worker has its own WordNet context
+            and resolver, and what the workers resolved is merged back into resolver
+            compression: None, 'gz', 'xz' or 'zst' (see pysemcor.jsonio)
+            Return a list of (path, error) for the files that could not be converted
+        '''
+        if resolver is None:
+            resolver = SenseKeyResolver(sk_map=sk_map)
+        options = {'task': 'ttl', 'raw': self.raw, 'with_nonsense': with_nonsense}
+        if encoder() != STDLIB:
+            options['encoder'] = encoder()
+        if compression:
+            options['compression'] = compression
+        manifest, files, records = self.plan(ttlset, options, limit=limit, resume=resume)
+
+        def _done(task, result):
+            manifest.update(output_name(task[0], compression), records[task[0]])
+            if jobs != 1:
+                resolver.merge(*result)
+        self.seed_resolver(resolver)
+        if jobs == 1:
+            with get_wordnet().ctx() as wnctx:
+                resolver.wnctx = wnctx
+                if preload and not resolver.preloaded:
+                    resolver.preload()
+                tasks = [(f, self, ttlset, with_nonsense, None, None, resolver, True, compression) for f in files]
+                failures = run_tasks(xml2ttl, tasks, on_result=_done)
+                resolver.wnctx = None
+                return failures
+        else:
+            tasks = [(f, self, ttlset, with_nonsense, compression) for f in self.files.largest_first(files)]
+            return run_tasks(_xml2ttl_worker, tasks, jobs=jobs, initializer=_init_ttl_worker,
+                             initargs=(resolver.sk_map, resolver.unknown, preload), on_result=_done)
+
+    def split_to_json(self, writer, limit=None, jobs=1, where=None):
+        ''' Convert all files to JSON sentences and write them to the partitions of writer (a pysemcor.split.SplitWriter)
+            Sentences are written as each file is done and in file order, so the split only depends on the input.
+            Return a list of (path, error) for the files that could not be converted
+        '''
+        files = self.files[:limit] if limit else list(self.files)
+        self.prepare_cache()
+        return run_tasks(json_lines, [(f, self, where) for f in files], jobs=jobs,
+                         on_result=lambda task, lines: write_lines(writer, lines))
+
+    def split_to_ttl(self, writer, limit=None, with_nonsense=True, jobs=1, resolver=None, preload=True, where=None):
+        ''' Convert all files to TTL sentences and write them to the partitions of writer (see split_to_json())
+            Sensekeys are resolved as in convert_to_ttl()
+        '''
+        if resolver is None:
+            resolver = SenseKeyResolver()
+        files = self.files[:limit] if limit else list(self.files)
+        self.seed_resolver(resolver)
+        if jobs == 1:
+            with get_wordnet().ctx() as wnctx:
+                resolver.wnctx = wnctx
+                if preload and not resolver.preloaded:
+                    resolver.preload()
+                failures = run_tasks(ttl_lines, [(f, self, with_nonsense, resolver, where) for f in files],
+                                     on_result=lambda task, lines: write_lines(writer, lines))
+                resolver.wnctx = None
+                return failures
+
+        def _done(task, result):
+            lines, resolved = result[0], result[1:]
+            resolver.merge(*resolved)
+            write_lines(writer, lines)
+        return run_tasks(_ttl_lines_worker, [(f, self, with_nonsense, where) for f in files], jobs=jobs,
+                         initializer=_init_ttl_worker, initargs=(resolver.sk_map, resolver.unknown, preload), on_result=_done)
 
 
 # -------------------------------------------------------------------------------
 # Application logic
 # -------------------------------------------------------------------------------
 
-def xml2json(inpath, scxml, scjson):
-    new_name = FileHelper.getfilename(inpath) + ".json"
-    dir_name = os.path.dirname(inpath)
-    outpath = scjson.abspath(os.path.join(dir_name, new_name))
-    if os.path.isfile(outpath):
+def output_name(inpath, compression=None):
+    ''' Path of the JSON output of an input file (relative to the output FileSet), e.g. br-a01.json or br-a01.json.gz '''
+    return compressed_name(os.path.join(os.path.dirname(inpath), os.path.splitext(os.path.basename(inpath))[0] + ".json"), compression)
+
+
+def xml2json(inpath, scxml, scjson, overwrite=False, compression=None):
+    ''' Convert a semcor file to JSON-lines, an existing output is skipped unless overwrite is True
+        compression: None, 'gz', 'xz' or 'zst' (see pysemcor.jsonio)
+    '''
+    outpath = scjson.abspath(output_name(inpath, compression))
+    if os.path.isfile(outpath) and not overwrite:
         print("SKIPPED: {} (output file exists)".format(outpath))
         return
     else:
         print("Generating: {} => {}".format(inpath, outpath))
-    dirpath = os.path.dirname(outpath)
-    if not os.path.exists(dirpath):
-        os.makedirs(dirpath)
-    with open(outpath, 'wt') as outfile:
+    # the output is renamed into place when it is complete
+    with jsonl_writer(outpath) as writer:
+        write = writer.write
+        rec = instrument.recorder
+        if rec is not None:
+            write = rec.timed(instrument.WRITE, write, inpath)
         for sj in scxml.iterparse(inpath):
             sj['tokens'] = [t.to_json() for t in sj['tokens']]
-            outfile.write(json.dumps(sj))
-            outfile.write("\n")
+            write(sj)
+    return outpath
 
 
-def xml2ttl(inpath, scxml, scttl, with_nonsense=True, sk_map=None, wnctx=None):
+def xml2ttl(inpath, scxml, scttl, with_nonsense=True, sk_map=None, wnctx=None, resolver=None, overwrite=False, compression=None):
     ''' convert all semcor files in XML format to ttl format '''
-    new_name = FileHelper.getfilename(inpath) + ".json"
-    dir_name = os.path.dirname(inpath)
-    outpath = scttl.abspath(os.path.join(dir_name, new_name))
-    if os.path.isfile(outpath):
+    outpath = scttl.abspath(output_name(inpath, compression))
+    if os.path.isfile(outpath) and not overwrite:
         print("SKIPPED: {} (output file exists)".format(outpath))
         return
     else:
         print("Generating: {} => {}".format(inpath, outpath))
-    dirpath = os.path.dirname(outpath)
-    if not os.path.exists(dirpath):
-        os.makedirs(dirpath)
-    with open(outpath, 'wt') as outfile:
-        for sj in scxml.iterparse(inpath):
-            s = to_ttl(sj, with_nonsense=with_nonsense, sk_map=sk_map, wnctx=wnctx)
-            outfile.write(json.dumps(s.to_json(), ensure_ascii=False))
-            outfile.write("\n")
-
-
-def to_ttl(sent, with_nonsense=True, sk_map=None, wnctx=None):
+    if resolver is None:
+        resolver = SenseKeyResolver(wnctx, sk_map)
+    with jsonl_writer(outpath, ensure_ascii=False) as writer:
+        write = writer.write
+        rec = instrument.recorder
+        if rec is not None:
+            write = rec.timed(instrument.WRITE, write, inpath, count_sentence=False)
+            counters = resolver.counters
+        for s in scxml.iterparse_ttl(inpath, with_nonsense=with_nonsense, resolver=resolver):
+            write(s.to_json())
+        if rec is not None:
+            record_sensekeys(rec, inpath, counters, resolver.counters)
+    return outpath
+
+
+def document_name(path):
+    ''' Name of the document of a file, e.g. br-a01 for brown1/tagfiles/br-a01.xml '''
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def json_lines(inpath, scxml, where=None):
+    ''' Encode the sentences of a file as in xml2json(), return a list of (sid, document, line) '''
+    doc = document_name(inpath)
+    lines = []
+    for sj in scxml.iterparse(inpath, where):
+        sj['tokens'] = [t.to_json() for t in sj['tokens']]
+        lines.append((sj['sid'], doc, dumps(sj)))
+    return lines
+
+
+def ttl_lines(inpath, scxml, with_nonsense=True, resolver=None, where=None):
+    ''' Encode the TTL sentences of a file as in xml2ttl(), return a list of (sid, document, line) '''
+    doc = document_name(inpath)
+    lines = []
+    for s in scxml.iterparse_ttl(inpath, with_nonsense=with_nonsense, resolver=resolver, where=where):
+        lines.append((s.get_tag('origid').label, doc, dumps(s.to_json(), ensure_ascii=False)))
+    return lines
+
+
+def write_lines(writer, lines):
+    for sid, doc, line in lines:
+        writer.write(sid, doc, line)
+
+
+def record_sensekeys(rec, path, before, after):
+    ''' Record the sensekey lookups of a file, from resolver counters taken before and after it was converted '''
+    lookups, misses, queries = (now - then for now, then in zip(after, before))
+    rec.add(instrument.SENSEKEYS, 0.0, path, calls=0, lookups=lookups, misses=misses, queries=queries)
+
+
+def release(element):
+    ''' Clear an element that has been processed and drop it and all earlier siblings of it and of its ancestors
+        from the tree (iterparse() keeps building the tree of the whole document otherwise)
+    '''
+    element.clear()
+    node = element
+    parent = node.getparent()
+    while parent is not None:
+        while node.getprevious() is not None:
+            del parent[0]
+        node, parent = parent, parent.getparent()
+    # the element itself is the first child of its parent now
+    parent = element.getparent()
+    if parent is not None:
+        del parent[0]
+
+
+def make_token(tag, token_data, text):
+    ''' Create a TokenInfo from a token element (tag, attributes and text)
+        Return None if the element is not a token (wf or punc)
+    '''
+    if tag not in TOKEN_TAGS:
+        return None
+    token_data['tag'] = tag
+    text = fix_token_text(text)
+    if tag == 'wf':
+        # create sensekey
+        lemma = strip(token_data.get('lemma'))
+        lexsn = strip(token_data.get('lexsn'))
+        sk = lemma + '%' + lexsn if lemma and lexsn else ''
+        sk = strip(sk.replace('\t', ' ').replace('|', ' '))
+        if sk:
+            token_data['sk'] = sk
+    return TokenInfo(text, **token_data)
+
+
+def element_tokens(element):
+    ''' Tokens of a sentence (<s>) element '''
+    tokens = []
+    for token in element:
+        tinfo = make_token(token.tag, dict(token.attrib), token.text)
+        if tinfo is not None:
+            tokens.append(tinfo)
+    return tokens
+
+
+def make_sentence(filename, para, snum, tokens):
+    return {'para': para,
+            'filename': filename,
+            'snum': snum,
+            'sid': "{}-{}-{}".format(filename, para, snum),
+            'tokens': tokens}
+
+
+def to_ttl(sent, with_nonsense=True, sk_map=None, wnctx=None, resolver=None):
+    ''' Convert a sentence dict (see SemcorXML.iterparse) to a TTL sentence
+        Sensekeys are mapped to synsetIDs by resolver (a SenseKeyResolver),
+        sk_map and wnctx are used to create a resolver for this sentence when it is not provided
+    '''
+    if resolver is None and (sk_map is not None or wnctx is not None):
+        resolver = SenseKeyResolver(wnctx, sk_map)
     tokens = sent['tokens']
     text = detokenize(tokens)
+    from chirptext import ttl
     s = ttl.Sentence(text=text)
     s.new_tag(sent['sid'], tagtype='origid')
     s.import_tokens((t.text for t in tokens))
-    for tinfo, tk in zip(tokens, s):
+    # sensekeys to be added as concepts
+    sensekeys = []
+    for tinfo in tokens:
+        sk = fix_sensekey(tinfo.get('sk'))
+        if sk and (with_nonsense or not is_nonsense(tinfo.lemma, sk, tinfo.get('rdf'))):
+            sensekeys.append(sk)
+        else:
+            sensekeys.append(None)
+    if resolver is not None:
+        # look up all new keys of this sentence at once
+        resolver.prefetch(sensekeys)
+    for tinfo, tk, sk in zip(tokens, s, sensekeys):
         for k, v in tinfo.data:
             if (k, v) == ('tag', 'wf') or k == 'sk':
                 continue
@@ -285,27 +1005,82 @@ def to_ttl(sent, with_nonsense=True, sk_map=None, wnctx=None):
             else:
                 tk.new_tag(label=v, tagtype=k)
         # if sensekey exists, add it as a concept
-        lemma = tinfo.lemma
-        sk = fix_sensekey(tinfo.get('sk'))
-        rdf = tinfo.get('rdf')
-        comment = None
-        if sk and (with_nonsense or not is_nonsense(lemma, sk, rdf)):
+        if sk:
             sensetag = sk
-            if sk_map is not None and sk in sk_map:
-                sensetag = sk_map[sk]
-            elif wnctx is not None:
-                # try to determine synsetID
-                ss = wnctx.senses.select_single('sensekey=?', (sk,))
-                if ss is not None:
-                    sid = str(SynsetID.from_string(ss.synsetid))
-                    if sk_map is not None:
-                        sk_map[sk] = sid
-                        sensetag = sid
-                else:
+            comment = None
+            if resolver is not None:
+                sid = resolver.resolve(sk)
+                if sid is not None:
+                    sensetag = sid
+                elif resolver.is_unknown(sk):
                     # sensekey not found
-                    getLogger().warning("There is no synsetID with sensekey={} | rdf={}".format(sk, rdf))
                     comment = 'sensekey'
-            s.new_concept(clemma=lemma, tag=sensetag, tokens=(tk,), comment=comment)
+            s.new_concept(clemma=tinfo.lemma, tag=sensetag, tokens=(tk,), comment=comment)
+    return s
+
+
+def element_ttl(element, sid, with_nonsense=True, resolver=None):
+    ''' Convert a sentence (<s>) element straight to a TTL sentence, in a single pass over its tokens
+        The result is the same as to_ttl() of the sentence dict, but no attribute dicts, TokenInfo objects
+        or sentence dicts are created.
+    '''
+    from chirptext import ttl
+    texts = []
+    tokens = []
+    sensekeys = []
+    for token in element:
+        tag = token.tag
+        if tag != 'wf' and tag != 'punc':
+            continue
+        text = fix_token_text(token.text)
+        # one call to lxml per token, attributes in the order of TokenInfo.data
+        attrs = token.items()
+        attrs.sort()
+        attrib = dict(attrs)
+        lemma = attrib.get('lemma')
+        sk = None
+        if tag == 'wf' and lemma:
+            lexsn = attrib.get('lexsn')
+            if lexsn and strip(lemma) and strip(lexsn):
+                sk = strip((strip(lemma) + '%' + strip(lexsn)).replace('\t', ' ').replace('|', ' '))
+        if not sk:
+            sk = attrib.get('sk')
+        if lemma is None:
+            lemma = text
+        sk = fix_sensekey(sk)
+        if sk and not with_nonsense and is_nonsense(lemma, sk, attrib.get('rdf')):
+            sk = None
+        texts.append(text)
+        tokens.append((attrs, tag, lemma))
+        sensekeys.append(sk or None)
+    s = ttl.Sentence(text=detokenize_texts(texts))
+    s.new_tag(sid, tagtype='origid')
+    s.import_tokens(texts)
+    if resolver is not None:
+        resolver.prefetch(sensekeys)
+    cidx = 0
+    for (attrs, tag, lemma), tk, sk in zip(tokens, s, sensekeys):
+        for k, v in attrs:
+            if k == 'lemma':
+                tk.lemma = v
+            elif k == 'pos':
+                tk.pos = v
+            elif k != 'tag' and k != 'sk':
+                tk.new_tag(label=v, tagtype=k)
+        if tag != 'wf':
+            tk.new_tag(label=tag, tagtype='tag')
+        if sk:
+            sensetag = sk
+            comment = None
+            if resolver is not None:
+                synset = resolver.resolve(sk)
+                if synset is not None:
+                    sensetag = synset
+                elif resolver.is_unknown(sk):
+                    comment = 'sensekey'
+            # concepts are numbered in order, Sentence.new_concept() would search for a free ID each time
+            s.new_concept(clemma=lemma, tag=sensetag, tokens=(tk,), comment=comment, cidx=cidx)
+            cidx += 1
     return s
 
 
@@ -325,82 +1100,191 @@ def is_nonsense(lemma, sk, rdf):
     return ((sk, rdf) in NONSENSE) or lemma == 'be'
 
 
+# the normalisers of token texts and sentences, see load_normalisers()
+_token_normaliser = None
+_sentence_normaliser = None
+_rules_digest = None
+
+
+def load_normalisers(path=RULES_FILE):
+    ''' Load the rules of fix_token_text() and detokenize() from a JSON file (see pysemcor/data/normaliser.json) '''
+    global _token_normaliser, _sentence_normaliser, _rules_digest
+    rules = load_rules(path)
+    _token_normaliser = Normaliser(rules['token'])
+    _sentence_normaliser = Normaliser(rules['sentence'])
+    _rules_digest = hashlib.sha1(json.dumps(rules, sort_keys=True).encode('utf-8')).hexdigest()
+    fix_token_text.cache_clear()
+
+
+def rules_digest():
+    ''' SHA-1 of the normaliser rules in use (parsed texts depend on them) '''
+    if _rules_digest is None:
+        load_normalisers()
+    return _rules_digest
+
+
+@lru_cache(maxsize=TOKEN_CACHE_SIZE)
 def fix_token_text(tk):
-    tk = StringTool.strip(tk).replace('\t', ' ').replace('|', ' ').replace('_', ' ')
-    tk = tk.replace(" ' nuff", " 'nuff")
-    tk = tk.replace("Ol ' ", "Ol' ")
-    tk = tk.replace("O ' ", "O' ")
-    tk = tk.replace("ma ' am", "ma'am")
-    tk = tk.replace("Ma ' am", "Ma'am")
-    tk = tk.replace("probl ' y", "probl'y")
-    tk = tk.replace("ai n't", "ain't")
-    tk = tk.replace("holdin '", "holdin'")
-    tk = tk.replace("hangin '", "hangin'")
-    tk = tk.replace("dryin ' ", "dryin' ")
-    tk = tk.replace("Y ' all", "Y'all")
-    tk = tk.replace("y ' know", "y'know")
-    tk = tk.replace("c ' n", "c'n")
-    tk = tk.replace("l ' identite", "l'identite")
-    tk = tk.replace("Rue de L ' Arcade", "Rue de l'Arcade")
-    tk = tk.replace("p ' lite", "p'lite")
-    tk = tk.replace("rev ' rend", "rev'rend")
-    tk = tk.replace("coup d ' etat", "coup d'etat")
-    tk = tk.replace("t ' gethuh", "t'gethuh")
-    tk = tk.replace('``', "“")
-    tk = tk.replace("''", "”")
-    tk = tk.replace(" ,", ",")
-    tk = tk.replace("( ", "(")
-    tk = tk.replace(" )", ")")
-    tk = tk.replace(" ”", "”")
-    tk = tk.replace(" 's", "'s")
-    tk = tk.replace("o '", "o'")
-    tk = tk.replace("s ' ", "s' ")
-    tk = tk.replace(" , ", ", ")
-    # tk = tk.replace(" ' ", "' ")
-    return tk
+    if _token_normaliser is None:
+        load_normalisers()
+    return _token_normaliser(strip(tk))
 
 
 def detokenize(tokens):
-    sentence_text = ' '.join([x.text for x in tokens])
-    sentence_text = sentence_text.replace(" , , ", ", ")
-    sentence_text = sentence_text.replace(' , ', ', ').replace('“ ', '“').replace(' ”', '”')
-    sentence_text = sentence_text.replace(' ! ', '! ').replace(" 'll ", "'ll ").replace(" 've ", "'ve ").replace(" 're ", "'re ").replace(" 'd ", "'d ")
-    sentence_text = sentence_text.replace(" 's ", "'s ")
-    sentence_text = sentence_text.replace(" 'm ", "'m ")
-    sentence_text = sentence_text.replace(" ' ", "' ")
-    sentence_text = sentence_text.replace(" ; ", "; ")
-    sentence_text = sentence_text.replace("( ", "(")
-    sentence_text = sentence_text.replace(" )", ")")
-    sentence_text = sentence_text.replace(" n't ", "n't ")
-    # sentence_text = sentence_text.replace("Never_mind_''", "Never_mind_”")
-    # sentence_text = sentence_text.replace("327_U._S._114_''", "327_U._S._114_”")
-    # sentence_text = sentence_text.replace("``", "“")
-    # sentence_text = sentence_text.replace("''", "”")
-    sentence_text = sentence_text.replace("  ", " ")
+    return detokenize_texts([x.text for x in tokens])
+
+
+def detokenize_texts(texts):
+    if _sentence_normaliser is None:
+        load_normalisers()
+    sentence_text = _sentence_normaliser(' '.join(texts))
     if sentence_text[-2:] in (' .', ' :', ' ?', ' !'):
         sentence_text = sentence_text[:-2] + sentence_text[-1]
     sentence_text = sentence_text.strip()
     return sentence_text
 
 
-def fix_3rada(root, output_dir):
+def fix_3rada(root, output_dir, jobs=1, engine=STREAM, verify=False, shard=None):
+    ''' Repair the original 3rada files of root into output_dir
+        shard: only repair shard (i, N) of the files (see FileSet.shard())
+    '''
     ds_3rada = SemcorXML(root)
+    if shard:
+        ds_3rada.files = ds_3rada.files.shard(*shard)
+    tasks = []
     for f in ds_3rada.files:
         inpath = os.path.join(ds_3rada.root, f)
         outpath = os.path.join(output_dir, f + ".xml")
-        fix_malformed_xml_file(inpath, outpath)
+        tasks.append((inpath, outpath, engine, verify))
+    return run_tasks(fix_malformed_xml_file, tasks, jobs=jobs)
 
 
-def fix_malformed_xml_file(inpath, outpath):
+def fix_malformed_xml_file(inpath, outpath, engine=STREAM, verify=False):
+    ''' Convert an original 3rada file into well-formed XML
+        engine: STREAM (single-pass repairer, see pysemcor.sgml) or SOUP (BeautifulSoup, much slower)
+        verify: compare the output of the stream engine with the BeautifulSoup output
+    '''
     if os.path.isfile(outpath):
         print("SKIPPED: {} (output file exists)".format(outpath))
         return
     print('Fixing the file: %s ==> %s' % (inpath, outpath))
-    with open(inpath) as infile:
-        soup = BeautifulSoup(infile.read(), 'lxml')
     # create output dir if needed
     outdir = os.path.dirname(outpath)
-    if not os.path.exists(outdir):
-        os.makedirs(outdir)
-    with open(outpath, 'w') as outfile:
-        outfile.write(soup.prettify())
+    if outdir and not os.path.exists(outdir):
+        os.makedirs(outdir, exist_ok=True)
+    if engine == STREAM:
+        sgml.repair_file(inpath, outpath, verify=verify)
+    elif engine == SOUP:
+        with open(inpath) as infile:
+            from bs4 import BeautifulSoup
+            soup = BeautifulSoup(infile.read(), 'lxml')
+        with atomic_write(outpath) as outfile:
+            outfile.write(soup.prettify())
+    else:
+        raise ValueError("Unknown engine: {}".format(engine))
+
+
+# -------------------------------------------------------------------------------
+# Batch processing
+# -------------------------------------------------------------------------------
+
+def run_tasks(func, tasks, jobs=1, initializer=None, initargs=(), on_result=None):
+    ''' Call func(*task) for each task, in a pool of worker processes when jobs > 1 (jobs=0 means one per CPU)
+        A failed task is logged and does not stop the rest of the batch.
+        on_result(task, result) is called in this process for each task that succeeded.
+        Return a list of (task[0], error) for all failed tasks, in task order
+    '''
+    if jobs is not None and jobs < 1:
+        jobs = os.cpu_count()
+    failures = []
+    rec = instrument.recorder
+
+    def _report(task, error):
+        getLogger().error("Failed to process {}: {}".format(task[0], error))
+        failures.append((task[0], error))
+
+    if not jobs or jobs == 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for task in tasks:
+            try:
+                result = func(*task)
+            except Exception as e:
+                _report(task, e)
+            else:
+                if on_result is not None:
+                    on_result(task, result)
+    else:
+        from collections import deque
+        from concurrent.futures import ProcessPoolExecutor
+
+        def _collect(task, future):
+            try:
+                result = future.result()
+            except Exception as e:
+                _report(task, e)
+            else:
+                if rec is not None:
+                    # what the worker recorded (see instrument._recorded_task())
+                    result, snapshot = result
+                    rec.merge(snapshot)
+                if on_result is not None:
+                    on_result(task, result)
+
+        with ProcessPoolExecutor(max_workers=jobs, initializer=initializer, initargs=initargs) as executor:
+            # only a few tasks per worker are in flight so that finished results do not pile up
+            pending = deque()
+            for task in tasks:
+                if rec is None:
+                    future = executor.submit(func, *task)
+                else:
+                    future = executor.submit(instrument._recorded_task, func, *task)
+                pending.append((task, future))
+                if len(pending) >= jobs * TASKS_PER_WORKER:
+                    _collect(*pending.popleft())
+            while pending:
+                _collect(*pending.popleft())
+    return failures
+
+
+# states of a worker process, see _init_ttl_worker()
+_worker_resolver = None
+_worker_counts = (0, 0, 0)
+
+
+def _init_ttl_worker(sk_map, unknown, preload):
+    global _worker_resolver, _worker_counts
+    _worker_resolver = SenseKeyResolver(get_wordnet().ctx(), dict(sk_map))
+    _worker_resolver.unknown.update(unknown)
+    _worker_counts = (0, 0, 0)
+    if preload:
+        _worker_resolver.preload()
+
+
+def _resolving_worker(func, *args, **kwargs):
+    ''' Call func(*args, resolver=..., **kwargs) with the resolver of this worker process (see _init_ttl_worker())
+        Return the result and the sensekeys resolved and resolver counters of this call, see SenseKeyResolver.merge()
+    '''
+    global _worker_counts
+    resolver = _worker_resolver
+    resolver.journal = {}
+    result = func(*args, resolver=resolver, **kwargs)
+    previous = _worker_counts
+    _worker_counts = resolver.counters
+    return result, (resolver.journal,) + tuple(now - before for now, before in zip(_worker_counts, previous))
+
+
+def _xml2ttl_worker(inpath, scxml, scttl, with_nonsense, compression=None):
+    ''' Convert one file in a worker process
+        Return the sensekeys used by this file and the resolver counters, see SenseKeyResolver.merge()
+    '''
+    return _resolving_worker(xml2ttl, inpath, scxml, scttl, with_nonsense=with_nonsense, overwrite=True,
+                             compression=compression)[1]
+
+
+def _ttl_lines_worker(inpath, scxml, with_nonsense, where=None):
+    ''' Encode the TTL sentences of one file in a worker process
+        Return the lines (see ttl_lines()) followed by what SenseKeyResolver.merge() takes
+    '''
+    lines, resolved = _resolving_worker(ttl_lines, inpath, scxml, with_nonsense=with_nonsense, where=where)
+    return (lines,) + resolved
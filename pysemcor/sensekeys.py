@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+'''
+Sensekey to synsetID resolution
+Latest version can be found at https://github.com/letuananh/pysemcor
+
+References:
+    Python documentation:
+        https://docs.python.org/
+    PEP 0008 - Style Guide for Python Code
+        https://www.python.org/dev/peps/pep-0008/
+    PEP 257 - Python Docstring Conventions:
+        https://www.python.org/dev/peps/pep-0257/
+
+@author: Le Tuan Anh <tuananh.ke@gmail.com>
+'''
+
+# Copyright (c) 2017, Le Tuan Anh <tuananh.ke@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+__author__ = "Le Tuan Anh"
+__email__ = "<tuananh.ke@gmail.com>"
+__copyright__ = "Copyright 2017, pysemcor"
+__license__ = "MIT"
+__maintainer__ = "Le Tuan Anh"
+__version__ = "0.1"
+__status__ = "Prototype"
+__credits__ = []
+
+########################################################################
+
+import logging
+from contextlib import nullcontext
+
+from . import instrument
+
+# -------------------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------------------
+
+# SQLite allows at most 999 parameters per query in older versions
+BATCH_SIZE = 500
+
+
+def getLogger():
+    return logging.getLogger(__name__)
+
+
+# -------------------------------------------------------------------------------
+# Data structures
+# -------------------------------------------------------------------------------
+
+class SenseKeyResolver(object):
+
+    ''' Map sensekeys to synsetIDs with as few WordNet queries as possible
+        Found keys are kept in sk_map and keys that do not exist in WordNet are cached as well,
+        so that each distinct key is looked up (and reported) only once.
+    '''
+
+    def __init__(self, wnctx=None, sk_map=None, preload=False):
+        self.wnctx = wnctx
+        self.sk_map = sk_map if sk_map is not None else {}
+        self.unknown = set()
+        self.preloaded = False
+        # number of resolve() calls, keys that were not in the caches and WordNet queries
+        self.lookups = 0
+        self.misses = 0
+        self.queries = 0
+        # when not None, every key that is resolved is recorded here (see merge())
+        self.journal = None
+        if preload:
+            self.preload()
+
+    def preload(self):
+        ''' Load the whole sensekey => synsetID table with one query '''
+        from yawlib import SynsetID
+        self.queries += 1
+        rec = instrument.recorder
+        with rec.measure(instrument.SENSEKEYS) if rec is not None else nullcontext():
+            for sense in self.wnctx.senses.select(columns=('sensekey', 'synsetid')):
+                if sense.sensekey not in self.sk_map:
+                    self.sk_map[sense.sensekey] = str(SynsetID.from_string(sense.synsetid))
+        self.preloaded = True
+        getLogger().debug("Preloaded {} sensekeys".format(len(self.sk_map)))
+
+    def prefetch(self, sensekeys):
+        ''' Look up all keys that have not been seen before with batched IN (...) queries '''
+        todo = [sk for sk in dict.fromkeys(sensekeys) if sk and sk not in self.sk_map and sk not in self.unknown]
+        if not todo or (self.wnctx is None and not self.preloaded):
+            return
+        self.misses += len(todo)
+        if not self.preloaded:
+            from yawlib import SynsetID
+            rec = instrument.recorder
+            for idx in range(0, len(todo), BATCH_SIZE):
+                batch = todo[idx:idx + BATCH_SIZE]
+                self.queries += 1
+                where = 'sensekey IN ({})'.format(','.join('?' * len(batch)))
+                with rec.measure(instrument.SENSEKEYS) if rec is not None else nullcontext():
+                    for sense in self.wnctx.senses.select(where, batch, columns=('sensekey', 'synsetid')):
+                        if sense.sensekey not in self.sk_map:
+                            self.sk_map[sense.sensekey] = str(SynsetID.from_string(sense.synsetid))
+        for sk in todo:
+            if sk not in self.sk_map:
+                getLogger().warning("There is no synsetID with sensekey={}".format(sk))
+                self.unknown.add(sk)
+
+    def resolve(self, sk):
+        ''' Return the synsetID (as a string) of a sensekey, or None if it is not known '''
+        self.lookups += 1
+        if sk not in self.sk_map and sk not in self.unknown:
+            self.prefetch((sk,))
+        sid = self.sk_map.get(sk)
+        if self.journal is not None and sk not in self.journal and (sid is not None or sk in self.unknown):
+            self.journal[sk] = sid
+        return sid
+
+    def is_unknown(self, sk):
+        ''' True if sk was looked up and does not exist in WordNet '''
+        return sk in self.unknown
+
+    def merge(self, journal, lookups=0, misses=0, queries=0):
+        ''' Merge resolutions (a journal, see resolve()) and counters from another resolver '''
+        for sk, sid in journal.items():
+            if sid is None:
+                self.unknown.add(sk)
+            else:
+                self.sk_map[sk] = sid
+            if self.journal is not None and sk not in self.journal:
+                self.journal[sk] = sid
+        self.lookups += lookups
+        self.misses += misses
+        self.queries += queries
+
+    @property
+    def hits(self):
+        return self.lookups - self.misses
+
+    @property
+    def counters(self):
+        return (self.lookups, self.misses, self.queries)
+
+    @property
+    def stats(self):
+        return {'lookups': self.lookups, 'hits': self.hits, 'misses': self.misses, 'queries': self.queries,
+                'known': len(self.sk_map), 'unknown': len(self.unknown)}
+
+    def __repr__(self):
+        return "SenseKeyResolver({})".format(self.stats)
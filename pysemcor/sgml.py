@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+
+'''
+Streaming reader and repairer for the original Semcor (3rada) SGML files
+Latest version can be found at https://github.com/letuananh/pysemcor
+
+References:
+    Python documentation:
+        https://docs.python.org/
+    PEP 0008 - Style Guide for Python Code
+        https://www.python.org/dev/peps/pep-0008/
+    PEP 257 - Python Docstring Conventions:
+        https://www.python.org/dev/peps/pep-0257/
+
+@author: Le Tuan Anh <tuananh.ke@gmail.com>
+'''
+
+# Copyright (c) 2017, Le Tuan Anh <tuananh.ke@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+__author__ = "Le Tuan Anh"
+__email__ = "<tuananh.ke@gmail.com>"
+__copyright__ = "Copyright 2017, pysemcor"
+__license__ = "MIT"
+__maintainer__ = "Le Tuan Anh"
+__version__ = "0.1"
+__status__ = "Prototype"
+__credits__ = []
+
+########################################################################
+
+import os
+import re
+import logging
+from html import unescape
+
+from .manifest import atomic_write
+
+# -------------------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------------------
+
+START = 'start'
+END = 'end'
+TEXT = 'text'
+
+# a tag that is still open after this many characters is treated as text
+MAX_TAG_LENGTH = 4096
+# number of distinct attribute strings to remember before the caches are reset
+CACHE_SIZE = 50000
+
+# markup is a start/end tag (quotes only matter at the start of a value), a declaration/comment/PI (ignored) or a stray <
+_MARKUP = re.compile(r'''<(/?)([A-Za-z][^\s/>]*)((?:[^>=]|=\s*"[^"]*"|=\s*'[^']*'|=)*)>|<[!?][^>]*>|<''')
+# attributes are parsed the way HTML parsers do, i.e. whitespace is allowed around =
+# and an unquoted value runs until the next whitespace or >
+# a line with one complete element without quotes, and plain text which needs no escaping
+_ELEMENT_LINE = re.compile(r'''<([A-Za-z][^\s/<>"']*)([^<>"']*)>([^<>&]*)</\1>(\s*)$''')
+_ATTR = re.compile(r'''([^\s=/>"'][^\s=/>]*)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]*)))?''')
+
+
+def getLogger():
+    return logging.getLogger(__name__)
+
+
+# -------------------------------------------------------------------------------
+# Lexer
+# -------------------------------------------------------------------------------
+
+_attrs_cache = {}
+
+
+def parse_attrs(attr_text):
+    ''' Parse the attribute part of a tag into a tuple of (name, value) pairs
+        Names are lowercased, entities are decoded and only the first occurrence of a name is kept
+    '''
+    attrs = _attrs_cache.get(attr_text)
+    if attrs is None:
+        seen = set()
+        pairs = []
+        for m in _ATTR.finditer(attr_text):
+            name = m.group(1).lower()
+            if name in seen:
+                continue
+            seen.add(name)
+            value = next((v for v in m.group(2, 3, 4) if v is not None), '')
+            pairs.append((name, unescape(value) if '&' in value else value))
+        attrs = tuple(pairs)
+        if len(_attrs_cache) >= CACHE_SIZE:
+            _attrs_cache.clear()
+        _attrs_cache[attr_text] = attrs
+    return attrs
+
+
+_sorted_attrs_cache = {}
+
+
+def parse_sorted_attrs(attr_text):
+    ''' Same as parse_attrs() but the pairs are sorted by name (the order BeautifulSoup writes them) '''
+    attrs = _sorted_attrs_cache.get(attr_text)
+    if attrs is None:
+        attrs = tuple(sorted(parse_attrs(attr_text)))
+        if len(_sorted_attrs_cache) >= CACHE_SIZE:
+            _sorted_attrs_cache.clear()
+        _sorted_attrs_cache[attr_text] = attrs
+    return attrs
+
+
+def match_element(line):
+    ''' Match a line which holds one complete element without quotes or entities, e.g. <wf cmd=done pos=NN>text</wf>
+        Return a match object with groups (tag, attribute text, text, trailing whitespace) or None
+    '''
+    return _ELEMENT_LINE.match(line)
+
+
+def read_lines(infile):
+    ''' Yield the lines of infile, a tag that spans several lines is joined into one line '''
+    pending = ''
+    for line in infile:
+        if pending:
+            line = pending + line
+            pending = ''
+        # keep an unfinished tag for the next line
+        lt = line.rfind('<')
+        if lt > line.rfind('>') and len(line) - lt < MAX_TAG_LENGTH:
+            pending = line[lt:]
+            line = line[:lt]
+        if line:
+            yield line
+    if pending:
+        yield pending
+
+
+def lex_line(line):
+    ''' Yield (kind, value, attrs) events of a line, see lex() '''
+    pos = 0
+    for m in _MARKUP.finditer(line):
+        start = m.start()
+        if start > pos:
+            text = line[pos:start]
+            yield TEXT, unescape(text) if '&' in text else text, None
+        tag = m.group(2)
+        if tag is not None:
+            tag = tag.lower()
+            if m.group(1):
+                yield END, tag, None
+            else:
+                attr_text = m.group(3)
+                yield START, tag, parse_attrs(attr_text) if attr_text else ()
+                if attr_text.endswith('/'):
+                    yield END, tag, None
+        elif m.end() - start == 1:
+            # a stray < is just text
+            yield TEXT, '<', None
+        pos = m.end()
+    if pos < len(line):
+        text = line[pos:]
+        yield TEXT, unescape(text) if '&' in text else text, None
+
+
+def lex(infile):
+    ''' Read a Semcor SGML stream and yield (kind, value, attrs) events, one line at a time
+        kind is START (value=tag, attrs=tuple of pairs), END (value=tag) or TEXT (value=decoded text)
+    '''
+    for line in read_lines(infile):
+        yield from lex_line(line)
+
+
+# -------------------------------------------------------------------------------
+# Repairer
+# -------------------------------------------------------------------------------
+
+def escape_text(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def escape_attr(value):
+    return escape_text(value).replace('"', '&quot;')
+
+
+_start_tag_cache = {}
+
+
+def start_tag(tag, attrs):
+    ''' Render a well-formed start tag, attributes are sorted by name like BeautifulSoup does '''
+    key = (tag, attrs)
+    rendered = _start_tag_cache.get(key)
+    if rendered is None:
+        parts = ['<', tag]
+        for name, value in sorted(attrs):
+            parts.append(' {}="{}"'.format(name, escape_attr(value)))
+        parts.append('>')
+        rendered = ''.join(parts)
+        if len(_start_tag_cache) >= CACHE_SIZE:
+            _start_tag_cache.clear()
+        _start_tag_cache[key] = rendered
+    return rendered
+
+
+_element_cache = {}
+
+
+def repair(infile, outfile):
+    ''' Copy a Semcor SGML stream to outfile as well-formed XML, in a single pass with constant memory
+        Attributes are quoted, special characters are escaped and unbalanced tags are closed.
+        The layout of the original file is kept.
+    '''
+    stack = []
+    for line in read_lines(infile):
+        # fast path: most lines hold exactly one element, e.g. <wf cmd=done pos=NN ...>text</wf>
+        m = match_element(line)
+        if m is not None:
+            key = m.group(1, 2)
+            tags = _element_cache.get(key)
+            if tags is None:
+                tag = key[0].lower()
+                tags = (start_tag(tag, parse_attrs(key[1])), '</{}>'.format(tag))
+                if len(_element_cache) >= CACHE_SIZE:
+                    _element_cache.clear()
+                _element_cache[key] = tags
+            outfile.write(tags[0] + m.group(3) + tags[1] + m.group(4))
+            continue
+        chunk = []
+        for kind, value, attrs in lex_line(line):
+            if kind == TEXT:
+                chunk.append(escape_text(value))
+            elif kind == START:
+                stack.append(value)
+                chunk.append(start_tag(value, attrs))
+            elif value in stack:
+                # close all elements that were left open inside this one
+                while True:
+                    tag = stack.pop()
+                    chunk.append('</{}>'.format(tag))
+                    if tag == value:
+                        break
+            else:
+                getLogger().debug("Ignored stray end tag </{}>".format(value))
+        outfile.write(''.join(chunk))
+    while stack:
+        outfile.write('</{}>'.format(stack.pop()))
+
+
+def repair_file(inpath, outpath, verify=False):
+    ''' Repair inpath into outpath, which is only written when the repair (and its verification) completes
+        verify: compare the output with the BeautifulSoup repair, raise ValueError when they differ
+    '''
+    with open(inpath, encoding='utf-8') as infile, atomic_write(outpath, encoding='utf-8') as outfile:
+        repair(infile, outfile)
+        if verify:
+            outfile.flush()
+            diffs = verify_repair(inpath, outfile.name)
+            if diffs:
+                for diff in diffs:
+                    getLogger().error(diff)
+                raise ValueError("Repaired file {} does not match BeautifulSoup output ({} difference(s))".format(inpath, len(diffs)))
+
+
+# -------------------------------------------------------------------------------
+# Verification
+# -------------------------------------------------------------------------------
+
+def _iter_nodes(root):
+    ''' Yield (tag, attributes, text) of each element, HTML wrappers added by BeautifulSoup are skipped '''
+    for element in root.iter():
+        if element.tag in ('html', 'body'):
+            continue
+        text = element.text.strip() if element.text else ''
+        yield element.tag, sorted(element.attrib.items()), text
+
+
+def verify_repair(inpath, outpath):
+    ''' Compare the output of repair() (outpath) with the BeautifulSoup repair of inpath
+        Return a list of differences (an empty list means both outputs are equivalent)
+    '''
+    from lxml import etree
+    from bs4 import BeautifulSoup
+    with open(inpath, encoding='utf-8') as infile:
+        soup_root = etree.fromstring(BeautifulSoup(infile.read(), 'lxml').prettify().encode('utf-8'))
+    stream_root = etree.parse(outpath).getroot()
+    diffs = []
+    soup_nodes = list(_iter_nodes(soup_root))
+    stream_nodes = list(_iter_nodes(stream_root))
+    for idx, (expected, actual) in enumerate(zip(soup_nodes, stream_nodes)):
+        if expected != actual:
+            diffs.append("{}: element #{}: expected {} but got {}".format(os.path.basename(inpath), idx, expected, actual))
+    if len(soup_nodes) != len(stream_nodes):
+        diffs.append("{}: expected {} elements but got {}".format(os.path.basename(inpath), len(soup_nodes), len(stream_nodes)))
+    return diffs
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+
+'''
+Deterministic sharding of file sets and merging of shard outputs
+Latest version can be found at https://github.com/letuananh/pysemcor
+
+References:
+    Python documentation:
+        https://docs.python.org/
+    PEP 0008 - Style Guide for Python Code
+        https://www.python.org/dev/peps/pep-0008/
+    PEP 257 - Python Docstring Conventions:
+        https://www.python.org/dev/peps/pep-0257/
+
+@author: Le Tuan Anh <tuananh.ke@gmail.com>
+'''
+
+# Copyright (c) 2017, Le Tuan Anh <tuananh.ke@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+__author__ = "Le Tuan Anh"
+__email__ = "<tuananh.ke@gmail.com>"
+__copyright__ = "Copyright 2017, pysemcor"
+__license__ = "MIT"
+__maintainer__ = "Le Tuan Anh"
+__version__ = "0.1"
+__status__ = "Prototype"
+__credits__ = []
+
+########################################################################
+
+import os
+import json
+import shutil
+import logging
+
+from .manifest import MANIFEST_NAME, atomic_write, read_manifest
+
+# -------------------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------------------
+
+# sensekeys resolved by a TTL conversion are kept next to the manifest of its outputs
+SENSEKEYS_NAME = '.sensekeys.json'
+
+
+def getLogger():
+    return logging.getLogger(__name__)
+
+
+# -------------------------------------------------------------------------------
+# Shards
+# -------------------------------------------------------------------------------
+
+def parse_shard(text):
+    ''' Parse a shard given as i/N (1 <= i <= N), return (i, N) '''
+    try:
+        index, count = (int(x) for x in text.split('/'))
+    except ValueError:
+        raise ValueError("Invalid shard {} (expected i/N, e.g. 1/4)".format(repr(text)))
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError("Invalid shard {} (i must be between 1 and N)".format(repr(text)))
+    return index, count
+
+
+def shard_suffix(shard):
+    ''' Suffix of the files written by a shard, e.g. .2of4 ('' when shard is None) '''
+    return '.{}of{}'.format(*shard) if shard else ''
+
+
+def shard_path(path, shard):
+    ''' Insert the suffix of shard before the extension of path, e.g. data/semcor.ttl.db => data/semcor.ttl.2of4.db '''
+    base, ext = os.path.splitext(path)
+    return base + shard_suffix(shard) + ext
+
+
+def manifest_name(shard):
+    return shard_path(MANIFEST_NAME, shard)
+
+
+def sensekeys_name(shard):
+    return shard_path(SENSEKEYS_NAME, shard)
+
+
+def partition(files, sizes, count):
+    ''' Split files into count lists with about the same total size
+        Largest files are placed first, each one into the lightest list (the first one on ties),
+        so the result only depends on the names and sizes of the files. Files keep their order in each list.
+    '''
+    bins = [[] for _ in range(count)]
+    totals = [0] * count
+    ranked = sorted(range(len(files)), key=lambda idx: (-sizes[idx], files[idx]))
+    for idx in ranked:
+        lightest = min(range(count), key=lambda b: (totals[b], b))
+        bins[lightest].append(idx)
+        totals[lightest] += sizes[idx]
+    return [[files[idx] for idx in sorted(b)] for b in bins]
+
+
+# -------------------------------------------------------------------------------
+# Sensekey maps
+# -------------------------------------------------------------------------------
+
+def read_sensekeys(path):
+    ''' Read a sensekey map: {sensekey: synsetID or None for keys which are not in WordNet} '''
+    if not os.path.isfile(path):
+        return {}
+    with open(path, encoding='utf-8') as infile:
+        return json.load(infile)
+
+
+def save_sensekeys(path, journal):
+    ''' Add the resolutions of journal (see SenseKeyResolver.journal) to the sensekey map at path '''
+    sk_map = read_sensekeys(path)
+    sk_map.update(journal)
+    with atomic_write(path, encoding='utf-8') as outfile:
+        json.dump(sk_map, outfile, indent=1, sort_keys=True)
+    return sk_map
+
+
+def merge_sensekeys(paths, outpath):
+    ''' Merge sensekey maps, a key found by any shard is known '''
+    merged = {}
+    for path in paths:
+        for sk, sid in read_sensekeys(path).items():
+            if sid is not None or sk not in merged:
+                merged[sk] = sid
+    return save_sensekeys(outpath, merged)
+
+
+# -------------------------------------------------------------------------------
+# JSON-lines outputs
+# -------------------------------------------------------------------------------
+
+def _shard_files(root, name):
+    ''' Names of the shard files of a manifest or sensekey map (e.g. .manifest.2of4.json) in root '''
+    prefix, ext = os.path.splitext(name)
+    return sorted(f for f in os.listdir(root) if f.startswith(prefix + '.') and f.endswith(ext) and f != name) \
+        if os.path.isdir(root) else []
+
+
+def merge_outputs(out_root, shard_roots):
+    ''' Combine the JSON-lines outputs of shards (json and ttl tasks) into out_root
+        The outputs listed in the manifests of each shard root are copied, the manifests and sensekey maps are merged
+        into the main ones of out_root. A shard root may be out_root itself (shards which wrote to a shared folder).
+        Return the number of outputs
+    '''
+    entries = read_manifest(os.path.join(out_root, MANIFEST_NAME))
+    sensekeys = [os.path.join(out_root, SENSEKEYS_NAME)]
+    for root in shard_roots:
+        for name in [MANIFEST_NAME] + _shard_files(root, MANIFEST_NAME):
+            for output, record in read_manifest(os.path.join(root, name)).items():
+                src = os.path.join(root, output)
+                if not os.path.isfile(src):
+                    getLogger().warning("Output {} of {} is missing".format(output, root))
+                    continue
+                dest = os.path.join(out_root, output)
+                if os.path.abspath(src) != os.path.abspath(dest):
+                    with open(src, 'rb') as infile, atomic_write(dest, 'wb') as outfile:
+                        shutil.copyfileobj(infile, outfile)
+                entries[output] = record
+        sensekeys.extend(os.path.join(root, name) for name in [SENSEKEYS_NAME] + _shard_files(root, SENSEKEYS_NAME))
+    with atomic_write(os.path.join(out_root, MANIFEST_NAME), encoding='utf-8') as outfile:
+        json.dump(entries, outfile, indent=1, sort_keys=True)
+    if any(os.path.isfile(p) for p in sensekeys):
+        merge_sensekeys(sensekeys, os.path.join(out_root, SENSEKEYS_NAME))
+    # the shard files of out_root are part of the main files now
+    for name in _shard_files(out_root, MANIFEST_NAME) + _shard_files(out_root, SENSEKEYS_NAME):
+        os.unlink(os.path.join(out_root, name))
+    return len(entries)
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+
+'''
+Sentence ID (sid) to byte offset index over Semcor files
+Latest version can be found at https://github.com/letuananh/pysemcor
+
+References:
+    Python documentation:
+        https://docs.python.org/
+    PEP 0008 - Style Guide for Python Code
+        https://www.python.org/dev/peps/pep-0008/
+    PEP 257 - Python Docstring Conventions:
+        https://www.python.org/dev/peps/pep-0257/
+
+@author: Le Tuan Anh <tuananh.ke@gmail.com>
+'''
+
+# Copyright (c) 2017, Le Tuan Anh <tuananh.ke@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+__author__ = "Le Tuan Anh"
+__email__ = "<tuananh.ke@gmail.com>"
+__copyright__ = "Copyright 2017, pysemcor"
+__license__ = "MIT"
+__maintainer__ = "Le Tuan Anh"
+__version__ = "0.1"
+__status__ = "Prototype"
+__credits__ = []
+
+########################################################################
+
+import os
+import re
+import json
+import sqlite3
+import logging
+
+from . import sgml
+from .jsonio import open_file
+
+# -------------------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------------------
+
+# kinds of indexed files
+MARKUP = 'markup'  # fixed XML or original 3rada SGML: one <s> element per sentence
+JSONL = 'jsonl'  # JSON-lines outputs (3rada_json, 3rada_ttl): one sentence per line
+INDEX_VERSION = '1'
+
+_SENTENCE_MARKUP = re.compile(rb'<(/?)(context|p|s)\b([^>]*)>', re.IGNORECASE)
+
+SETUP_SCRIPT = '''
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS source (file TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER);
+CREATE TABLE IF NOT EXISTS sentence (sid TEXT PRIMARY KEY, file TEXT, filename TEXT, para TEXT, snum TEXT,
+                                     offset INTEGER, length INTEGER);
+CREATE INDEX IF NOT EXISTS sentence_file ON sentence (file);
+'''
+
+
+def getLogger():
+    return logging.getLogger(__name__)
+
+
+# -------------------------------------------------------------------------------
+# Scanners
+# -------------------------------------------------------------------------------
+
+def scan_markup(data):
+    ''' Yield (sid, filename, para, snum, offset, length) of each <s> element in the content of a Semcor file '''
+    filename = 'n/a'
+    para = 'n/a'
+    start = None
+    for m in _SENTENCE_MARKUP.finditer(data):
+        closing, tag = m.group(1), m.group(2).lower()
+        if not closing:
+            attrs = dict(sgml.parse_attrs(m.group(3).decode('utf-8')))
+            if tag == b'context':
+                filename = attrs.get('filename')
+            elif tag == b'p':
+                para = attrs.get('pnum')
+            else:
+                start = m.start()
+                snum = attrs.get('snum')
+        elif tag == b's':
+            if start is not None:
+                yield "{}-{}-{}".format(filename, para, snum), filename, para, snum, start, m.end() - start
+            start = None
+        elif tag == b'p':
+            para = 'n/a'
+        else:
+            filename = 'n/a'
+
+
+def record_sid(record):
+    ''' Sentence ID of a JSON record: a sentence dict (3rada_json) or a TTL sentence (3rada_ttl) '''
+    if 'sid' in record:
+        return record['sid']
+    for tag in record.get('tags', ()):
+        if tag.get('type') == 'origid':
+            return tag.get('label')
+    return None
+
+
+def scan_jsonl(data):
+    ''' Yield (sid, filename, para, snum, offset, length) of each line of a JSON-lines file '''
+    offset = 0
+    for line in data.splitlines(True):
+        if line.strip():
+            record = json.loads(line)
+            sid = record_sid(record)
+            if sid is not None:
+                yield sid, record.get('filename'), record.get('para'), record.get('snum'), offset, len(line)
+        offset += len(line)
+
+
+# -------------------------------------------------------------------------------
+# Data structures
+# -------------------------------------------------------------------------------
+
+class SentenceIndex(object):
+
+    ''' A SQLite index sid => (file, byte offset, length) over the files of a FileSet
+        Files which changed (size or mtime) since they were indexed are indexed again by update().
+    '''
+
+    def __init__(self, path, files, kind=MARKUP):
+        self.path = path
+        self.files = files
+        self.kind = kind
+        self.updated = False
+        self._conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path)
+            self._conn.executescript(SETUP_SCRIPT)
+            meta = dict(self._conn.execute('SELECT key, value FROM meta'))
+            if meta and meta != self._meta():
+                getLogger().info("Rebuilding sentence index {}".format(self.path))
+                with self._conn:
+                    self._conn.execute('DELETE FROM sentence')
+                    self._conn.execute('DELETE FROM source')
+                    self._conn.execute('DELETE FROM meta')
+                meta = None
+            if not meta:
+                with self._conn:
+                    self._conn.executemany('INSERT INTO meta VALUES (?, ?)', self._meta().items())
+        return self._conn
+
+    def _meta(self):
+        return {'version': INDEX_VERSION, 'kind': self.kind, 'root': self.files.root}
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def update(self):
+        ''' (Re)index new and changed files, forget files which are no longer in the FileSet
+            Return the number of files that were indexed
+        '''
+        conn = self.conn
+        known = {row[0]: row[1:] for row in conn.execute('SELECT file, size, mtime_ns FROM source')}
+        count = 0
+        with conn:
+            for f in self.files:
+                try:
+                    st = os.stat(self.files.abspath(f))
+                except OSError:
+                    continue
+                if known.pop(f, None) != (st.st_size, st.st_mtime_ns):
+                    self.index_file(f)
+                    count += 1
+            for f in known:
+                self._forget(f)
+        self.updated = True
+        if count:
+            getLogger().debug("Indexed {} file(s) in {}".format(count, self.path))
+        return count
+
+    def index_file(self, f):
+        abspath = self.files.abspath(f)
+        st = os.stat(abspath)
+        with open_file(abspath, 'rb') as infile:
+            data = infile.read()
+        scanner = scan_jsonl if self.kind == JSONL else scan_markup
+        rows = [(sid, f, filename, para, snum, offset, length) for sid, filename, para, snum, offset, length in scanner(data)]
+        self._forget(f)
+        self.conn.executemany('INSERT OR REPLACE INTO sentence VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+        self.conn.execute('INSERT OR REPLACE INTO source VALUES (?, ?, ?)', (f, st.st_size, st.st_mtime_ns))
+
+    def _forget(self, f):
+        self.conn.execute('DELETE FROM sentence WHERE file = ?', (f,))
+        self.conn.execute('DELETE FROM source WHERE file = ?', (f,))
+
+    def lookup(self, sid):
+        ''' Return (file, filename, para, snum, offset, length) of a sentence or None '''
+        if not self.updated:
+            self.update()
+        return self.conn.execute('SELECT file, filename, para, snum, offset, length FROM sentence WHERE sid = ?', (sid,)).fetchone()
+
+    def lookup_many(self, sids, batch_size=500):
+        ''' Return a dict sid => (file, filename, para, snum, offset, length) of the sentences that were found '''
+        if not self.updated:
+            self.update()
+        sids = list(dict.fromkeys(sids))
+        found = {}
+        for idx in range(0, len(sids), batch_size):
+            batch = sids[idx:idx + batch_size]
+            query = 'SELECT sid, file, filename, para, snum, offset, length FROM sentence WHERE sid IN ({})'.format(','.join('?' * len(batch)))
+            for row in self.conn.execute(query, batch):
+                found[row[0]] = row[1:]
+        return found
+
+    def read(self, entry):
+        ''' Read the bytes of an entry (see lookup()), offsets of compressed files are offsets in the uncompressed data '''
+        with open_file(self.files.abspath(entry[0]), 'rb') as infile:
+            infile.seek(entry[4])
+            return infile.read(entry[5])
+
+    def reindex(self, f):
+        ''' Index a file again, e.g. when it was changed after update() '''
+        with self.conn:
+            self.index_file(f)
+
+    def get_record(self, sid, retry=True):
+        ''' Read the JSON record of a sentence from a JSON-lines file, raise KeyError if sid is not indexed '''
+        entry = self.lookup(sid)
+        if entry is None:
+            raise KeyError(sid)
+        record = json.loads(self.read(entry))
+        if record_sid(record) != sid:
+            if not retry:
+                raise KeyError(sid)
+            # the file was changed after it was indexed
+            self.reindex(entry[0])
+            return self.get_record(sid, retry=False)
+        return record
+
+    def __repr__(self):
+        return "SentenceIndex({}, kind={})".format(repr(self.path), self.kind)
+
+
+def jsonl_index(root, path=None):
+    ''' Index the JSON-lines outputs (e.g. data/3rada_json or data/3rada_ttl) under root, at root + '.sid.db' by default '''
+    from .semcorxml import FileSet
+    files = FileSet(root)
+    for folder in ('brown1/tagfiles', 'brown2/tagfiles', 'brownv/tagfiles'):
+        files.add_all(folder)
+    return SentenceIndex(path if path else files.root + '.sid.db', files, kind=JSONL)
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+
+'''
+One-pass train/dev/test splits of JSON and TTL outputs
+Latest version can be found at https://github.com/letuananh/pysemcor
+
+References:
+    Python documentation:
+        https://docs.python.org/
+    PEP 0008 - Style Guide for Python Code
+        https://www.python.org/dev/peps/pep-0008/
+    PEP 257 - Python Docstring Conventions:
+        https://www.python.org/dev/peps/pep-0257/
+
+@author: Le Tuan Anh <tuananh.ke@gmail.com>
+'''
+
+# Copyright (c) 2017, Le Tuan Anh <tuananh.ke@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+__author__ = "Le Tuan Anh"
+__email__ = "<tuananh.ke@gmail.com>"
+__copyright__ = "Copyright 2017, pysemcor"
+__license__ = "MIT"
+__maintainer__ = "Le Tuan Anh"
+__version__ = "0.1"
+__status__ = "Prototype"
+__credits__ = []
+
+########################################################################
+
+import os
+import heapq
+import hashlib
+import logging
+from contextlib import ExitStack
+
+from .jsonio import jsonl_writer, compressed_name
+
+# -------------------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------------------
+
+# a split assigns sentences or whole documents to partitions
+SENTENCE = 'sentence'
+DOCUMENT = 'document'
+UNITS = (SENTENCE, DOCUMENT)
+# fixed-size samples take the units with the smallest hashes of the keys salted with this
+SAMPLE_SALT = 'sample:'
+
+
+def getLogger():
+    return logging.getLogger(__name__)
+
+
+# -------------------------------------------------------------------------------
+# Partitions
+# -------------------------------------------------------------------------------
+
+def stable_hash(key):
+    ''' Hash a string to a float in [0, 1), it is the same in every process, run and Python version '''
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big') / (1 << 64)
+
+
+def parse_partition(text):
+    ''' Parse a partition given as NAME=FRACTION (e.g. dev=10% or dev=0.1), NAME=SIZE (e.g. test=1000) or NAME
+        Return (name, value) where value is a float (fraction), an int (sample size) or None (the rest)
+    '''
+    name, sep, value = text.partition('=')
+    if not name or (sep and not value):
+        raise ValueError("Invalid partition {} (expected NAME, NAME=SIZE or NAME=FRACTION)".format(repr(text)))
+    if not sep:
+        return name, None
+    try:
+        if value.endswith('%'):
+            fraction = float(value[:-1]) / 100
+        elif '.' in value:
+            fraction = float(value)
+        else:
+            size = int(value)
+            if size < 0:
+                raise ValueError(value)
+            return name, size
+    except ValueError:
+        raise ValueError("Invalid partition {} (expected NAME, NAME=SIZE or NAME=FRACTION)".format(repr(text)))
+    if not 0 <= fraction <= 1:
+        raise ValueError("Invalid partition {} (a fraction must be between 0 and 1)".format(repr(text)))
+    return name, fraction
+
+
+class SplitWriter(object):
+
+    ''' Write sentences to named partitions (one JSON-lines file each) in a single pass
+        partitions: (name, value) pairs, see parse_partition()
+        - a fixed-size partition (value is an int) is a sample of that many units, the ones with the smallest hashes,
+          so samples do not depend on the order of the input and never overlap
+        - other units are assigned by the hash of their key to fraction partitions (in the given order),
+          the partition without a value takes what the fractions leave
+        by: SENTENCE (keyed by sid) or DOCUMENT (keyed by document name, all its sentences go to the same partition)
+        Only samples are kept in memory until close(), a unit which is pushed out of a sample is written at once.
+        Samples are written in input order.
+    '''
+
+    def __init__(self, out_dir, partitions, by=SENTENCE, compression=None, ensure_ascii=True):
+        if by not in UNITS:
+            raise ValueError("Unknown split unit: {} (expected one of {})".format(by, ', '.join(UNITS)))
+        partitions = list(partitions)
+        names = [name for name, _ in partitions]
+        if not partitions or len(set(names)) != len(names):
+            raise ValueError("Partition names must be given and unique: {}".format(names))
+        self.out_dir = out_dir
+        self.by = by
+        self.compression = compression
+        self.ensure_ascii = ensure_ascii
+        self.samples = [(name, value) for name, value in partitions if isinstance(value, int)]
+        fractions = [(name, value) for name, value in partitions if isinstance(value, float)]
+        rest = [name for name, value in partitions if value is None]
+        total = sum(value for _, value in fractions)
+        if len(rest) > 1:
+            raise ValueError("Only one partition can take the rest: {}".format(rest))
+        if total > 1 + 1e-9:
+            raise ValueError("Fractions add up to more than 1: {}".format(total))
+        if fractions and not rest and total < 1 - 1e-9:
+            raise ValueError("Fractions add up to {}, add a partition without size to take the rest".format(total))
+        # (upper bound, name) of the fraction partitions
+        self.bounds = []
+        bound = 0.0
+        for name, value in fractions + [(name, 1 - total) for name in rest]:
+            bound += value
+            self.bounds.append((bound, name))
+        self.sample_size = sum(size for _, size in self.samples)
+        # key => [-hash, order, lines], largest hash on top of the heap
+        self._sampled = {}
+        self._heap = []
+        self._order = 0
+        self._stack = None
+        self.writers = {}
+        self.counts = {name: 0 for name in names}
+        self.dropped = 0
+
+    def path(self, name):
+        return os.path.join(self.out_dir, compressed_name(name + '.json', self.compression))
+
+    def open(self):
+        self._stack = ExitStack()
+        for name in self.counts:
+            self.writers[name] = self._stack.enter_context(jsonl_writer(self.path(name), ensure_ascii=self.ensure_ascii))
+        return self
+
+    def close(self):
+        ''' Write the samples, then move all files into place '''
+        self.flush_samples()
+        self.writers = {}
+        self._stack.close()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # no partition is written when the conversion fails
+            self.writers = {}
+            self._stack.__exit__(exc_type, exc_value, traceback)
+
+    def assign(self, key):
+        ''' Fraction partition of a key (None when fractions are not used and the unit is dropped) '''
+        h = stable_hash(key)
+        for bound, name in self.bounds:
+            if h < bound:
+                return name
+        return self.bounds[-1][1] if self.bounds else None
+
+    def write(self, sid, document, line):
+        ''' Add a sentence (line is its encoded JSON, see jsonio.dumps()) '''
+        key = sid if self.by == SENTENCE else document
+        if self.sample_size:
+            entry = self._sampled.get(key)
+            if entry is not None:
+                entry[2].append(line)
+                return
+            neg_hash = -stable_hash(SAMPLE_SALT + key)
+            if len(self._heap) < self.sample_size or neg_hash > self._heap[0][0]:
+                entry = [neg_hash, self._order, [line]]
+                self._order += 1
+                self._sampled[key] = entry
+                if len(self._heap) < self.sample_size:
+                    heapq.heappush(self._heap, (neg_hash, key))
+                else:
+                    _, evicted = heapq.heapreplace(self._heap, (neg_hash, key))
+                    self._write_rest(evicted, self._sampled.pop(evicted)[2])
+                return
+        self._write_rest(key, (line,))
+
+    def _write_rest(self, key, lines):
+        name = self.assign(key)
+        if name is None:
+            self.dropped += len(lines)
+            return
+        writer = self.writers[name]
+        for line in lines:
+            writer.write_encoded(line)
+        self.counts[name] += len(lines)
+
+    def flush_samples(self):
+        ''' Write the samples: the first sample partition gets the smallest hashes '''
+        entries = sorted(self._sampled.values(), key=lambda entry: (-entry[0], entry[1]))
+        start = 0
+        for name, size in self.samples:
+            writer = self.writers[name]
+            for entry in sorted(entries[start:start + size], key=lambda entry: entry[1]):
+                for line in entry[2]:
+                    writer.write_encoded(line)
+                self.counts[name] += len(entry[2])
+            start += size
+        self._sampled = {}
+        self._heap = []
+
+    def __repr__(self):
+        return "SplitWriter({}, by={}, counts={})".format(repr(self.out_dir), self.by, self.counts)
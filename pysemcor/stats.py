@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+
+'''
+Single-pass corpus statistics with mergeable aggregators
+Latest version can be found at https://github.com/letuananh/pysemcor
+
+References:
+    Python documentation:
+        https://docs.python.org/
+    PEP 0008 - Style Guide for Python Code
+        https://www.python.org/dev/peps/pep-0008/
+    PEP 257 - Python Docstring Conventions:
+        https://www.python.org/dev/peps/pep-0257/
+
+@author: Le Tuan Anh <tuananh.ke@gmail.com>
+'''
+
+# Copyright (c) 2017, Le Tuan Anh <tuananh.ke@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+__author__ = "Le Tuan Anh"
+__email__ = "<tuananh.ke@gmail.com>"
+__copyright__ = "Copyright 2017, pysemcor"
+__license__ = "MIT"
+__maintainer__ = "Le Tuan Anh"
+__version__ = "0.1"
+__status__ = "Prototype"
+__credits__ = []
+
+########################################################################
+
+import json
+import logging
+from collections import Counter
+
+from .semcorxml import FileSet, run_tasks
+from .jsonio import read_jsonl
+from .manifest import atomic_write
+
+# -------------------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------------------
+
+
+def getLogger():
+    return logging.getLogger(__name__)
+
+
+# -------------------------------------------------------------------------------
+# Sources
+# -------------------------------------------------------------------------------
+
+class JsonLinesSource(object):
+
+    ''' JSON-lines outputs (e.g. data/3rada_ttl) with the same files/iterparse() interface as SemcorXML '''
+
+    def __init__(self, root, include=None, exclude=None):
+        self.files = FileSet(root, include=include, exclude=exclude)
+        for folder in ('brown1/tagfiles', 'brown2/tagfiles', 'brownv/tagfiles'):
+            self.files.add_all(folder)
+
+    @property
+    def root(self):
+        return self.files.root
+
+    def iterparse(self, path):
+        return read_jsonl(self.files.abspath(path))
+
+
+# -------------------------------------------------------------------------------
+# Aggregators
+# -------------------------------------------------------------------------------
+
+def ranked(counter):
+    ''' Items of a Counter, most common first and ties by key
+        (unlike Counter.most_common() the order does not depend on the order the counts were added in)
+    '''
+    return sorted(counter.items(), key=lambda item: (-item[1], str(item[0])))
+
+
+class Aggregator(object):
+
+    ''' A statistic computed by StatsEngine
+        add() is called with every record of a source (a sentence dict of SemcorXML or a JSON record),
+        partial results from worker processes are combined with merge()
+    '''
+
+    def spawn(self):
+        ''' Create an empty aggregator of the same kind (used for partial results) '''
+        return type(self)()
+
+    def add(self, record):
+        raise NotImplementedError
+
+    def merge(self, other):
+        ''' Add the counts of another aggregator of the same kind, the default merges all Counter attributes '''
+        for key, value in vars(other).items():
+            if isinstance(value, Counter):
+                getattr(self, key).update(value)
+
+    def to_json(self):
+        ''' Counter attributes as {name: [[key, count], ...]}, tuple keys are written as lists '''
+        return {key: [[list(k) if isinstance(k, tuple) else k, v] for k, v in value.items()]
+                for key, value in vars(self).items() if isinstance(value, Counter)}
+
+    def from_json(self, state):
+        ''' Create an aggregator of the same kind from the output of to_json() '''
+        aggregator = self.spawn()
+        for key, items in state.items():
+            getattr(aggregator, key).update({tuple(k) if isinstance(k, list) else k: v for k, v in items})
+        return aggregator
+
+
+class CorpusSize(Aggregator):
+
+    ''' Number of files, sentences, tokens and sense-tagged tokens of a Semcor corpus '''
+
+    def __init__(self):
+        self.counts = Counter()
+
+    def add(self, record):
+        self.counts['sentences'] += 1
+        self.counts['tokens'] += len(record['tokens'])
+        self.counts['sense-tagged tokens'] += sum(1 for t in record['tokens'] if 'sk' in t)
+
+
+class RdfValues(Aggregator):
+
+    ''' rdf values as (lemma, rdf, sensekey) and ot values of Semcor tokens '''
+
+    def __init__(self):
+        self.rdf = Counter()
+        self.rdf_with_key = Counter()
+        self.ot = Counter()
+
+    def add(self, record):
+        for t in record['tokens']:
+            if 'rdf' in t:
+                item = (t.lemma, t['rdf'], t.get('sk', ''))
+                self.rdf[item] += 1
+                if item[2]:
+                    self.rdf_with_key[item] += 1
+            if 'ot' in t:
+                self.ot[t['ot']] += 1
+
+
+class PosSenses(Aggregator):
+
+    ''' Sense-tagged tokens and distinct sensekeys per POS '''
+
+    def __init__(self):
+        self.senses = Counter()
+
+    def add(self, record):
+        for t in record['tokens']:
+            if 'sk' in t:
+                self.senses[(t.get('pos'), t['sk'])] += 1
+
+    def by_pos(self):
+        ''' Return a list of (pos, tagged tokens, distinct senses), most tagged POS first '''
+        tokens = Counter()
+        senses = Counter()
+        for (pos, sk), count in self.senses.items():
+            tokens[pos] += count
+            senses[pos] += 1
+        return [(pos, count, senses[pos]) for pos, count in ranked(tokens)]
+
+
+class ConceptStats(Aggregator):
+
+    ''' Known (synsetID) and unknown (sensekey) concepts of TTL sentences (e.g. data/3rada_ttl) '''
+
+    def __init__(self):
+        # yawlib is imported here rather than for each record (add() is called for every sentence)
+        from yawlib import SynsetID
+        self._parse_synset = SynsetID.from_string
+        self.known = Counter()
+        self.unknown = Counter()
+        self.instances = Counter()
+
+    def add(self, record):
+        parse_synset = self._parse_synset
+        for concept in record.get('concepts', ()):
+            tag = concept.get('tag')
+            try:
+                sid = str(parse_synset(tag))
+            except Exception:
+                self.unknown[(tag, concept.get('clemma'))] += 1
+                self.instances['Unknown instances'] += 1
+            else:
+                self.known[(sid, concept.get('clemma'))] += 1
+                self.instances['Known instances'] += 1
+
+
+# -------------------------------------------------------------------------------
+# Engine
+# -------------------------------------------------------------------------------
+
+class StatsEngine(object):
+
+    ''' Run all registered aggregators in a single pass over a source (SemcorXML or JsonLinesSource)
+        With jobs > 1 the files are split across worker processes and the partial results are merged.
+    '''
+
+    def __init__(self, *aggregators):
+        self.aggregators = list(aggregators)
+        self.files = 0
+        self.failures = []
+
+    def register(self, aggregator):
+        self.aggregators.append(aggregator)
+        return aggregator
+
+    def run(self, source, limit=None, jobs=1):
+        ''' Feed every record of source to all aggregators, return a list of (path, error) of the files that failed '''
+        files = source.files[:limit] if limit else source.files
+        if jobs != 1:
+            # results are merged in any order, so big files go first to keep all workers busy
+            files = source.files.largest_first(files)
+        # each file is counted by new aggregators, so a file that fails half-way does not leave partial counts
+        tasks = [(f, source, [a.spawn() for a in self.aggregators]) for f in files]
+        failures = run_tasks(_feed_file, tasks, jobs=jobs, on_result=self._merge)
+        self.failures.extend(failures)
+        return failures
+
+    def save(self, path):
+        ''' Write the counts of all aggregators to a JSON file, e.g. the partial statistics of a shard '''
+        state = {'files': self.files, 'aggregators': [[type(a).__name__, a.to_json()] for a in self.aggregators]}
+        with atomic_write(path, encoding='utf-8') as outfile:
+            json.dump(state, outfile)
+
+    def load(self, path):
+        ''' Merge the counts saved by save() (the same aggregators must be registered in the same order) '''
+        with open(path, encoding='utf-8') as infile:
+            state = json.load(infile)
+        names = [name for name, _ in state['aggregators']]
+        if names != [type(a).__name__ for a in self.aggregators]:
+            raise ValueError("{} holds the statistics of {}".format(path, ', '.join(names)))
+        self.files += state['files']
+        for aggregator, (_, counts) in zip(self.aggregators, state['aggregators']):
+            aggregator.merge(aggregator.from_json(counts))
+
+    def _merge(self, task, partials):
+        self.files += 1
+        for aggregator, partial in zip(self.aggregators, partials):
+            aggregator.merge(partial)
+
+
+def _feed_file(path, source, aggregators):
+    ''' Feed all records of a file to aggregators, return the aggregators '''
+    for record in source.iterparse(path):
+        for aggregator in aggregators:
+            aggregator.add(record)
+    return aggregators
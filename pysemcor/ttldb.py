@@ -0,0 +1,418 @@
+# -*- coding: utf-8 -*-
+
+'''
+Bulk loader for TTL SQLite databases
+Latest version can be found at https://github.com/letuananh/pysemcor
+
+References:
+    Python documentation:
+        https://docs.python.org/
+    PEP 0008 - Style Guide for Python Code
+        https://www.python.org/dev/peps/pep-0008/
+    PEP 257 - Python Docstring Conventions:
+        https://www.python.org/dev/peps/pep-0257/
+
+@author: Le Tuan Anh <tuananh.ke@gmail.com>
+'''
+
+# Copyright (c) 2017, Le Tuan Anh <tuananh.ke@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+__author__ = "Le Tuan Anh"
+__email__ = "<tuananh.ke@gmail.com>"
+__copyright__ = "Copyright 2017, pysemcor"
+__license__ = "MIT"
+__maintainer__ = "Le Tuan Anh"
+__version__ = "0.1"
+__status__ = "Prototype"
+__credits__ = []
+
+########################################################################
+
+import os
+import time
+import sqlite3
+import logging
+
+from . import instrument
+from .semcorxml import run_tasks, get_wordnet, record_sensekeys, _init_ttl_worker, _resolving_worker
+from .sensekeys import SenseKeyResolver
+from .jsonio import read_jsonl, strip_compression
+
+# -------------------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------------------
+
+# tables that are filled by the loader, their secondary indexes are built after the load
+DATA_TABLES = ('sentence', 'token', 'concept', 'tag', 'cwl')
+# a killed load must leave a valid database so that it can be resumed: WAL keeps each document transaction
+# atomic and NORMAL only skips the fsync of each commit (a crash may lose the last documents, which are loaded again)
+LOAD_PRAGMAS = ('PRAGMA journal_mode = WAL',
+                'PRAGMA synchronous = NORMAL',
+                'PRAGMA temp_store = MEMORY',
+                'PRAGMA cache_size = -262144')
+# indexes dropped during a load are kept here until they are built again, so that a load which was killed
+# before it could rebuild them still gets them back on its next run
+DROPPED_INDEX_TABLE = 'pysemcor_dropped_index'
+
+SENT_SQL = 'INSERT INTO sentence (ID, ident, text, docID, flag, comment) VALUES (?, ?, ?, ?, ?, ?)'
+TOKEN_SQL = 'INSERT INTO token (ID, sid, widx, cfrom, cto, text, lemma, pos, comment) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'
+CONCEPT_SQL = 'INSERT INTO concept (ID, sid, cidx, clemma, tag, flag, comment) VALUES (?, ?, ?, ?, ?, ?, ?)'
+TAG_SQL = 'INSERT INTO tag (ID, sid, wid, cfrom, cto, label, source, tagtype) VALUES (?, ?, ?, ?, ?, ?, ?, ?)'
+CWL_SQL = 'INSERT INTO cwl (sid, cid, wid) VALUES (?, ?, ?)'
+
+
+def getLogger():
+    return logging.getLogger(__name__)
+
+
+# -------------------------------------------------------------------------------
+# Parsing
+# -------------------------------------------------------------------------------
+
+def _tag_pos(value):
+    ''' Tags without a position are stored as NULL (see TTLSQLite.simplify_tag()) '''
+    return None if value is None or value == -1 else int(value)
+
+
+def new_rows():
+    ''' Empty rows of a document: (sentences, tokens, concepts, tags, cwl) '''
+    return [], [], [], [], []
+
+
+def sentence_rows(sent, rows):
+    ''' Append the rows of a TTL sentence (a dict, see ttl.Sentence.to_json()) to the rows of its document
+        IDs are local to the document: sentences, tokens, concepts and tags are numbered from 0 in the order
+        TTLSQLite.save_sent() would insert them, tokens and tags refer to the local index of their sentence and token.
+    '''
+    sents, tokens, concepts, tags, cwl = rows
+    sidx = len(sents)
+    sents.append((None, sent['text'], sent.get('flag'), sent.get('comment')))
+    for tag in sent.get('tags', ()):
+        tags.append((sidx, None, _tag_pos(tag.get('cfrom')), _tag_pos(tag.get('cto')),
+                     tag.get('label', ''), tag.get('source') or None, tag.get('type', '')))
+    first = len(tokens)
+    for widx, token in enumerate(sent.get('tokens', ())):
+        tokens.append((sidx, widx, token.get('cfrom', -1), token.get('cto', -1), token.get('text', ''),
+                       token.get('lemma'), token.get('pos'), token.get('comment')))
+        for tag in token.get('tags', ()):
+            tags.append((sidx, first + widx, _tag_pos(tag.get('cfrom')), _tag_pos(tag.get('cto')),
+                         tag.get('label', ''), tag.get('source') or None, tag.get('type', '')))
+    for cidx, concept in enumerate(sent.get('concepts', ())):
+        cid = len(concepts)
+        concepts.append((sidx, cidx, concept['clemma'], str(concept['tag']),
+                         concept.get('flag'), concept.get('comment', '')))
+        cwl.extend((sidx, cid, first + widx) for widx in concept.get('tokens', ()))
+
+
+def doc_name(path):
+    return os.path.splitext(os.path.basename(strip_compression(path)))[0]
+
+
+def doc_rows(path):
+    ''' Read a TTL JSON lines file (which may be compressed) into the rows of one document (see sentence_rows())
+        Return (name, sentences, tokens, concepts, tags, cwl)
+    '''
+    rows = new_rows()
+    for sent in read_jsonl(path):
+        sentence_rows(sent, rows)
+    return (doc_name(path),) + rows
+
+
+def semcor_rows(inpath, scxml, with_nonsense=True, resolver=None):
+    ''' Convert a Semcor file straight into the rows of one document, without writing TTL JSON in between
+        Return (name, sentences, tokens, concepts, tags, cwl)
+    '''
+    rows = new_rows()
+    rec = instrument.recorder
+    if rec is not None:
+        counters = resolver.counters if resolver is not None else None
+    for s in scxml.iterparse_ttl(inpath, with_nonsense=with_nonsense, resolver=resolver):
+        sentence_rows(s.to_json(), rows)
+    if rec is not None and resolver is not None:
+        record_sensekeys(rec, inpath, counters, resolver.counters)
+    return (doc_name(inpath),) + rows
+
+
+def stored_rows(conn, doc_id):
+    ''' Read a document of a TTL SQLite database back into document-local rows (see sentence_rows())
+        Return (sentences, tokens, concepts, tags, cwl)
+    '''
+    in_doc = 'sid IN (SELECT ID FROM sentence WHERE docID = ?) ORDER BY '
+    sents, tokens, concepts, tags, cwl = new_rows()
+    sidx = {}
+    for sid, ident, text, flag, comment in conn.execute(
+            'SELECT ID, ident, text, flag, comment FROM sentence WHERE docID = ? ORDER BY ID', (doc_id,)):
+        sidx[sid] = len(sents)
+        sents.append((ident, text, flag, comment))
+    widx = {}
+    for row in conn.execute('SELECT ID, sid, widx, cfrom, cto, text, lemma, pos, comment FROM token WHERE ' + in_doc + 'ID',
+                            (doc_id,)):
+        widx[row[0]] = len(tokens)
+        tokens.append((sidx[row[1]],) + row[2:])
+    for row in conn.execute('SELECT sid, wid, cfrom, cto, label, source, tagtype FROM tag WHERE ' + in_doc + 'ID', (doc_id,)):
+        tags.append((sidx[row[0]], None if row[1] is None else widx[row[1]]) + row[2:])
+    cidx = {}
+    for row in conn.execute('SELECT ID, sid, cidx, clemma, tag, flag, comment FROM concept WHERE ' + in_doc + 'ID',
+                            (doc_id,)):
+        cidx[row[0]] = len(concepts)
+        concepts.append((sidx[row[1]],) + row[2:])
+    for sid, cid, wid in conn.execute('SELECT sid, cid, wid FROM cwl WHERE ' + in_doc + 'rowid', (doc_id,)):
+        cwl.append((sidx[sid], cidx[cid], widx[wid]))
+    return sents, tokens, concepts, tags, cwl
+
+
+def _doc_rows_worker(path, corpus):
+    return doc_rows(path)
+
+
+def _semcor_rows(inpath, corpus, scxml, with_nonsense, resolver):
+    return semcor_rows(inpath, scxml, with_nonsense, resolver)
+
+
+def _semcor_rows_worker(inpath, corpus, scxml, with_nonsense):
+    ''' Return the rows of a file and what the worker's resolver learnt (see semcorxml._resolving_worker()) '''
+    return _resolving_worker(semcor_rows, inpath, scxml, with_nonsense)
+
+
+# -------------------------------------------------------------------------------
+# Loader
+# -------------------------------------------------------------------------------
+
+class BulkLoader(object):
+
+    ''' Load TTL documents into a TTL SQLite database with one transaction per document
+        Rows are inserted with executemany() and explicit IDs, secondary indexes of the data tables
+        are dropped during the load and built again afterwards (or by the next load if this one is killed).
+    '''
+
+    def __init__(self, path):
+        from texttaglib import TTLSQLite
+        # let texttaglib create the schema
+        self.db = TTLSQLite(path)
+        self.path = path
+        self.conn = None
+        self.corpuses = {}
+        self.docs = set()
+        self.next_ids = {}
+        self.counts = dict.fromkeys(('document',) + DATA_TABLES, 0)
+        self.skipped = []
+        self.elapsed = 0.0
+
+    def ensure_corpus(self, name):
+        if name not in self.corpuses:
+            self.corpuses[name] = self.db.ensure_corpus(name=name).ID
+        return self.corpuses[name]
+
+    def open(self):
+        self.conn = sqlite3.connect(self.path)
+        for pragma in LOAD_PRAGMAS:
+            self.conn.execute(pragma)
+        self.docs = {name for (name,) in self.conn.execute('SELECT name FROM document')}
+        for table in DATA_TABLES[:-1]:
+            self.next_ids[table] = self.conn.execute('SELECT IFNULL(MAX(ID), 0) + 1 FROM {}'.format(table)).fetchone()[0]
+
+    def close(self):
+        if self.conn is not None:
+            # back to a single database file (WAL is a persistent setting)
+            self.conn.execute('PRAGMA journal_mode = DELETE')
+            self.conn.close()
+            self.conn = None
+
+    def drop_indexes(self):
+        ''' Drop the secondary indexes of the data tables, return their definitions
+            The definitions are saved in DROPPED_INDEX_TABLE first, in the same transaction.
+        '''
+        where = "type = 'index' AND sql IS NOT NULL AND tbl_name IN ({})".format(','.join('?' * len(DATA_TABLES)))
+        indexes = self.conn.execute('SELECT name, sql FROM sqlite_master WHERE ' + where, DATA_TABLES).fetchall()
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS {} (name TEXT, sql TEXT)'.format(DROPPED_INDEX_TABLE))
+            for name, sql in indexes:
+                self.conn.execute('DELETE FROM {} WHERE name = ?'.format(DROPPED_INDEX_TABLE), (name,))
+                self.conn.execute('INSERT INTO {} (name, sql) VALUES (?, ?)'.format(DROPPED_INDEX_TABLE), (name, sql))
+                self.conn.execute('DROP INDEX "{}"'.format(name))
+        return [sql for _, sql in indexes]
+
+    def create_indexes(self):
+        ''' Build all indexes saved by drop_indexes(), including those of an earlier load that was killed '''
+        found = self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (DROPPED_INDEX_TABLE,)).fetchone()
+        if found is None:
+            return
+        with self.conn:
+            for name, sql in self.conn.execute('SELECT name, sql FROM {} ORDER BY rowid'.format(DROPPED_INDEX_TABLE)).fetchall():
+                if self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (name,)).fetchone() is None:
+                    self.conn.execute(sql)
+            self.conn.execute('DROP TABLE {}'.format(DROPPED_INDEX_TABLE))
+
+    def skip(self, name):
+        getLogger().warning("Doc {} exists. Cannot import".format(name))
+        self.skipped.append(name)
+
+    def write_doc(self, corpus, name, sents, tokens, concepts, tags, cwl):
+        ''' Insert the rows of a document (see doc_rows()) in a single transaction '''
+        if name in self.docs:
+            self.skip(name)
+            return False
+        corpus_id = self.ensure_corpus(corpus)
+        ids = self.next_ids
+        sid0, wid0, cid0, tid0 = ids['sentence'], ids['token'], ids['concept'], ids['tag']
+        with self.conn:
+            doc_id = self.conn.execute('INSERT INTO document (name, title, lang, corpusID) VALUES (?, ?, ?, ?)',
+                                       (name, '', '', corpus_id)).lastrowid
+            self.conn.executemany(SENT_SQL, [(sid0 + idx, ident, text, doc_id, flag, comment)
+                                             for idx, (ident, text, flag, comment) in enumerate(sents)])
+            self.conn.executemany(TOKEN_SQL, [(wid0 + idx, sid0 + row[0]) + row[1:] for idx, row in enumerate(tokens)])
+            self.conn.executemany(TAG_SQL, [(tid0 + idx, sid0 + row[0], None if row[1] is None else wid0 + row[1]) + row[2:]
+                                            for idx, row in enumerate(tags)])
+            self.conn.executemany(CONCEPT_SQL, [(cid0 + idx, sid0 + row[0]) + row[1:] for idx, row in enumerate(concepts)])
+            self.conn.executemany(CWL_SQL, [(sid0 + sidx, cid0 + cid, wid0 + wid) for sidx, cid, wid in cwl])
+        ids['sentence'] += len(sents)
+        ids['token'] += len(tokens)
+        ids['concept'] += len(concepts)
+        ids['tag'] += len(tags)
+        self.docs.add(name)
+        counts = self.counts
+        counts['document'] += 1
+        counts['sentence'] += len(sents)
+        counts['token'] += len(tokens)
+        counts['concept'] += len(concepts)
+        counts['tag'] += len(tags)
+        counts['cwl'] += len(cwl)
+        return True
+
+    def load(self, files, jobs=1, on_doc=None):
+        ''' Load TTL JSON lines files, given as (path, corpus name) pairs
+            Parsing is done by jobs worker processes and all writes happen here.
+            on_doc(path, corpus, written) is called after each document.
+            Return a list of (path, error) for the files that could not be loaded
+        '''
+        return self._load(_doc_rows_worker, list(files), jobs=jobs, on_doc=on_doc)
+
+    def load_semcor(self, scxml, limit=None, with_nonsense=True, jobs=1, resolver=None, preload=True, on_doc=None):
+        ''' Convert Semcor files (a SemcorXML) to TTL and load them in a single streaming pass
+            Only one document per worker is kept in memory. Documents which are already in the database
+            are skipped, so an interrupted load can simply be run again.
+            Sensekeys are resolved as in SemcorXML.convert_to_ttl()
+        '''
+        if resolver is None:
+            resolver = SenseKeyResolver()
+        files = [(f, f[:6]) for f in (scxml.files[:limit] if limit else scxml.files)]
+        scxml.seed_resolver(resolver)
+        if jobs == 1:
+            with get_wordnet().ctx() as wnctx:
+                resolver.wnctx = wnctx
+                if preload and not resolver.preloaded:
+                    resolver.preload()
+                try:
+                    return self._load(_semcor_rows, files, (scxml, with_nonsense, resolver), on_doc=on_doc)
+                finally:
+                    resolver.wnctx = None
+        else:
+            return self._load(_semcor_rows_worker, files, (scxml, with_nonsense), jobs=jobs, on_doc=on_doc,
+                              initializer=_init_ttl_worker, initargs=(resolver.sk_map, resolver.unknown, preload),
+                              merge=resolver.merge)
+
+    def _load(self, func, files, args=(), jobs=1, on_doc=None, initializer=None, initargs=(), merge=None):
+        ''' Call func(path, corpus, *args) for each (path, corpus) pair
+            which is not in the database yet and write the rows it returns, one document at a time.
+            With merge, func returns (rows, resolved) and merge(*resolved) is called (see _resolving_worker())
+        '''
+        for _, corpus in files:
+            self.ensure_corpus(corpus)
+        self.open()
+        todo = []
+        for path, corpus in files:
+            if doc_name(path) in self.docs:
+                self.skip(doc_name(path))
+                if on_doc is not None:
+                    on_doc(path, corpus, False)
+            else:
+                todo.append((path, corpus) + tuple(args))
+        self.drop_indexes()
+        started = time.perf_counter()
+
+        def _write(task, rows):
+            path, corpus = task[:2]
+            if merge is not None:
+                rows, resolved = rows
+                merge(*resolved)
+            rec = instrument.recorder
+            if rec is None:
+                written = self.write_doc(corpus, *rows)
+            else:
+                with rec.measure(instrument.WRITE, path, sentences=len(rows[1]), tokens=len(rows[2])):
+                    written = self.write_doc(corpus, *rows)
+            if on_doc is not None:
+                on_doc(path, corpus, written)
+        try:
+            failures = run_tasks(func, todo, jobs=jobs, initializer=initializer, initargs=initargs, on_result=_write)
+        finally:
+            self.create_indexes()
+            self.elapsed = time.perf_counter() - started
+            self.close()
+        return failures
+
+    def merge(self, paths, order=(), on_doc=None):
+        ''' Copy the documents of shard databases (e.g. written by main.py db --shard) into this database
+            order: (path, corpus) pairs of the whole corpus as given to load() or load_semcor(), documents are written
+            in this order so that all IDs are the same as if the corpus had been loaded at once.
+            Documents which are not in order follow in the order of the shards.
+            on_doc(name, corpus, written) is called after each document.
+        '''
+        shards = [sqlite3.connect(path) for path in paths]
+        try:
+            found = {}
+            for conn in shards:
+                for doc_id, name, corpus in conn.execute('SELECT document.ID, document.name, corpus.name FROM document '
+                                                         'JOIN corpus ON document.corpusID = corpus.ID ORDER BY document.ID'):
+                    found.setdefault(name, (conn, doc_id, corpus))
+            names = dict.fromkeys(doc_name(path) for path, _ in order)
+            names.update(dict.fromkeys(found))
+            for _, corpus in order:
+                self.ensure_corpus(corpus)
+            self.open()
+            self.drop_indexes()
+            started = time.perf_counter()
+            try:
+                for name in names:
+                    if name not in found:
+                        continue
+                    conn, doc_id, corpus = found[name]
+                    written = self.write_doc(corpus, name, *stored_rows(conn, doc_id))
+                    if on_doc is not None:
+                        on_doc(name, corpus, written)
+            finally:
+                self.create_indexes()
+                self.elapsed = time.perf_counter() - started
+                self.close()
+        finally:
+            for conn in shards:
+                conn.close()
+
+    @property
+    def rows(self):
+        return sum(self.counts.values())
+
+    @property
+    def rows_per_sec(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def __repr__(self):
+        return "BulkLoader({} rows in {:.2f}s, {:.0f} rows/s)".format(self.rows, self.elapsed, self.rows_per_sec)
@@ -50,13 +50,51 @@ __credits__ = []
 ########################################################################
 
 import os
+import sys
+import argparse
+import importlib.util
 import logging
+import json
+import pickle
+import itertools
+import random
+import sqlite3
+import subprocess
 import unittest
+import shutil
+import tempfile
+from io import StringIO
+from contextlib import redirect_stdout
+from unittest import mock
+from collections import Counter
+
+from lxml import etree
 
 from chirptext import header
-from pysemcor.semcorxml import FileSet, SemcorXML
+from yawlib import WordnetSQL
+from pysemcor import semcorxml
+from pysemcor.semcorxml import FileSet, SemcorXML, SentenceFilter, TokenInfo
 from pysemcor.semcorxml import fix_3rada, fix_token_text, xml2json
+from pysemcor.semcorxml import fix_malformed_xml_file
+from pysemcor import sgml
+from pysemcor import jsonio
+from pysemcor import instrument
+from pysemcor.manifest import is_complete_jsonl
+from pysemcor.normaliser import Normaliser, load_rules
+from pysemcor.semcorxml import to_ttl
+from pysemcor.sensekeys import SenseKeyResolver
+from pysemcor.corpus import SemcorCorpus, COLUMNS
+from pysemcor import cache as sccache
+from pysemcor.sidindex import jsonl_index
+from pysemcor.query import QueryIndex, query_index
+from pysemcor.stats import StatsEngine, CorpusSize, RdfValues, PosSenses, ConceptStats, JsonLinesSource
 from pysemcor.miner import mine_rdf_values
+from pysemcor.ttldb import BulkLoader
+from pysemcor import columnar
+from pysemcor.split import SplitWriter, parse_partition, stable_hash, SAMPLE_SALT, DOCUMENT
+from pysemcor.shard import parse_shard, partition, sensekeys_name, save_sensekeys, read_sensekeys, merge_outputs
+from bench.synth import generate, write_large_file
+from bench.run import run_stage
 
 
 # -------------------------------------------------------------------------------
@@ -66,10 +104,29 @@ from pysemcor.miner import mine_rdf_values
 logger = logging.getLogger(__name__)
 TEST_DIR = os.path.dirname(os.path.realpath(__file__))
 TEST_DATA = os.path.join(TEST_DIR, 'data')
+PROJECT_ROOT = os.path.dirname(TEST_DIR)
 SEMCOR_ORIG = os.path.abspath('./data/3rada')
-SEMCOR_FIXED = os.path.abspath('./data/3rada_fixed')
-SEMCOR_JSON = os.path.abspath('./data/3rada_json')
-SEMCOR_TTL = os.path.abspath('./data/3rada_ttl')
+# the repaired corpus and all outputs are written to a temporary folder (see setUpModule())
+SEMCOR_OUT = None
+SEMCOR_FIXED = None
+SEMCOR_JSON = None
+SEMCOR_TTL = None
+
+
+def setUpModule():
+    global SEMCOR_OUT, SEMCOR_FIXED, SEMCOR_JSON, SEMCOR_TTL
+    SEMCOR_OUT = tempfile.mkdtemp(prefix='pysemcor-test-')
+    SEMCOR_FIXED = os.path.join(SEMCOR_OUT, '3rada_fixed')
+    SEMCOR_JSON = os.path.join(SEMCOR_OUT, '3rada_json')
+    SEMCOR_TTL = os.path.join(SEMCOR_OUT, '3rada_ttl')
+    with redirect_stdout(StringIO()):
+        failures = fix_3rada(SEMCOR_ORIG, SEMCOR_FIXED)
+    if failures:
+        raise RuntimeError("Could not repair the test corpus: {}".format(failures))
+
+
+def tearDownModule():
+    shutil.rmtree(SEMCOR_OUT, ignore_errors=True)
 
 
 # -------------------------------------------------------------------------------
@@ -87,20 +144,399 @@ class TestMain(unittest.TestCase):
         files.add_all('brownv/tagfiles')
         self.assertEqual(len(files), 352)  # brown1 + brown2 + brownv
 
+    def test_fileset_scan(self):
+        files = FileSet(SEMCOR_ORIG, include=['br-a*', 're:brown2/'], exclude='*3')
+        files.add_all('brown1/tagfiles')
+        files.add_all('brown2/tagfiles')
+        self.assertTrue(files)
+        self.assertTrue(all(os.path.basename(f).startswith('br-a') or f.startswith('brown2/') for f in files))
+        self.assertFalse([f for f in files if f.endswith('3')])
+        self.assertEqual(list(files), sorted(files))
+        st = os.stat(files.abspath(files[0]))
+        self.assertEqual(files.stat(files[0]), (st.st_size, st.st_mtime_ns))
+        largest = files.largest_first()
+        self.assertEqual(sorted(largest), sorted(files))
+        self.assertEqual([files.size(f) for f in largest], sorted((files.size(f) for f in files), reverse=True))
+        self.assertEqual(files.total_size, sum(os.path.getsize(p) for p in files.abspaths()))
+        # the listing is cached until a folder changes
+        with tempfile.TemporaryDirectory() as tmpdir:
+            folder = os.path.join(tmpdir, 'root', 'brown1', 'tagfiles')
+            os.makedirs(folder)
+            # the temporary file of an output which is being written is not a document
+            for name in ('br-a01', 'br-a02', 'br-a03.json.1234.tmp'):
+                with open(os.path.join(folder, name), 'w') as outfile:
+                    outfile.write(name)
+            listing = os.path.join(tmpdir, 'root.files.json')
+            # folders which were modified just now are not cached
+            files = FileSet(os.path.join(tmpdir, 'root'), listing=listing)
+            files.add_all('brown1/tagfiles')
+            self.assertFalse(os.path.isfile(listing))
+            os.utime(folder, ns=(st.st_atime_ns, st.st_mtime_ns))
+            files = FileSet(os.path.join(tmpdir, 'root'), listing=listing)
+            files.add_all('brown1/tagfiles')
+            self.assertTrue(os.path.isfile(listing))
+            with open(listing) as infile:
+                self.assertEqual([name for name, size, mtime in json.load(infile)['brown1/tagfiles']['files']], ['br-a01', 'br-a02'])
+            with open(os.path.join(folder, 'br-a01'), 'w') as outfile:
+                outfile.write('changed in place')
+            cached = FileSet(os.path.join(tmpdir, 'root'), listing=listing)
+            cached.add_all('brown1/tagfiles')
+            self.assertEqual(cached.size('brown1/tagfiles/br-a01'), 6)
+            os.unlink(os.path.join(folder, 'br-a02'))
+            rescanned = FileSet(os.path.join(tmpdir, 'root'), listing=listing)
+            rescanned.add_all('brown1/tagfiles')
+            self.assertEqual(list(rescanned), ['brown1/tagfiles/br-a01'])
+            self.assertEqual(rescanned.size('brown1/tagfiles/br-a01'), 16)
+
     def test_3rada(self):
         sc = SemcorXML(SEMCOR_ORIG)
         self.assertEqual(len(sc.files), 352)
 
+    def test_token_info(self):
+        t = TokenInfo('banks', cmd='done', pos='NN', lemma='bank', wnsn='1', lexsn='1:14:00::', tag='wf', sk='bank%1:14:00::')
+        self.assertIn('pos', t)
+        self.assertNotIn('ot', t)
+        self.assertEqual(t['pos'], 'NN')
+        self.assertEqual(t.get('ot', 'n/a'), 'n/a')
+        self.assertRaises(KeyError, lambda: t['ot'])
+        self.assertEqual(t.lemma, 'bank')
+        self.assertEqual(TokenInfo('The', cmd='ignore').lemma, 'The')
+        # rare attributes are stored in the overflow mapping
+        t['dc'] = '1'
+        t['ot'] = 'notag'
+        self.assertEqual(t['dc'], '1')
+        self.assertEqual(list(t.to_json().keys()), ['cmd', 'dc', 'lemma', 'lexsn', 'ot', 'pos', 'wnsn', 'tag', 'sk', 'text'])
+        # values are shared
+        self.assertIs(TokenInfo('x', pos=''.join(['N', 'N']))['pos'], t['pos'])
+        self.assertEqual(str(pickle.loads(pickle.dumps(t))), str(t))
+
     def test_fix_token(self):
         self.assertEqual(fix_token_text("Y ' all"), "Y'all")
 
+    def test_normaliser(self):
+        rules = load_rules()
+        pieces = [p for rule in rules['token'] + rules['sentence'] for p in rule] + [' ', "'", 'a', ',']
+        rand = random.Random(42)
+        for name in ('token', 'sentence'):
+            normaliser = Normaliser(rules[name])
+            self.assertLessEqual(len(normaliser.stages), len(rules[name]))
+            for i in range(5000):
+                text = ''.join(rand.choice(pieces) for _ in range(rand.randint(1, 8)))
+                expected = text
+                for old, new in rules[name]:
+                    expected = expected.replace(old, new)
+                self.assertEqual(normaliser(text), expected)
+        # order matters
+        self.assertEqual(Normaliser([(' , ', ', '), (' ! ', '! ')])('a , ! b'), 'a,! b')
+        self.assertEqual(Normaliser([('ab', 'b'), ('bc', 'c')])('abc'), 'c')
+        # rules can be loaded from another file
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'rules.json')
+            with open(path, 'w') as outfile:
+                json.dump({'token': rules['token'] + [["gon na", "gonna"]], 'sentence': rules['sentence']}, outfile)
+            try:
+                semcorxml.load_normalisers(path)
+                self.assertEqual(fix_token_text("gon na"), "gonna")
+            finally:
+                semcorxml.load_normalisers()
+        self.assertEqual(fix_token_text("gon na"), "gon na")
+
     def test_rdf(self):
         sc = SemcorXML(SEMCOR_FIXED)
         mine_rdf_values(sc, limit=1)
+        # tied counts are listed in the same order however the files were merged
+        outputs = []
+        for jobs in (1, 2):
+            with mock.patch('sys.stdout', new_callable=StringIO) as out:
+                mine_rdf_values(sc, limit=4, jobs=jobs)
+            outputs.append(out.getvalue())
+        self.assertEqual(outputs[0], outputs[1])
+
+    def test_stats_engine(self):
+        sc = SemcorXML(SEMCOR_FIXED)
+        serial = StatsEngine(CorpusSize(), RdfValues(), PosSenses())
+        self.assertEqual(serial.run(sc, limit=4), [])
+        parallel = StatsEngine()
+        for aggregator in (CorpusSize(), RdfValues(), PosSenses()):
+            parallel.register(aggregator)
+        self.assertEqual(parallel.run(sc, limit=4, jobs=2), [])
+        self.assertEqual(serial.files, 4)
+        self.assertEqual(parallel.files, 4)
+        for a, b in zip(serial.aggregators, parallel.aggregators):
+            self.assertEqual(vars(a), vars(b))
+        # compare with a plain pass
+        tokens = [t for f in sc.files[:4] for s in sc.iterparse(f) for t in s['tokens']]
+        size, rdf, pos_senses = serial.aggregators
+        self.assertEqual(size.counts['tokens'], len(tokens))
+        self.assertEqual(size.counts['sense-tagged tokens'], sum(1 for t in tokens if 'sk' in t))
+        self.assertEqual(rdf.ot, Counter(t['ot'] for t in tokens if 'ot' in t))
+        self.assertEqual(sum(rdf.rdf.values()), sum(1 for t in tokens if 'rdf' in t))
+        self.assertEqual(pos_senses.by_pos()[0][:2], Counter(t['pos'] for t in tokens if 'sk' in t).most_common(1)[0])
+        # a missing file is reported and does not leave partial counts
+        first = sc.files[0]
+        sc.files = FileSet(SEMCOR_FIXED)
+        sc.files.add(first)
+        sc.files.add('brown1/tagfiles/missing.xml')
+        engine = StatsEngine(CorpusSize())
+        self.assertEqual([f for f, e in engine.run(sc)], ['brown1/tagfiles/missing.xml'])
+        self.assertEqual(engine.files, 1)
+        self.assertEqual(engine.aggregators[0].counts['sentences'], sum(1 for s in sc.iterparse(first)))
+
+    def test_concept_stats(self):
+        records = [{'text': 'a b', 'concepts': [{'clemma': 'say', 'tag': '01009843-v'}, {'clemma': 'bank', 'tag': 'bank%1:14:00::'}]},
+                   {'text': 'c', 'concepts': [{'clemma': 'say', 'tag': '01009843-v'}]}]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.makedirs(os.path.join(tmpdir, 'brown1', 'tagfiles'))
+            with open(os.path.join(tmpdir, 'brown1', 'tagfiles', 'br-a01.json'), 'w') as outfile:
+                for record in records:
+                    outfile.write(json.dumps(record) + '\n')
+            concepts = ConceptStats()
+            engine = StatsEngine(concepts)
+            engine.run(JsonLinesSource(tmpdir))
+            # the counts of shards are merged from their --save files
+            engine.save(os.path.join(tmpdir, 'unk.json'))
+            merged = StatsEngine(ConceptStats())
+            for _ in range(2):
+                merged.load(os.path.join(tmpdir, 'unk.json'))
+        self.assertEqual(concepts.known, Counter({('01009843-v', 'say'): 2}))
+        self.assertEqual(concepts.unknown, Counter({('bank%1:14:00::', 'bank'): 1}))
+        self.assertEqual(concepts.instances, Counter({'Known instances': 2, 'Unknown instances': 1}))
+        self.assertEqual(merged.aggregators[0].known, Counter({('01009843-v', 'say'): 4}))
+        self.assertEqual(merged.files, 2)
+
+    def test_synthetic_corpus(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            counts = generate(os.path.join(tmpdir, 'a'), scale=0.02, seed=7)
+            self.assertEqual(generate(os.path.join(tmpdir, 'b'), scale=0.02, seed=7), counts)
+            sc = SemcorXML(os.path.join(tmpdir, 'a'), raw=True)
+            self.assertEqual(len(sc.files), counts['files'])
+            with open(sc.files.abspath(sc.files[0])) as infile, open(os.path.join(tmpdir, 'b', sc.files[0])) as other:
+                self.assertEqual(infile.read(), other.read())
+            result = run_stage('iterparse_raw', sc.root, None)
+            self.assertEqual((result['sentences'], result['tokens']), (counts['sentences'], counts['tokens']))
+            self.assertGreater(result['peak_rss_mb'], 0)
+            # the repaired files give the same sentences
+            fixed = os.path.join(tmpdir, 'fixed')
+            run_stage('fix', sc.root, fixed)
+            self.assertEqual(run_stage('iterparse', sc.root, fixed)['tokens'], counts['tokens'])
 
     def test_fix_3rada(self):
         header("Test fix original 3rada dataset")
-        fix_3rada(SEMCOR_ORIG, SEMCOR_FIXED)
+        # the corpus was repaired by setUpModule(), existing outputs are skipped
+        self.assertEqual(len(SemcorXML(SEMCOR_FIXED).files), 352)
+        with redirect_stdout(StringIO()) as out:
+            self.assertEqual(fix_3rada(SEMCOR_ORIG, SEMCOR_FIXED), [])
+        self.assertEqual(out.getvalue().count('SKIPPED'), 352)
+        # a shard only repairs its own files
+        with tempfile.TemporaryDirectory() as tmpdir, redirect_stdout(StringIO()):
+            self.assertEqual(fix_3rada(SEMCOR_ORIG, tmpdir, shard=(2, 40)), [])
+            self.assertEqual(list(SemcorXML(tmpdir).files), [f + '.xml' for f in SemcorXML(SEMCOR_ORIG).files.shard(2, 40)])
+
+    def test_stream_repair(self):
+        raw = '''<contextfile concordance=brown>
+<context filename=br-x01 paras=yes>
+<p pnum=1>
+<s snum=1>
+<wf cmd=done rdf= pos=NN ot=notag>65</wf>
+<wf cmd=done pos=RB lemma=n't wnsn=0 lexsn=4:02:00::>n't</wf>
+<wf cmd=done sep="-" pos=JJ lemma=west wnsn=1 lexsn=3:00:00::>west</wf>
+<punc>&</punc>
+</s>
+</context>
+</contextfile>
+'''
+        out = StringIO()
+        sgml.repair(StringIO(raw), out)
+        root = etree.fromstring(out.getvalue())
+        tokens = root.findall('.//s/*')
+        # same as HTML parsers, rdf takes the next word as its value
+        self.assertEqual(dict(tokens[0].attrib), {'cmd': 'done', 'ot': 'notag', 'rdf': 'pos=NN'})
+        self.assertEqual(tokens[1].get('lemma'), "n't")
+        self.assertEqual(tokens[2].get('sep'), "-")
+        self.assertEqual(tokens[3].text, "&")
+        # the unclosed <p> is closed before </context>
+        self.assertEqual(len(root.findall('.//p')), 1)
+        # attributes are sorted like BeautifulSoup does
+        self.assertIn('<wf cmd="done" lemma="west" lexsn="3:00:00::" pos="JJ" sep="-" wnsn="1">west</wf>', out.getvalue())
+
+    def test_stream_repair_verify(self):
+        inpath = os.path.join(SEMCOR_ORIG, 'brown1/tagfiles/br-a01')
+        with tempfile.TemporaryDirectory() as outdir:
+            outpath = os.path.join(outdir, 'br-a01.xml')
+            # a failed or interrupted repair leaves no output behind, so it is not skipped by the next run
+            with mock.patch('pysemcor.sgml.verify_repair', return_value=['br-a01: element #1']):
+                self.assertRaises(ValueError, fix_malformed_xml_file, inpath, outpath, verify=True)
+            with mock.patch('pysemcor.sgml.repair', side_effect=KeyboardInterrupt):
+                self.assertRaises(KeyboardInterrupt, fix_malformed_xml_file, inpath, outpath)
+            self.assertEqual(os.listdir(outdir), [])
+            fix_malformed_xml_file(inpath, outpath, verify=True)
+            self.assertEqual(sgml.verify_repair(inpath, outpath), [])
+
+    def test_bounded_memory(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            folder = os.path.join(tmpdir, 'brown1', 'tagfiles')
+            os.makedirs(folder)
+            rng = random.Random(3)
+            counts = {name: write_large_file(os.path.join(folder, name), 1 << 20, rng, per_para)
+                      for name, per_para in (('one-para.xml', 0), ('short-paras.xml', 1))}
+            sc = SemcorXML(tmpdir)
+            for f in sc.files:
+                # earlier sentences are not kept in the tree, the rest is the parser's lookahead
+                sizes = list(sc.iterparse_xml(f, lambda element, sid: (
+                    sum(1 for node in itertools.chain((element,), element.iterancestors()) for _ in node.itersiblings(preceding=True)),
+                    sum(1 for _ in element.getroottree().iter()))))
+                self.assertEqual(len(sizes), counts[os.path.basename(f)])
+                # at most the (empty) paragraph of the previous sentence
+                self.assertLessEqual(max(earlier for earlier, _ in sizes), 1)
+                self.assertLess(max(total for _, total in sizes), 2000)
+                self.assertEqual(next(sc.iterparse(f))['sid'], 'large-1-1')
+            # peak RSS does not depend on the size of the file
+            size = int(os.environ.get('PYSEMCOR_LARGE_FILE_MB', 0)) << 20
+            if not size:
+                return
+            peaks = []
+            for name, file_size in (('small.xml', size >> 3), ('large.xml', size)):
+                write_large_file(os.path.join(folder, name), file_size, rng)
+                script = ('import resource; from pysemcor.semcorxml import SemcorXML; sc = SemcorXML({});'
+                          'sum(1 for s in sc.iterparse({})); print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)')
+                output = subprocess.run([sys.executable, '-c', script.format(repr(tmpdir), repr('brown1/tagfiles/' + name))],
+                                        cwd=PROJECT_ROOT, stdout=subprocess.PIPE, check=True).stdout
+                peaks.append(int(output))
+                os.unlink(os.path.join(folder, name))
+            self.assertLess(peaks[1] - peaks[0], 16 << 10, "peak RSS (KB): {}".format(peaks))
+
+    def test_iterparse_raw(self):
+        fixed = SemcorXML(SEMCOR_FIXED)
+        raw = SemcorXML(SEMCOR_ORIG, raw=True)
+        for f in ('brown1/tagfiles/br-a01', 'brown2/tagfiles/br-e30', 'brown2/tagfiles/br-n10'):
+            expected = [dict(s, tokens=[t.to_json() for t in s['tokens']]) for s in fixed.iterparse(f + '.xml')]
+            actual = [dict(s, tokens=[t.to_json() for t in s['tokens']]) for s in raw.iterparse(f)]
+            self.assertTrue(expected)
+            # same dicts, same key order
+            self.assertEqual(json.dumps(actual), json.dumps(expected))
+
+    def test_corpus(self):
+        sc = SemcorXML(SEMCOR_ORIG, raw=True)
+        files = ('brown1/tagfiles/br-a01', 'brown2/tagfiles/br-e30')
+        corpus = SemcorCorpus()
+        sents = []
+        for f in files:
+            corpus.add_document(f, sc.iterparse(f))
+            sents.extend(sc.iterparse(f))
+        self.assertEqual(corpus.sentence_count, len(sents))
+        self.assertEqual(len(corpus), sum(len(s['tokens']) for s in sents))
+        self.assertEqual(corpus.docs, list(files))
+        self.assertEqual(len(corpus.paras), len({(s['filename'], s['para']) for s in sents}))
+        # sentences are zero-copy views
+        sent = corpus.sentence(10)
+        self.assertEqual(sent.sid, sents[10]['sid'])
+        self.assertEqual(sent.values('text'), [t.text for t in sents[10]['tokens']])
+        self.assertEqual(sent.column('pos').obj, corpus.columns['pos'])
+        self.assertEqual(sent.tokens[0], {k: v for k, v in sents[10]['tokens'][0].to_json().items() if k in COLUMNS})
+        self.assertEqual(corpus.sentence(-1).doc, files[-1])
+        self.assertEqual(list(corpus.document(1))[0].sid, next(sc.iterparse(files[1]))['sid'])
+        # filtering
+        expected = [(s['sid'], t.text) for s in sents for t in s['tokens'] if t.get('pos') == 'VB' and 'sk' in t]
+        indices = corpus.where(pos='VB', sk=True)
+        self.assertTrue(expected)
+        self.assertEqual([(corpus.sids[corpus.sentence_of(i)], corpus.values('text', [i])[0]) for i in indices], expected)
+        self.assertEqual(len(corpus.where(pos=('VB', 'NN'))), sum(1 for s in sents for t in s['tokens'] if t.get('pos') in ('VB', 'NN')))
+        self.assertEqual(len(corpus.where(lemma=None)), sum(1 for s in sents for t in s['tokens'] if 'lemma' not in t))
+        self.assertEqual(len(corpus.where(pos='no-such-pos')), 0)
+        self.assertEqual(corpus.count('pos', indices), [('VB', len(expected))])
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.makedirs(os.path.join(tmpdir, 'brown1', 'tagfiles'))
+            for f in ('brown1/tagfiles/br-a01', 'brown2/tagfiles/br-e30'):
+                shutil.copy(os.path.join(SEMCOR_ORIG, f), os.path.join(tmpdir, 'brown1', 'tagfiles'))
+            cache_path = os.path.join(tmpdir, 'semcor.cache')
+            source = SemcorXML(tmpdir, raw=True)
+            sc = SemcorXML(tmpdir, raw=True, cache=cache_path)
+            self.assertIsNone(sccache.open_cache(cache_path, sc))
+            sc.prepare_cache()
+            self.assertTrue(os.path.isfile(cache_path))
+            for f in sc.files:
+                expected = [dict(s, tokens=[t.to_json() for t in s['tokens']]) for s in source.iterparse(f)]
+                actual = [dict(s, tokens=[t.to_json() for t in s['tokens']]) for s in sc.iterparse(f)]
+                self.assertTrue(expected)
+                self.assertEqual(json.dumps(actual), json.dumps(expected))
+            # the cache is only mapped once per process
+            self.assertIs(sc.prepare_cache(), sccache.load_cache(SemcorXML(tmpdir, raw=True, cache=cache_path)))
+            # touching a file does not invalidate the cache, changing it does
+            path = source.files.abspath(source.files[0])
+            os.utime(path, ns=(0, 0))
+            self.assertIsNotNone(sccache.open_cache(cache_path, sc))
+            self.assertIsNone(sccache.open_cache(cache_path, SemcorXML(tmpdir, cache=cache_path)))
+            with open(path, 'a') as outfile:
+                outfile.write('\n')
+            self.assertIsNone(sccache.open_cache(cache_path, sc))
+            sccache._caches.clear()
+            # a cache built without WordNet is fresh until WordNet is available
+            with mock.patch.object(sccache, '_wordnet_available', False):
+                unresolved = sccache.load_cache(SemcorXML(tmpdir, raw=True, cache=cache_path))
+            self.assertFalse(unresolved.header['resolved'])
+            self.assertTrue(sccache.is_fresh(unresolved.header, source))
+            self.assertFalse(sccache.is_fresh(unresolved.header, source, resolved=True))
+            sccache._caches.clear()
+            # filtered runs share the cache of the whole corpus, it is rebuilt to resolve sensekeys when WordNet is available
+            with mock.patch.object(semcorxml, 'wn', make_wordnet(os.path.join(tmpdir, 'wn.db'))), \
+                    mock.patch.object(sccache, '_wordnet_available', None):
+                subset = SemcorXML(tmpdir, raw=True, cache=cache_path, include='br-e30')
+                self.assertEqual(len(subset.files), 1)
+                cache = subset.prepare_cache()
+            self.assertEqual(sorted(cache.corpus.docs), sorted(source.files))
+            self.assertEqual(cache.sk_map['say%2:32:00::'], '01009843-v')
+            self.assertIn('friday%1:28:00::', cache.sk_map)
+            self.assertTrue(cache.unknown)
+            resolver = SenseKeyResolver()
+            subset.seed_resolver(resolver)
+            self.assertEqual(resolver.resolve('say%2:32:00::'), '01009843-v')
+            mtime = os.stat(cache_path).st_mtime_ns
+            other = SemcorXML(tmpdir, raw=True, cache=cache_path, exclude='br-e30')
+            self.assertIs(other.prepare_cache(), cache)
+            self.assertEqual([s['sid'] for s in other.iterparse(other.files[0])], [s['sid'] for s in source.iterparse(other.files[0])])
+            self.assertEqual(os.stat(cache_path).st_mtime_ns, mtime)
+            # a cache of another mode is not reused in the same process, it is built again
+            with mock.patch.object(sccache, 'build_resolved_cache', side_effect=RuntimeError):
+                self.assertRaises(RuntimeError, SemcorXML(tmpdir, cache=cache_path).prepare_cache)
+            sccache._caches.clear()
+
+    def test_sid_index(self):
+        def to_json(sents):
+            return json.dumps([dict(s, tokens=[t.to_json() for t in s['tokens']]) for s in sents])
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for f in ('brown1/tagfiles/br-a01', 'brown2/tagfiles/br-e30'):
+                os.makedirs(os.path.join(tmpdir, os.path.dirname(f)), exist_ok=True)
+                shutil.copy(os.path.join(SEMCOR_ORIG, f), os.path.join(tmpdir, f))
+            for sc in (SemcorXML(tmpdir, raw=True), SemcorXML(SEMCOR_FIXED, index=os.path.join(tmpdir, 'fixed.db'))):
+                sents = [s for f in sc.files[:2] for s in sc.iterparse(f)] if not sc.raw else [s for f in sc.files for s in sc.iterparse(f)]
+                sids = [s['sid'] for s in sents]
+                self.assertEqual(to_json(sc.get_sentences(reversed(sids))), to_json(reversed(sents)))
+                self.assertEqual(to_json([sc.get_sentence(sids[5])]), to_json([sents[5]]))
+                self.assertRaises(KeyError, lambda: sc.get_sentence('br-zzz-1-1'))
+                sc.sid_index.close()
+            self.assertTrue(os.path.isfile(os.path.join(tmpdir + '.sid.db')))
+            # a changed file is indexed again
+            path = os.path.join(tmpdir, 'brown1/tagfiles/br-a01')
+            with open(path) as infile:
+                content = infile.read()
+            with open(path, 'w') as outfile:
+                outfile.write(content.replace('<s snum=1>', '<s snum=100>', 1))
+            sc = SemcorXML(tmpdir, raw=True)
+            self.assertEqual(sc.get_sentence('br-a01-1-100')['snum'], '100')
+            self.assertRaises(KeyError, lambda: sc.get_sentence('br-a01-1-1'))
+            sc.sid_index.close()
+            os.unlink(tmpdir + '.sid.db')
+            # JSON-lines outputs
+            jsonset = FileSet(os.path.join(tmpdir, 'json'))
+            sc.convert_to_json(jsonset)
+            sent = next(sc.iterparse('brown2/tagfiles/br-e30'))
+            index = jsonl_index(jsonset.root)
+            self.assertEqual(index.get_record(sent['sid']), json.loads(to_json([sent]))[0])
+            self.assertRaises(KeyError, lambda: index.get_record('br-zzz-1-1'))
+            index.close()
+            os.unlink(jsonset.root + '.sid.db')
 
     def test_xml2json(self):
         header("Test fixed 3rada to JSON")
@@ -109,6 +545,143 @@ class TestMain(unittest.TestCase):
         for f in sc.files:
             xml2json(f, sc, sc_json)
 
+    def test_parallel_xml2json(self):
+        sc = SemcorXML(SEMCOR_FIXED)
+        with tempfile.TemporaryDirectory() as serial_dir, tempfile.TemporaryDirectory() as parallel_dir:
+            self.assertEqual(sc.convert_to_json(FileSet(serial_dir), limit=4), [])
+            self.assertEqual(sc.convert_to_json(FileSet(parallel_dir), limit=4, jobs=3), [])
+            for f in sc.files[:4]:
+                outfile = os.path.join(os.path.dirname(f), os.path.basename(f)[:-4] + '.json')
+                with open(os.path.join(serial_dir, outfile), 'rb') as serial_file, open(os.path.join(parallel_dir, outfile), 'rb') as parallel_file:
+                    self.assertEqual(serial_file.read(), parallel_file.read())
+
+    def test_incremental_json(self):
+        sc = SemcorXML(SEMCOR_FIXED)
+        options = {'task': 'json', 'raw': False}
+        with tempfile.TemporaryDirectory() as outdir:
+            outset = FileSet(outdir)
+            self.assertEqual(sc.convert_to_json(outset, limit=3), [])
+            manifest, todo, records = sc.plan(outset, options, limit=3)
+            self.assertEqual(len(manifest), 3)
+            self.assertEqual(todo, [])
+            # other options, an output format change, or a missing output
+            self.assertEqual(sc.plan(outset, dict(options, raw=True), limit=3)[1], list(sc.files[:3]))
+            with mock.patch('pysemcor.semcorxml.OUTPUT_VERSION', semcorxml.OUTPUT_VERSION + 1):
+                self.assertEqual(sc.plan(outset, options, limit=3)[1], list(sc.files[:3]))
+                self.assertEqual(sc.plan(outset, options, limit=3, resume=True)[1], list(sc.files[:3]))
+            os.unlink(outset.abspath(semcorxml.output_name(sc.files[0])))
+            self.assertEqual(sc.plan(outset, options, limit=3)[1], [sc.files[0]])
+            # outputs which are not in the manifest are rebuilt unless they are complete and resume is set
+            truncated = outset.abspath(semcorxml.output_name(sc.files[2]))
+            with open(truncated) as infile:
+                content = infile.read()
+            with open(truncated, 'w') as outfile:
+                outfile.write(content[:len(content) // 2])
+            os.unlink(os.path.join(outdir, '.manifest.json'))
+            self.assertEqual(sc.plan(outset, options, limit=3, resume=True)[1], [sc.files[0], sc.files[2]])
+            self.assertEqual(sc.plan(outset, options, limit=3)[1], [sc.files[0], sc.files[2]])
+            self.assertEqual(sc.convert_to_json(outset, limit=3), [])
+            with open(truncated) as infile:
+                self.assertEqual(infile.read(), content)
+            self.assertEqual(sorted(os.listdir(os.path.dirname(truncated))), sorted(semcorxml.output_name(os.path.basename(f)) for f in sc.files[:3]))
+
+    def test_compressed_json(self):
+        sc = SemcorXML(SEMCOR_FIXED)
+        with tempfile.TemporaryDirectory() as outdir:
+            self.assertEqual(sc.convert_to_json(FileSet(outdir), limit=2), [])
+            self.assertEqual(sc.convert_to_json(FileSet(outdir), limit=2, compression=jsonio.GZIP), [])
+            self.assertEqual(sc.convert_to_json(FileSet(outdir), limit=1, compression=jsonio.XZ), [])
+            plain = os.path.join(outdir, semcorxml.output_name(sc.files[0]))
+            for compression in (jsonio.GZIP, jsonio.XZ):
+                path = os.path.join(outdir, semcorxml.output_name(sc.files[0], compression))
+                self.assertTrue(path.endswith('.json.' + compression))
+                self.assertLess(os.path.getsize(path), os.path.getsize(plain) // 4)
+                self.assertEqual(list(jsonio.read_jsonl(path)), list(jsonio.read_jsonl(plain)))
+                self.assertTrue(is_complete_jsonl(path))
+            # the same input always gives the same compressed bytes
+            gz = os.path.join(outdir, semcorxml.output_name(sc.files[1], jsonio.GZIP))
+            with open(gz, 'rb') as infile:
+                content = infile.read()
+            xml2json(sc.files[1], sc, FileSet(outdir), overwrite=True, compression=jsonio.GZIP)
+            with open(gz, 'rb') as infile:
+                self.assertEqual(infile.read(), content)
+            with open(gz, 'wb') as outfile:
+                outfile.write(content[:len(content) // 2])
+            self.assertFalse(is_complete_jsonl(gz))
+            os.unlink(gz)
+            # readers open compressed outputs transparently
+            os.unlink(plain)
+            os.unlink(os.path.join(outdir, semcorxml.output_name(sc.files[0], jsonio.XZ)))
+            source = JsonLinesSource(outdir)
+            self.assertEqual(sorted(source.files), [semcorxml.output_name(sc.files[0], jsonio.GZIP), semcorxml.output_name(sc.files[1])])
+            records = list(source.iterparse(semcorxml.output_name(sc.files[0], jsonio.GZIP)))
+            index = jsonl_index(outdir)
+            self.assertEqual(index.get_record(records[5]['sid']), records[5])
+            index.close()
+            os.unlink(outdir + '.sid.db')
+        self.assertRaises(ValueError, lambda: semcorxml.output_name(sc.files[0], 'bz2'))
+
+    def test_json_encoder(self):
+        sc = SemcorXML(SEMCOR_FIXED)
+        with tempfile.TemporaryDirectory() as outdir:
+            self.assertEqual(sc.convert_to_json(FileSet(outdir), limit=1), [])
+            path = os.path.join(outdir, semcorxml.output_name(sc.files[0]))
+            # the default encoder keeps the json.dumps() byte format
+            with open(path, 'rb') as infile:
+                lines = infile.read().splitlines()
+            self.assertEqual(lines, [json.dumps(json.loads(line)).encode('utf-8') for line in lines])
+            self.assertRaises(ValueError, lambda: jsonio.set_encoder('simplejson'))
+            if jsonio.orjson is None:
+                return
+            with mock.patch.dict(os.environ):
+                try:
+                    jsonio.set_encoder(jsonio.ORJSON)
+                    # outputs written by another encoder are rebuilt
+                    options = {'task': 'json', 'raw': False, 'encoder': jsonio.ORJSON}
+                    self.assertEqual(sc.plan(FileSet(outdir), options, limit=1)[1], [sc.files[0]])
+                    self.assertEqual(sc.convert_to_json(FileSet(outdir), limit=1), [])
+                    with open(path, 'rb') as infile:
+                        self.assertEqual(infile.read().splitlines(), [jsonio.orjson.dumps(json.loads(line)) for line in lines])
+                finally:
+                    jsonio.set_encoder(jsonio.STDLIB)
+
+    def test_instrument(self):
+        sc = SemcorXML(SEMCOR_FIXED)
+        with tempfile.TemporaryDirectory() as outdir:
+            self.assertIsNone(instrument.recorder)
+            rec = instrument.enable(profile=instrument.ITERPARSE)
+            try:
+                self.assertEqual(sc.convert_to_json(FileSet(os.path.join(outdir, 'a')), limit=2), [])
+                self.assertEqual(sc.convert_to_json(FileSet(os.path.join(outdir, 'b')), limit=2, jobs=2), [])
+            finally:
+                instrument.disable()
+            self.assertIsNone(instrument.recorder)
+            sents = [s for f in sc.files[:2] for s in sc.iterparse(f)]
+            self.assertEqual(rec.stages[instrument.ITERPARSE]['sentences'], 2 * len(sents))
+            self.assertEqual(rec.stages[instrument.WRITE]['tokens'], 2 * sum(len(s['tokens']) for s in sents))
+            self.assertEqual(sorted(rec.files), sorted(sc.files[:2]))
+            path = os.path.join(outdir, 'stats.json')
+            rec.dump(path)
+            with open(path) as infile:
+                report = json.load(infile)
+            self.assertGreater(report['stages'][instrument.ITERPARSE]['tokens_per_sec'], 0)
+            self.assertEqual(report['files'][sc.files[0]][instrument.ITERPARSE]['sentences'], 2 * len(list(sc.iterparse(sc.files[0]))))
+            self.assertEqual(report['caches']['fix_token_text']['hits'] + report['caches']['fix_token_text']['misses'],
+                             2 * sum(len(s['tokens']) for s in sents))
+            self.assertIn('iterparse_xml', ' '.join(f['function'] for f in report['profile']['top']))
+
+    def test_parallel_failures(self):
+        sc = SemcorXML(SEMCOR_FIXED)
+        files = [sc.files[0], 'brown1/tagfiles/missing.xml']
+        sc.files = FileSet(SEMCOR_FIXED)
+        for f in files:
+            sc.files.add(f)
+        with tempfile.TemporaryDirectory() as outdir:
+            failures = sc.convert_to_json(FileSet(outdir), jobs=2)
+            self.assertEqual([f for f, e in failures], ['brown1/tagfiles/missing.xml'])
+            self.assertTrue(os.path.isfile(os.path.join(outdir, files[0][:-4] + '.json')))
+            self.assertFalse(os.path.isfile(os.path.join(outdir, 'brown1/tagfiles/missing.json')))
+
     def test_parse_xml(self):
         sc = SemcorXML(SEMCOR_FIXED)
         for s in sc.iter_ttl(limit=1, with_nonsense=False):
@@ -126,6 +699,489 @@ class TestMain(unittest.TestCase):
         sc.convert_to_ttl(scttl, limit=1, with_nonsense=False)
 
 
+# a few senses for the first sentence of br-a01
+TEST_SENSES = [('say%2:32:00::', 201009843),
+               ('friday%1:28:00::', 115164957),
+               ('investigation%1:09:00::', 105797597),
+               ('evidence%1:09:00::', 105823932)]
+
+
+def make_wordnet(path, senses=TEST_SENSES):
+    ''' Create a tiny WordNet SQLite DB with a senses table '''
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE senses (wordid, casedwordid, synsetid, senseid, sensenum, lexid, tagcount, sensekey)')
+    conn.executemany('INSERT INTO senses (synsetid, sensekey) VALUES (?, ?)', [(sid, sk) for sk, sid in senses])
+    conn.commit()
+    conn.close()
+    return WordnetSQL(path)
+
+
+class TestSenseKeys(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.wn = make_wordnet(os.path.join(cls.tmpdir.name, 'wn.db'))
+        cls.orig_wn = semcorxml.wn
+        semcorxml.wn = cls.wn
+
+    @classmethod
+    def tearDownClass(cls):
+        semcorxml.wn = cls.orig_wn
+        cls.tmpdir.cleanup()
+
+    def test_preload(self):
+        with self.wn.ctx() as ctx:
+            resolver = SenseKeyResolver(ctx, preload=True)
+            self.assertEqual(resolver.queries, 1)
+            self.assertEqual(resolver.resolve('say%2:32:00::'), '01009843-v')
+            self.assertIsNone(resolver.resolve('group%1:03:00::'))
+            self.assertIsNone(resolver.resolve('group%1:03:00::'))
+            self.assertTrue(resolver.is_unknown('group%1:03:00::'))
+            self.assertEqual(resolver.queries, 1)
+            self.assertEqual((resolver.lookups, resolver.hits, resolver.misses), (3, 2, 1))
+
+    def test_batch_and_negative_cache(self):
+        with self.wn.ctx() as ctx:
+            resolver = SenseKeyResolver(ctx)
+            resolver.prefetch(['say%2:32:00::', 'friday%1:28:00::', 'group%1:03:00::', 'say%2:32:00::'])
+            self.assertEqual(resolver.queries, 1)
+            for i in range(3):
+                self.assertEqual(resolver.resolve('friday%1:28:00::'), '15164957-n')
+                self.assertIsNone(resolver.resolve('group%1:03:00::'))
+            self.assertEqual(resolver.queries, 1)
+            self.assertEqual(resolver.stats['unknown'], 1)
+
+    def test_to_ttl(self):
+        sc = SemcorXML(SEMCOR_FIXED)
+        sent = next(sc.iterparse('brown1/tagfiles/br-a01.xml'))
+        with self.wn.ctx() as ctx:
+            resolver = SenseKeyResolver(ctx)
+            s = to_ttl(sent, with_nonsense=False, resolver=resolver)
+            self.assertEqual(resolver.queries, 1)
+        tags = {c.clemma: (c.tag, c.comment) for c in s.concepts}
+        self.assertEqual(tags['say'], ('01009843-v', ''))
+        self.assertEqual(tags['produce'], ('produce%2:39:01::', 'sensekey'))
+        # group%1:03:00:: is nonsense
+        self.assertNotIn('group', tags)
+
+    def test_fused_ttl(self):
+        xml = (b'<contextfile><context filename="br-x01"><p pnum="1"><s snum="1">'
+               b'<wf cmd="done" pos="VB" lemma="say" wnsn="1" lexsn="2:32:00::" dc="1">Said</wf>'
+               b'<wf cmd="done" pos="NN" lemma="group" wnsn="1" lexsn="1:03:00::" rdf="group" pn="group">Grady</wf>'
+               b'<wf cmd="done" pos="VB" lemma="be" wnsn="1" lexsn="2:42:03::">was</wf>'
+               b'<wf cmd="ignore" pos="DT" sk="odd%1:00:00::">the</wf>'
+               b'<wf cmd="done" pos="NN" lemma="" lexsn="1:14:00::" ot="notag">bank</wf>'
+               b'<punc>.</punc></s></p></context></contextfile>')
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.makedirs(os.path.join(tmpdir, 'brown1', 'tagfiles'))
+            with open(os.path.join(tmpdir, 'brown1', 'tagfiles', 'br-x01.xml'), 'wb') as outfile:
+                outfile.write(xml)
+            for root in (tmpdir, SEMCOR_FIXED):
+                sc, fused = SemcorXML(root), SemcorXML(root, fused=True)
+                for with_nonsense in (True, False):
+                    with self.wn.ctx() as ctx:
+                        expected = [s.to_json() for s in sc.iterparse_ttl(sc.files[0], with_nonsense, SenseKeyResolver(ctx))]
+                        actual = [s.to_json() for s in fused.iterparse_ttl(sc.files[0], with_nonsense, SenseKeyResolver(ctx))]
+                    self.assertEqual(actual, expected)
+                    if root == tmpdir:
+                        # say and the sk attribute (bank has an empty lemma), plus group and be with nonsense
+                        self.assertEqual(len(actual[0]['concepts']), 4 if with_nonsense else 2)
+            # fused conversion writes the same files
+            sc, fused = SemcorXML(SEMCOR_FIXED), SemcorXML(SEMCOR_FIXED, fused=True)
+            self.assertEqual(sc.convert_to_ttl(FileSet(os.path.join(tmpdir, 'a')), limit=2, resolver=SenseKeyResolver(), preload=False), [])
+            rec = instrument.enable()
+            try:
+                self.assertEqual(fused.convert_to_ttl(FileSet(os.path.join(tmpdir, 'b')), limit=2, resolver=SenseKeyResolver(), preload=False), [])
+            finally:
+                instrument.disable()
+            for f in sc.files[:2]:
+                output = semcorxml.output_name(f)
+                with open(os.path.join(tmpdir, 'a', output), 'rb') as infile, open(os.path.join(tmpdir, 'b', output), 'rb') as other:
+                    self.assertEqual(infile.read(), other.read())
+            stages = rec.report()['stages']
+            self.assertNotIn(instrument.ITERPARSE, stages)
+            self.assertGreater(stages[instrument.TO_TTL]['tokens'], stages[instrument.TO_TTL]['sentences'])
+
+    def test_sentence_filter(self):
+        def tokens(sent):
+            return [(t.get('tag'), t.get) for t in sent['tokens']]
+        for sc in (SemcorXML(SEMCOR_FIXED), SemcorXML(SEMCOR_ORIG, raw=True)):
+            for where in (SentenceFilter(tagged=True), SentenceFilter(ot='idiom'),
+                          SentenceFilter(documents=['br-a0*', 're:brownv/.*-b'], pos=('JJ', 'RB'))):
+                for f in sc.files[:3] + [f for f in sc.files if 'brownv' in f][:2]:
+                    expected = [sent for sent in sc.iterparse(f) if where.accepts_file(f) and where.accepts(tokens(sent))]
+                    with mock.patch.object(semcorxml, 'make_token', wraps=semcorxml.make_token) as make_token:
+                        actual = list(sc.iterparse(f, where))
+                    self.assertEqual([s['sid'] for s in actual], [s['sid'] for s in expected])
+                    self.assertEqual([[t.data for t in s['tokens']] for s in actual], [[t.data for t in s['tokens']] for s in expected])
+                    # only the tokens of accepted sentences are built
+                    self.assertEqual(make_token.call_count, sum(len(s['tokens']) for s in expected))
+        # idioms are rare, every kept sentence has one
+        sc = SemcorXML(SEMCOR_FIXED)
+        idioms = list(sc.iterparse(sc.files[0], SentenceFilter(ot='idiom')))
+        self.assertTrue(idioms)
+        self.assertTrue(all(any(t.get('ot') == 'idiom' for t in s['tokens']) for s in idioms))
+        # rejected files are not opened
+        self.assertEqual(list(sc.iterparse('brown1/tagfiles/missing.xml', SentenceFilter(documents='br-*'))), [])
+        with self.wn.ctx() as ctx:
+            ttl = list(sc.iterparse_ttl(sc.files[0], resolver=SenseKeyResolver(ctx), where=SentenceFilter(ot='idiom')))
+        self.assertEqual([s.get_tag('origid').label for s in ttl], [s['sid'] for s in idioms])
+
+    def test_split(self):
+        self.assertEqual(parse_partition('train=80%'), ('train', 0.8))
+        self.assertEqual(parse_partition('dev=0.1'), ('dev', 0.1))
+        self.assertEqual(parse_partition('test=500'), ('test', 500))
+        self.assertEqual(parse_partition('rest'), ('rest', None))
+        for spec in ('=1', 'dev=', 'dev=x', 'dev=150%', 'dev=-1'):
+            self.assertRaises(ValueError, parse_partition, spec)
+        self.assertRaises(ValueError, SplitWriter, '.', [('a', 0.5)])
+        self.assertRaises(ValueError, SplitWriter, '.', [('a', 0.7), ('b', 0.7)])
+        self.assertRaises(ValueError, SplitWriter, '.', [('a', None), ('b', None)])
+        self.assertRaises(ValueError, SplitWriter, '.', [('a', None), ('a', 1)])
+
+        def read(out, name):
+            with open(os.path.join(out, name + '.json'), 'rb') as infile:
+                return infile.read().splitlines()
+        sc = SemcorXML(SEMCOR_FIXED)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # every sentence is written once, assignments do not depend on the order of the files
+            for idx, files in enumerate((sc.files[:6], sc.files[:6][::-1])):
+                out = os.path.join(tmpdir, str(idx))
+                sc.files = FileSet(SEMCOR_FIXED)
+                for f in files:
+                    sc.files.add(f)
+                with SplitWriter(out, [('test', 20), ('dev', 20), ('train', 0.5), ('rest', None)]) as writer:
+                    self.assertEqual(sc.split_to_json(writer), [])
+                self.assertEqual(sum(writer.counts.values()), sum(1 for f in files for _ in sc.iterparse(f)))
+            splits = [{name: read(os.path.join(tmpdir, str(idx)), name) for name in writer.counts} for idx in range(2)]
+            for name in writer.counts:
+                self.assertEqual(sorted(splits[0][name]), sorted(splits[1][name]))
+            expected = sorted(line for f in files for line in (jsonio.dumps(dict(sj, tokens=[t.to_json() for t in sj['tokens']]))
+                                                                for sj in sc.iterparse(f)))
+            self.assertEqual(sorted(line for lines in splits[0].values() for line in lines), expected)
+            # samples hold the sentences with the smallest hashes, in input order
+            sids = [jsonio.loads(line)['sid'] for line in splits[0]['test'] + splits[0]['dev']]
+            self.assertEqual(len(sids), 40)
+            ranked = sorted((jsonio.loads(line)['sid'] for line in expected), key=lambda sid: stable_hash(SAMPLE_SALT + sid))
+            self.assertEqual(sorted(sids[:20]), sorted(ranked[:20]))
+            self.assertEqual(sorted(sids[20:]), sorted(ranked[20:40]))
+            # documents are not split, TTL lines are the same as the outputs of convert_to_ttl()
+            sc = SemcorXML(SEMCOR_FIXED)
+            out = os.path.join(tmpdir, 'docs')
+            with SplitWriter(out, [('test', 1), ('train', None)], by=DOCUMENT, ensure_ascii=False) as writer:
+                self.assertEqual(sc.split_to_ttl(writer, limit=3, resolver=SenseKeyResolver(), preload=False), [])
+            self.assertEqual(sc.convert_to_ttl(FileSet(os.path.join(tmpdir, 'ttl')), limit=3, resolver=SenseKeyResolver(), preload=False), [])
+            docs = {name: {jsonio.loads(line)['tags'][0]['label'].rsplit('-', 2)[0] for line in read(out, name)} for name in writer.counts}
+            self.assertEqual((len(docs['test']), len(docs['train'])), (1, 2))
+            lines = []
+            for f in sc.files[:3]:
+                with open(os.path.join(tmpdir, 'ttl', semcorxml.output_name(f)), 'rb') as infile:
+                    lines.extend(infile.read().splitlines())
+            self.assertEqual(sorted(read(out, 'test') + read(out, 'train')), sorted(lines))
+
+    def test_columnar_export(self):
+        sc = SemcorXML(SEMCOR_FIXED)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name in ('tokens.tsv', 'tokens.tsv.gz'):
+                with columnar.TokenTableWriter(os.path.join(tmpdir, name), row_group_size=1000) as writer:
+                    self.assertEqual(columnar.export_tokens(sc, writer, limit=2, with_nonsense=False, resolver=SenseKeyResolver(),
+                                                            preload=False), [])
+                self.assertEqual(writer.format, columnar.TSV)
+                self.assertGreater(writer.batches, 1)
+                rows = list(columnar.read_tsv(os.path.join(tmpdir, name)))
+                self.assertEqual(len(rows), writer.rows)
+            # tokens, offsets and senses are the same as in TTL
+            with self.wn.ctx() as ctx:
+                sents = [s.to_json() for f in sc.files[:2] for s in sc.iterparse_ttl(f, False, SenseKeyResolver(ctx))]
+            expected = []
+            for sent in sents:
+                concepts = {c['tokens'][0]: c['tag'] for c in sent.get('concepts', ())}
+                for widx, token in enumerate(sent['tokens']):
+                    expected.append((sent['tags'][0]['label'], widx, token['text'], token.get('lemma'), token.get('pos'),
+                                     token['cfrom'], token['cto'], concepts.get(widx)))
+            self.assertEqual([(r['sid'], r['widx'], r['text'], r['lemma'], r['pos'], r['cfrom'], r['cto'], r['synset'] or r['sk'])
+                              for r in rows], expected)
+            self.assertTrue(any(r['synset'] for r in rows) and any(r['ot'] for r in rows))
+            # values with tabs, newlines and backslashes
+            path = os.path.join(tmpdir, 'odd.tsv')
+            odd = [('s-1', 0, 'a\tb\\c', None, 'NN', None, None, 'x\ny', None, 0, 6)]
+            with columnar.TokenTableWriter(path) as writer:
+                writer.write_rows(odd)
+            self.assertEqual([tuple(r.values()) for r in columnar.read_tsv(path)], odd)
+            if columnar.find_spec('pyarrow') is None:
+                self.assertEqual(columnar.default_format(), columnar.TSV)
+                self.assertRaises(ValueError, columnar.TokenTableWriter, os.path.join(tmpdir, 'tokens.parquet'))
+            else:
+                import pyarrow.parquet as pq
+                path = os.path.join(tmpdir, 'tokens.parquet')
+                with columnar.TokenTableWriter(path, row_group_size=1000) as writer:
+                    writer.write_rows(tuple(r.values()) for r in rows)
+                table = pq.read_table(path)
+                self.assertEqual(table.column_names, list(columnar.COLUMNS))
+                self.assertEqual(table.to_pylist(), rows)
+                self.assertEqual(pq.ParquetFile(path).num_row_groups, writer.batches)
+
+    def test_ttl_stats(self):
+        sc = SemcorXML(SEMCOR_FIXED)
+        with tempfile.TemporaryDirectory() as outdir:
+            rec = instrument.enable()
+            try:
+                self.assertEqual(sc.convert_to_ttl(FileSet(outdir), limit=1, resolver=SenseKeyResolver(), preload=False), [])
+            finally:
+                instrument.disable()
+        stages = rec.report()['stages']
+        self.assertEqual(stages[instrument.TO_TTL]['sentences'], stages[instrument.ITERPARSE]['sentences'])
+        self.assertEqual(stages[instrument.WRITE]['calls'], stages[instrument.ITERPARSE]['sentences'])
+        # each sentence is prefetched with one query
+        self.assertEqual(stages[instrument.SENSEKEYS]['queries'], stages[instrument.SENSEKEYS]['calls'])
+        self.assertGreater(stages[instrument.SENSEKEYS]['lookups'], stages[instrument.SENSEKEYS]['misses'])
+        self.assertGreater(stages[instrument.SENSEKEYS]['hit_rate'], 0)
+
+    def test_parallel_xml_to_ttl(self):
+        sc = SemcorXML(SEMCOR_FIXED)
+        with tempfile.TemporaryDirectory() as serial_dir, tempfile.TemporaryDirectory() as parallel_dir:
+            serial = SenseKeyResolver()
+            parallel = SenseKeyResolver()
+            self.assertEqual(sc.convert_to_ttl(FileSet(serial_dir), limit=3, resolver=serial, preload=False), [])
+            self.assertEqual(sc.convert_to_ttl(FileSet(parallel_dir), limit=3, jobs=2, resolver=parallel, preload=False), [])
+            for f in sc.files[:3]:
+                outfile = os.path.join(os.path.dirname(f), os.path.basename(f)[:-4] + '.json')
+                with open(os.path.join(serial_dir, outfile), 'rb') as serial_file, open(os.path.join(parallel_dir, outfile), 'rb') as parallel_file:
+                    self.assertEqual(serial_file.read(), parallel_file.read())
+            self.assertEqual(parallel.sk_map, serial.sk_map)
+            self.assertEqual(parallel.unknown, serial.unknown)
+            self.assertEqual(parallel.lookups, serial.lookups)
+
+    def test_bulk_load(self):
+        from texttaglib import TTLSQLite, ttl
+        sc = SemcorXML(SEMCOR_FIXED)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            ttl_dir = os.path.join(tmpdir, 'ttl')
+            with self.wn.ctx() as ctx:
+                self.assertEqual(sc.convert_to_ttl(FileSet(ttl_dir), limit=2, resolver=SenseKeyResolver(ctx), preload=False), [])
+            scttl = SemcorXML(ttl_dir)
+            files = [(scttl.files.abspath(f), f[:6]) for f in scttl.files]
+            # reference database, built one sentence at a time
+            ref_path = os.path.join(tmpdir, 'ref.db')
+            db = TTLSQLite(ref_path)
+            for path, corpus in files:
+                doc_obj = db.ensure_doc(name=os.path.basename(path)[:-5], corpus=db.ensure_corpus(name=corpus))
+                for sent in ttl.read_json(path):
+                    sent.ID = None
+                    sent.docID = doc_obj.ID
+                    db.save_sent(sent)
+            bulk_path = os.path.join(tmpdir, 'bulk.db')
+            loader = BulkLoader(bulk_path)
+            self.assertEqual(loader.load(files, jobs=2), [])
+            self.assertEqual(loader.counts['document'], 2)
+            self.assertGreater(loader.rows_per_sec, 0)
+            ref, bulk = sqlite3.connect(ref_path), sqlite3.connect(bulk_path)
+            for table in ('corpus', 'document', 'sentence', 'token', 'concept', 'tag', 'cwl'):
+                query = 'SELECT * FROM {} ORDER BY 1, 2, 3'.format(table)
+                self.assertEqual(bulk.execute(query).fetchall(), ref.execute(query).fetchall())
+            schema = "SELECT name, sql FROM sqlite_master WHERE type = 'index' ORDER BY name"
+            self.assertEqual(bulk.execute(schema).fetchall(), ref.execute(schema).fetchall())
+            ref.close()
+            # streaming XML => SQLite without TTL files, an interrupted load is resumed
+            direct_path = os.path.join(tmpdir, 'direct.db')
+            with self.wn.ctx() as ctx:
+                self.assertEqual(BulkLoader(direct_path).load_semcor(sc, limit=1, resolver=SenseKeyResolver(ctx), preload=False), [])
+            loader = BulkLoader(direct_path)
+            resolver = SenseKeyResolver()
+            self.assertEqual(loader.load_semcor(sc, limit=2, jobs=2, resolver=resolver, preload=False), [])
+            self.assertEqual(len(loader.skipped), 1)
+            self.assertEqual(loader.counts['document'], 1)
+            self.assertEqual(resolver.sk_map['say%2:32:00::'], '01009843-v')
+            direct = sqlite3.connect(direct_path)
+            for table in ('corpus', 'document', 'sentence', 'token', 'concept', 'tag', 'cwl'):
+                query = 'SELECT * FROM {} ORDER BY 1, 2, 3'.format(table)
+                self.assertEqual(direct.execute(query).fetchall(), bulk.execute(query).fetchall())
+            direct.close()
+            bulk.close()
+            # existing documents are skipped
+            loader = BulkLoader(bulk_path)
+            self.assertEqual(loader.load(files), [])
+            self.assertEqual(len(loader.skipped), 2)
+            self.assertEqual(loader.rows, 0)
+            # a load killed after it dropped the indexes: the next load builds them again
+            loader = BulkLoader(direct_path)
+            loader.open()
+            self.assertTrue(loader.drop_indexes())
+            loader.conn.close()
+            loader = BulkLoader(direct_path)
+            self.assertEqual(loader.load_semcor(sc, limit=2, resolver=SenseKeyResolver(), preload=False), [])
+            self.assertEqual(len(loader.skipped), 2)
+            direct, ref = sqlite3.connect(direct_path), sqlite3.connect(ref_path)
+            self.assertEqual(direct.execute(schema).fetchall(), ref.execute(schema).fetchall())
+            self.assertEqual(direct.execute("SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name").fetchall(),
+                             ref.execute("SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name").fetchall())
+            self.assertEqual(direct.execute('PRAGMA journal_mode').fetchone(), ('delete',))
+            direct.close()
+            ref.close()
+
+    def test_shards(self):
+        self.assertEqual(parse_shard('2/4'), (2, 4))
+        for text in ('0/4', '5/4', '2', 'a/b'):
+            self.assertRaises(ValueError, parse_shard, text)
+        sizes = [5, 9, 1, 7, 3, 3]
+        files = ['f{}'.format(i) for i in range(len(sizes))]
+        self.assertEqual(partition(files, sizes, 3), [['f1'], ['f3', 'f5'], ['f0', 'f2', 'f4']])
+        sc = SemcorXML(SEMCOR_FIXED)
+        shards = [sc.files.shard(i, 3) for i in (1, 2, 3)]
+        self.assertEqual(sorted(f for shard in shards for f in shard), sorted(sc.files))
+        for shard in shards:
+            self.assertEqual(list(shard), [f for f in sc.files if f in set(shard)])
+        totals = [sum(sc.files.size(f) for f in shard) for shard in shards]
+        self.assertLessEqual(max(totals) - min(totals), max(sc.files.size(f) for f in sc.files))
+        # a single run and two shards give the same outputs
+        subset = FileSet(SEMCOR_FIXED)
+        for f in sc.files[:4]:
+            subset.add(f)
+        sc.files = subset
+        with tempfile.TemporaryDirectory() as tmpdir:
+            def _run(name, shard=None):
+                sc.files = subset.shard(*shard) if shard else subset
+                resolver = SenseKeyResolver()
+                resolver.journal = {}
+                with self.wn.ctx() as ctx:
+                    resolver.wnctx = ctx
+                    self.assertEqual(sc.convert_to_ttl(FileSet(os.path.join(tmpdir, name)), resolver=resolver, preload=False), [])
+                save_sensekeys(os.path.join(tmpdir, name, sensekeys_name(shard)), resolver.journal)
+                with self.wn.ctx() as ctx:
+                    loader = BulkLoader(os.path.join(tmpdir, name + '.db'))
+                    self.assertEqual(loader.load_semcor(sc, resolver=SenseKeyResolver(ctx), preload=False), [])
+                engine = StatsEngine(CorpusSize(), PosSenses(), RdfValues())
+                engine.run(sc)
+                engine.save(os.path.join(tmpdir, name + '.stats.json'))
+                return engine
+            single = _run('single')
+            _run('shard1', (1, 2))
+            _run('shard2', (2, 2))
+            self.assertTrue(os.path.isfile(os.path.join(tmpdir, 'shard2', '.manifest.2of2.json')))
+            merged_dir = os.path.join(tmpdir, 'merged')
+            self.assertEqual(merge_outputs(merged_dir, [os.path.join(tmpdir, 'shard1'), os.path.join(tmpdir, 'shard2')]), 4)
+            for f in subset:
+                output = os.path.join(f[:-4] + '.json')
+                with open(os.path.join(tmpdir, 'single', output), 'rb') as infile, open(os.path.join(merged_dir, output), 'rb') as other:
+                    self.assertEqual(infile.read(), other.read())
+            for name in ('.manifest.json', '.sensekeys.json'):
+                with open(os.path.join(tmpdir, 'single', name)) as infile, open(os.path.join(merged_dir, name)) as other:
+                    self.assertEqual(json.load(infile), json.load(other))
+            self.assertEqual(read_sensekeys(os.path.join(merged_dir, '.sensekeys.json'))['say%2:32:00::'], '01009843-v')
+            # SQLite shards
+            loader = BulkLoader(os.path.join(tmpdir, 'merged.db'))
+            loader.merge([os.path.join(tmpdir, 'shard2.db'), os.path.join(tmpdir, 'shard1.db')], order=[(f, f[:6]) for f in subset])
+            self.assertEqual(loader.counts['document'], 4)
+            single_db, merged_db = sqlite3.connect(os.path.join(tmpdir, 'single.db')), sqlite3.connect(os.path.join(tmpdir, 'merged.db'))
+            for table in ('corpus', 'document', 'sentence', 'token', 'concept', 'tag', 'cwl'):
+                query = 'SELECT * FROM {} ORDER BY 1, 2, 3'.format(table)
+                self.assertEqual(merged_db.execute(query).fetchall(), single_db.execute(query).fetchall())
+            single_db.close()
+            merged_db.close()
+            # statistics counters
+            merged = StatsEngine(CorpusSize(), PosSenses(), RdfValues())
+            merged.load(os.path.join(tmpdir, 'shard1.stats.json'))
+            merged.load(os.path.join(tmpdir, 'shard2.stats.json'))
+            self.assertEqual(merged.files, single.files)
+            for a, b in zip(merged.aggregators, single.aggregators):
+                self.assertEqual(vars(a), vars(b))
+            self.assertEqual(merged.aggregators[1].by_pos(), single.aggregators[1].by_pos())
+            self.assertRaises(ValueError, StatsEngine(CorpusSize()).load, os.path.join(tmpdir, 'shard1.stats.json'))
+
+    def test_query_index(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for f in ('brown1/tagfiles/br-a01', 'brown2/tagfiles/br-e30'):
+                os.makedirs(os.path.join(tmpdir, os.path.dirname(f)), exist_ok=True)
+                shutil.copy(os.path.join(SEMCOR_ORIG, f), os.path.join(tmpdir, f))
+            sc = SemcorXML(tmpdir, raw=True)
+            with self.wn.ctx() as wnctx:
+                index = query_index(sc, resolver=SenseKeyResolver(wnctx))
+            self.assertTrue(index.is_fresh(sc))
+            tokens = [(s['sid'], idx, t) for f in sc.files for s in sc.iterparse(f) for idx, t in enumerate(s['tokens'])]
+
+            def expected(pred):
+                return sorted(((sid, idx) for sid, idx, t in tokens if pred(t)), key=lambda x: (sids.index(x[0]), x[1]))
+            sids = list(dict.fromkeys(sid for sid, idx, t in tokens))
+            self.assertEqual(index.find(sk='say%2:32:00::'), expected(lambda t: t.get('sk') == 'say%2:32:00::'))
+            self.assertTrue(index.find(sk='say%2:32:00::'))
+            self.assertEqual(index.find(synset='01009843-v'), index.find(sk='say%2:32:00::'))
+            self.assertEqual(index.find(lemma='be', pos='VB'), expected(lambda t: t.get('lemma') == 'be' and t.get('pos') == 'VB'))
+            self.assertEqual(index.count(lemma='be', pos='VB'), len(expected(lambda t: t.get('lemma') == 'be' and t.get('pos') == 'VB')))
+            self.assertEqual(index.count(pos='NN'), len(expected(lambda t: t.get('pos') == 'NN')))
+            self.assertEqual(index.find(lemma='be', pos='VB', limit=2), index.find(lemma='be', pos='VB')[:2])
+            self.assertEqual(index.find(lemma='be', pos='no-such-pos'), [])
+            say_senses = Counter(t.get('sk') for sid, idx, t in tokens if t.get('sk', '').startswith('say%'))
+            self.assertEqual(dict(index.values('sk', 'say%')), say_senses)
+            self.assertEqual(index.values('sk', 'say%')[0][1], max(say_senses.values()))
+            self.assertRaises(ValueError, lambda: index.find(text='the'))
+            # the index is rebuilt when a file changes
+            index.close()
+            with open(os.path.join(tmpdir, 'brown1/tagfiles/br-a01'), 'a') as outfile:
+                outfile.write('\n')
+            self.assertFalse(QueryIndex(index.path).is_fresh(sc))
+            index = query_index(sc)
+            self.assertTrue(index.is_fresh(sc))
+            # an index without synsetIDs cannot answer synset queries, and is rebuilt when they are needed
+            self.assertFalse(index.has_synsets())
+            self.assertFalse(index.is_fresh(sc, synsets=True))
+            self.assertRaises(ValueError, lambda: index.find(synset='01009843-v'))
+            self.assertRaises(ValueError, lambda: index.count(synset='01009843-v', pos='VB'))
+            index.close()
+            with self.wn.ctx() as wnctx:
+                index = query_index(sc, resolver=SenseKeyResolver(wnctx))
+            self.assertTrue(index.has_synsets())
+            self.assertEqual(index.find(synset='01009843-v'), index.find(sk='say%2:32:00::'))
+            index.close()
+            os.unlink(index.path)
+
+
+# Startup budget: cumulative import time (in microseconds, as reported by python -X importtime)
+IMPORT_BUDGET = 100000
+CLI_BUDGET = 150000
+# modules that must not be loaded before they are needed
+HEAVY_MODULES = ('lxml', 'bs4', 'chirptext', 'texttaglib', 'yawlib', 'multiprocessing')
+
+
+def import_profile(*args):
+    ''' Run python -X importtime with args, return the total import time (us) and the set of imported modules '''
+    proc = subprocess.run([sys.executable, '-X', 'importtime'] + list(args), cwd=PROJECT_ROOT,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    total = 0
+    modules = set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules.add(name.strip())
+        if not name.startswith('  '):
+            # top-level import
+            total += int(cumulative)
+    return total, modules
+
+
+class TestStartup(unittest.TestCase):
+
+    def check_budget(self, budget, *args):
+        total, modules = import_profile(*args)
+        self.assertFalse([m for m in HEAVY_MODULES if m in modules])
+        logger.debug("Startup time of {}: {}ms".format(args, total / 1000))
+        self.assertLess(total, budget)
+
+    def test_import(self):
+        self.check_budget(IMPORT_BUDGET, '-c', 'import pysemcor')
+
+    def test_cli(self):
+        self.check_budget(CLI_BUDGET, 'main.py', '--help')
+        spec = importlib.util.spec_from_file_location('pysemcor_main', os.path.join(PROJECT_ROOT, 'main.py'))
+        cli = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(cli)
+        tasks = next(action.choices for action in cli.build_parser()._actions if isinstance(action, argparse._SubParsersAction))
+        self.assertIn('merge', tasks)
+        for task in tasks:
+            self.check_budget(CLI_BUDGET, 'main.py', task, '--help')
+
+
 # -------------------------------------------------------------------------------
 # Main method
 # -------------------------------------------------------------------------------